@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the payload codecs on representative sensor messages.
+Measures encoded size and decode + schema validation throughput, the work on_message does per message.
+
+    python benchmarks/codec_benchmark.py [--number 200000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python_app"))
+
+from Codecs import CODECS, JsonCodec, validate_reading
+
+PAYLOADS = {
+    "temperature": {"sensor_id": "temp_kitchen_001", "type": "temperature", "value": 22.5, "timestamp": 1718000000.123},
+    "water_leak": {"sensor_id": "water_leak_001", "type": "water_leak", "value": True, "timestamp": 1718000000.123},
+    "structural": {"sensor_id": "struct_basement_001", "type": "structural_stress",
+                   "value": {"level": "medium", "vibration_hz": 5.2}, "timestamp": 1718000000.123},
+}
+
+
+def legacy_decode(payload):
+    # what on_message did before the codec layer: bytes -> str -> stdlib json + key lookups
+    sensor_data = json.loads(payload.decode("utf-8"))
+    return all(k in sensor_data for k in ["sensor_id", "type", "value", "timestamp"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=200000, help="decodes per measurement")
+    args = parser.parse_args()
+
+    codecs = dict(CODECS)
+    codecs["json-stdlib"] = JsonCodec(use_orjson=False)
+
+    print(f"{'payload':<12} {'codec':<12} {'bytes':>6} {'decode+validate/s':>18}")
+    for payload_name, reading in PAYLOADS.items():
+        encoded = CODECS["json"].encode(reading)
+        seconds = timeit.timeit(lambda: legacy_decode(encoded), number=args.number)
+        print(f"{payload_name:<12} {'legacy':<12} {len(encoded):>6} {args.number / seconds:>18,.0f}")
+        for codec_name, codec in codecs.items():
+            encoded = codec.encode(reading)
+            assert validate_reading(codec.decode(encoded))
+            seconds = timeit.timeit(lambda: validate_reading(codec.decode(encoded)), number=args.number)
+            print(f"{payload_name:<12} {codec_name:<12} {len(encoded):>6} {args.number / seconds:>18,.0f}")
+
+
+if __name__ == "__main__":
+    main()
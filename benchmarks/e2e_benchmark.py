@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark: starts the stand-in broker and Subscriber.py with the in-memory stores, drives
+load through them and reports publish-to-store latency percentiles and sustained throughput.
+Nothing outside this machine is needed. --subscriber AsyncSubscriber.py runs the asyncio entry point
+under the same load.
+
+    python benchmarks/e2e_benchmark.py --rate 2000 --duration 20 --burst-every 5 --burst-size 200
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from load_generator import add_arguments, generate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_line(path, needle, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{path} exited early with code {process.returncode}")
+        if os.path.exists(path):
+            with open(path, errors="replace") as f:
+                if needle in f.read():
+                    return
+        time.sleep(0.1)
+    raise TimeoutError(f"'{needle}' not seen in {path} after {timeout}s")
+
+
+def summarize(name, stats, sent):
+    line = f"{name:>8}: {stats['count']:>8} writes"
+    if stats["first_at"] is not None and stats["last_at"] > stats["first_at"]:
+        line += f", {stats['count'] / (stats['last_at'] - stats['first_at']):>8.0f}/s sustained"
+    latencies = np.asarray(stats["latencies"]) * 1000.0
+    if latencies.size:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        line += f", latency ms p50={p50:.1f} p90={p90:.1f} p99={p99:.1f} max={latencies.max():.1f}"
+    if name in ("mysql", "mongo", "neo4j") and sent:
+        line += f", delivered {100.0 * stats['count'] / sent:.1f}%"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Subscriber.py against in-memory stores and measure latency.")
+    add_arguments(parser)
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="seconds to wait for the subscriber to exit")
+    parser.add_argument("--subscriber", default="Subscriber.py", choices=["Subscriber.py", "AsyncSubscriber.py"],
+                        help="entry point to benchmark")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory with logs and stats")
+    args = parser.parse_args()
+    args.host = "127.0.0.1"
+    args.port = free_port()
+
+    workdir = tempfile.mkdtemp(prefix="e2e_benchmark_")
+    stats_path = os.path.join(workdir, "stats.json")
+    env = dict(
+        os.environ,
+        STORAGE_BACKEND="memory",
+        MEMORY_STATS_PATH=stats_path,
+        MQTT_BROKER_HOST=args.host,
+        MQTT_BROKER_PORT=str(args.port),
+        SPOOL_DIR=os.path.join(workdir, "spool"),
+        PIPELINE_SPILL_DIR=os.path.join(workdir, "spool", "pipeline"),
+        SENSOR_STATE_SNAPSHOT_PATH=os.path.join(workdir, "state", "sensor_state.json"),
+        PYTHONUNBUFFERED="1",
+    )
+
+    broker_log = open(os.path.join(workdir, "broker.log"), "w")
+    subscriber_log_path = os.path.join(workdir, "subscriber.log")
+    subscriber_log = open(subscriber_log_path, "w")
+    broker = subprocess.Popen([sys.executable, os.path.join(HERE, "mini_broker.py"), "--port", str(args.port)],
+                              stdout=broker_log, stderr=subprocess.STDOUT, env=env)
+    subscriber = None
+    try:
+        wait_for_line(broker_log.name, "listening", broker, 10)
+        subscriber = subprocess.Popen([sys.executable, args.subscriber], cwd=os.path.join(ROOT, "python_app"),
+                                      stdout=subscriber_log, stderr=subprocess.STDOUT, env=env)
+        wait_for_line(subscriber_log_path, "Subscribed to topic", subscriber, 30)
+
+        sent, elapsed = generate(args)
+
+        # SIGINT makes the subscriber drain its pipeline and write the store stats
+        subscriber.send_signal(signal.SIGINT)
+        subscriber.wait(timeout=args.drain_timeout)
+    finally:
+        if subscriber is not None and subscriber.poll() is None:
+            subscriber.kill()
+        broker.send_signal(signal.SIGINT)
+        broker.wait(timeout=5)
+        broker_log.close()
+        subscriber_log.close()
+
+    if not os.path.exists(stats_path):
+        print(f"No stats written; see {subscriber_log_path}")
+        sys.exit(1)
+    with open(stats_path) as f:
+        stats = json.load(f)
+    print(f"Published {sent} messages in {elapsed:.2f}s ({sent / elapsed:.0f}/s offered)")
+    for name in ("mysql", "mongo", "neo4j", "claims"):
+        if name in stats:
+            summarize(name, stats[name], sent)
+    if args.keep:
+        print(f"Logs and stats kept in {workdir}")
+    else:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+High-rate sensor load generator. Readings from many simulated sensors are spread over a small pool
+of persistent MQTT connections and paced to a target rate, with optional alert bursts. Every
+payload carries `_sent_at` (epoch seconds at publish) so the subscriber side can measure latency.
+
+    python benchmarks/load_generator.py --rate 2000 --duration 30 --sensors 500 --locations 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python_app"))
+
+from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_TOPIC_ROOT
+from Codecs import CODECS
+
+# sensor type -> (share of sensors, normal value, alert value)
+SENSOR_TYPES = {
+    "temperature": (0.4, lambda: round(random.uniform(18.0, 26.0), 1), lambda: round(random.uniform(60.0, 120.0), 1)),
+    "humidity": (0.2, lambda: round(random.uniform(35.0, 70.0), 1), lambda: round(random.uniform(85.0, 99.0), 1)),
+    "door_contact": (0.15, lambda: random.random() < 0.1, lambda: True),
+    "water_leak": (0.1, lambda: False, lambda: True),
+    "smoke_detector": (0.1, lambda: False, lambda: True),
+    "structural_stress": (0.05, lambda: {"level": "low", "vibration_hz": round(random.uniform(0.5, 2.0), 1)},
+                          lambda: {"level": random.choice(("medium", "high")), "vibration_hz": round(random.uniform(5.0, 9.0), 1)}),
+}
+ALERT_TYPES = ("water_leak", "smoke_detector", "structural_stress")
+
+
+def parse_mix(spec):
+    """
+    Parse "temperature=0.5,water_leak=0.2" into sensor type weights; unknown types are ignored.
+    """
+    if not spec:
+        return {name: share for name, (share, _, _) in SENSOR_TYPES.items()}
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() in SENSOR_TYPES:
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def build_sensors(count, locations, mix, rng):
+    names, weights = zip(*mix.items())
+    sensors = []
+    for i in range(count):
+        sensor_type = rng.choices(names, weights)[0]
+        location = f"location_{i % locations:04d}"
+        sensor_id = f"{sensor_type}_{i:06d}"
+        sensors.append((f"{MQTT_TOPIC_ROOT}/{location}/{sensor_id}/sensor", sensor_id, sensor_type))
+    return sensors
+
+
+class LoadGenerator:
+    def __init__(self, host, port, connections=4, codec="json", qos=0):
+        self.codec = CODECS[codec]
+        self.qos = qos
+        self.clients = []
+        for i in range(connections):
+            client = mqtt.Client(client_id=f"loadgen-{os.getpid()}-{i}", protocol=mqtt.MQTTv311)
+            client.max_queued_messages_set(0)
+            client.connect(host, port, 60)
+            client.loop_start()
+            self.clients.append(client)
+        self.sent = 0
+
+    def publish(self, topic, sensor_id, sensor_type, value):
+        now = time.time()
+        payload = {"sensor_id": sensor_id, "type": sensor_type, "value": value, "timestamp": now, "_sent_at": now}
+        # a sensor always goes through the same connection so its readings stay ordered
+        client = self.clients[hash(sensor_id) % len(self.clients)]
+        client.publish(topic, self.codec.encode(payload), qos=self.qos)
+        self.sent += 1
+
+    def run(self, sensors, rate, duration, burst_every=0.0, burst_size=0, report_interval=5.0):
+        """
+        Publish at `rate` messages/second for `duration` seconds. Every `burst_every` seconds an extra
+        `burst_size` alert readings from alert-capable sensors are sent back to back.
+        """
+        alert_sensors = [s for s in sensors if s[2] in ALERT_TYPES] or sensors
+        start = time.perf_counter()
+        next_burst = start + burst_every if burst_every else None
+        next_report = start + report_interval
+        interval = 1.0 / rate
+        i = 0
+        while True:
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+            # catch up in a tight loop when behind schedule, otherwise sleep until the next slot
+            due = int((now - start) * rate) + 1
+            while i < due:
+                topic, sensor_id, sensor_type = sensors[i % len(sensors)]
+                self.publish(topic, sensor_id, sensor_type, SENSOR_TYPES[sensor_type][1]())
+                i += 1
+            if next_burst is not None and now >= next_burst:
+                for _ in range(burst_size):
+                    topic, sensor_id, sensor_type = random.choice(alert_sensors)
+                    self.publish(topic, sensor_id, sensor_type, SENSOR_TYPES[sensor_type][2]())
+                next_burst += burst_every
+            if now >= next_report:
+                print(f"[LOADGEN] sent={self.sent} rate={self.sent / (now - start):.0f}/s", flush=True)
+                next_report += report_interval
+            time.sleep(max(0.0, start + i * interval - time.perf_counter()))
+        elapsed = time.perf_counter() - start
+        return self.sent, elapsed
+
+    def close(self):
+        for client in self.clients:
+            client.disconnect()
+            client.loop_stop()
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default=MQTT_BROKER_HOST)
+    parser.add_argument("--port", type=int, default=MQTT_BROKER_PORT)
+    parser.add_argument("--rate", type=float, default=1000.0, help="messages per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--sensors", type=int, default=200)
+    parser.add_argument("--locations", type=int, default=20)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--mix", default="", help="sensor type weights, e.g. temperature=0.6,water_leak=0.4")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="seconds between alert bursts (0: none)")
+    parser.add_argument("--burst-size", type=int, default=100)
+    parser.add_argument("--codec", default="json", choices=sorted(CODECS))
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1))
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    sensors = build_sensors(args.sensors, args.locations, parse_mix(args.mix), rng)
+    generator = LoadGenerator(args.host, args.port, args.connections, args.codec, args.qos)
+    try:
+        sent, elapsed = generator.run(sensors, args.rate, args.duration, args.burst_every, args.burst_size)
+    finally:
+        generator.close()
+    print(f"[LOADGEN] done: sent {sent} messages in {elapsed:.2f}s ({sent / elapsed:.0f}/s)", flush=True)
+    return sent, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish simulated sensor readings at a fixed rate.")
+    add_arguments(parser)
+    generate(parser.parse_args())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Minimal MQTT 3.1.1 broker used as a local mosquitto stand-in for benchmarks.
+Supports CONNECT, SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, PUBLISH at QoS 0/1/2 from clients
+(delivered to subscribers at QoS 0), PINGREQ and DISCONNECT. No retained messages, sessions or auth.
+
+    python benchmarks/mini_broker.py --port 1884
+"""
+import argparse
+import asyncio
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python_app"))
+
+from Codecs import topic_matches
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def encode_length(length):
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + encode_length(len(body)) + body
+
+
+def read_string(data, offset):
+    (length,) = struct.unpack_from("!H", data, offset)
+    return data[offset + 2:offset + 2 + length].decode("utf-8"), offset + 2 + length
+
+
+class Broker:
+    def __init__(self):
+        # writer -> set of topic filters
+        self.subscriptions = {}
+        self.topic_cache = {}
+        self.published = 0
+
+    def subscribers_for(self, topic):
+        writers = self.topic_cache.get(topic)
+        if writers is None:
+            writers = [w for w, filters in self.subscriptions.items() if any(topic_matches(f, topic) for f in filters)]
+            self.topic_cache[topic] = writers
+        return writers
+
+    async def publish(self, topic, payload):
+        self.published += 1
+        encoded_topic = topic.encode("utf-8")
+        message = packet(PUBLISH, 0, struct.pack("!H", len(encoded_topic)) + encoded_topic + payload)
+        for writer in self.subscribers_for(topic):
+            writer.write(message)
+            if writer.transport.get_write_buffer_size() > 1 << 20:
+                await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.subscriptions[writer] = set()
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                multiplier, length = 1, 0
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                packet_type, flags = header[0] >> 4, header[0] & 0x0F
+
+                if packet_type == CONNECT:
+                    writer.write(packet(CONNACK, 0, b"\x00\x00"))
+                elif packet_type == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+                    topic, offset = read_string(body, 0)
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        writer.write(packet(PUBACK if qos == 1 else PUBREC, 0, packet_id))
+                    await self.publish(topic, body[offset:])
+                elif packet_type == PUBREL:
+                    writer.write(packet(PUBCOMP, 0, body[:2]))
+                elif packet_type == SUBSCRIBE:
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        topic_filter, offset = read_string(body, offset)
+                        offset += 1
+                        self.subscriptions[writer].add(topic_filter)
+                        granted.append(0)
+                    self.topic_cache.clear()
+                    writer.write(packet(SUBACK, 0, packet_id + bytes(granted)))
+                elif packet_type == UNSUBSCRIBE:
+                    packet_id, offset = body[:2], 2
+                    while offset < len(body):
+                        topic_filter, offset = read_string(body, offset)
+                        self.subscriptions[writer].discard(topic_filter)
+                    self.topic_cache.clear()
+                    writer.write(packet(UNSUBACK, 0, packet_id))
+                elif packet_type == PINGREQ:
+                    writer.write(packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.subscriptions[writer]
+            self.topic_cache.clear()
+            writer.close()
+
+
+async def serve(host, port):
+    broker = Broker()
+    server = await asyncio.start_server(broker.handle, host, port)
+    print(f"mini broker listening on {host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal MQTT 3.1.1 broker for local benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1884)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: launches Subscriber.py against the stand-in broker and the in-memory stores and
+measures, per run, the time from process start to the MQTT subscription and to /ready answering 200.
+--init-delay makes each stand-in store take that many seconds to initialize, which shows that a slow
+store no longer delays the subscription and that the stores come up in parallel (ready after about
+one delay, not three).
+
+    python benchmarks/startup_benchmark.py --runs 5 --init-delay 2
+"""
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from e2e_benchmark import HERE, ROOT, free_port, wait_for_line
+
+
+def wait_for_ready(url, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"subscriber exited early with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def run_once(args, workdir, index):
+    metrics_port = free_port()
+    env = dict(
+        os.environ,
+        STORAGE_BACKEND="memory",
+        MEMORY_INIT_DELAY=str(args.init_delay),
+        MEMORY_STATS_PATH=os.path.join(workdir, f"stats.{index}.json"),
+        MQTT_BROKER_HOST="127.0.0.1",
+        MQTT_BROKER_PORT=str(args.port),
+        METRICS_PORT=str(metrics_port),
+        LIVE_STATE_PORT="0",
+        SPOOL_DIR=os.path.join(workdir, "spool"),
+        PIPELINE_SPILL_DIR=os.path.join(workdir, "spool", "pipeline"),
+        SENSOR_STATE_SNAPSHOT_PATH=os.path.join(workdir, "state", "sensor_state.json"),
+        PYTHONUNBUFFERED="1",
+    )
+    log_path = os.path.join(workdir, f"subscriber.{index}.log")
+    with open(log_path, "w") as log:
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, args.subscriber], cwd=os.path.join(ROOT, "python_app"),
+                                   stdout=log, stderr=subprocess.STDOUT, env=env)
+        try:
+            wait_for_line(log_path, "Subscribed to topic", process, args.timeout)
+            subscribed = time.perf_counter() - started
+            wait_for_ready(f"http://127.0.0.1:{metrics_port}/ready", process, args.timeout)
+            ready = time.perf_counter() - started
+            process.send_signal(signal.SIGINT)
+            process.wait(timeout=args.timeout)
+        finally:
+            if process.poll() is None:
+                process.kill()
+    return subscribed, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure subscriber startup time against in-memory stores.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--init-delay", type=float, default=0.0, help="seconds each in-memory store takes to initialize")
+    parser.add_argument("--subscriber", default="Subscriber.py", choices=["Subscriber.py", "AsyncSubscriber.py"],
+                        help="entry point to benchmark")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--keep", action="store_true", help="keep the working directory with logs")
+    args = parser.parse_args()
+    args.port = free_port()
+
+    workdir = tempfile.mkdtemp(prefix="startup_benchmark_")
+    broker_log = open(os.path.join(workdir, "broker.log"), "w")
+    broker = subprocess.Popen([sys.executable, os.path.join(HERE, "mini_broker.py"), "--port", str(args.port)],
+                              stdout=broker_log, stderr=subprocess.STDOUT)
+    results = []
+    try:
+        wait_for_line(broker_log.name, "listening", broker, 10)
+        for index in range(args.runs):
+            results.append(run_once(args, workdir, index))
+            print(f"run {index + 1}: subscribed after {results[-1][0] * 1000:.0f} ms, "
+                  f"ready after {results[-1][1] * 1000:.0f} ms")
+    finally:
+        broker.send_signal(signal.SIGINT)
+        broker.wait(timeout=5)
+        broker_log.close()
+
+    subscribed, ready = np.asarray(results).T * 1000.0
+    print(f"{args.subscriber}, store init delay {args.init_delay:.1f}s, {args.runs} runs")
+    print(f"  subscribed: median {np.median(subscribed):.0f} ms, min {subscribed.min():.0f}, max {subscribed.max():.0f}")
+    print(f"  ready:      median {np.median(ready):.0f} ms, min {ready.min():.0f}, max {ready.max():.0f}")
+    if args.keep:
+        print(f"Logs kept in {workdir}")
+    else:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
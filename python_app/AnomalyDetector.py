@@ -0,0 +1,299 @@
+import math
+import threading
+
+import numpy as np
+
+# anomaly kinds, combined as bit flags
+ANOMALY_ZSCORE = 1
+ANOMALY_EWMA = 2
+ANOMALY_RATE = 4
+ANOMALY_RANGE = 8
+ANOMALY_KINDS = {ANOMALY_ZSCORE: "zscore", ANOMALY_EWMA: "ewma", ANOMALY_RATE: "rate", ANOMALY_RANGE: "range"}
+
+
+def anomaly_kinds(flags):
+    return [name for bit, name in ANOMALY_KINDS.items() if flags & bit]
+
+
+class AnomalyRule:
+    """
+    Thresholds for one numeric sensor type: |z-score| above `z` against the rolling window or the EWMA
+    (with standard deviations below `min_std` raised to it, so a flat series does not turn every small
+    change into an outlier), a move away from the EWMA faster than `rate` units per second, or a value
+    outside [minimum, maximum]. Unset thresholds never trigger.
+    """
+    __slots__ = ("z", "rate", "minimum", "maximum", "min_std")
+
+    def __init__(self, z=math.inf, rate=math.inf, minimum=-math.inf, maximum=math.inf, min_std=0.0):
+        self.z = z
+        self.rate = rate
+        self.minimum = minimum
+        self.maximum = maximum
+        self.min_std = min_std
+
+
+def parse_anomaly_rules(spec):
+    """
+    Parse "temperature:z=4,rate=0.2,max=70;humidity:z=4,min=0,max=100" into a dict of sensor type ->
+    AnomalyRule. Keys are z, rate, min, max and std (the min_std floor).
+    """
+    names = {"z": "z", "rate": "rate", "min": "minimum", "max": "maximum", "std": "min_std"}
+    rules = {}
+    for item in (spec or "").split(";"):
+        sensor_type, _, params = item.partition(":")
+        sensor_type = sensor_type.strip()
+        if not sensor_type:
+            continue
+        thresholds = {}
+        for param in params.split(","):
+            key, _, value = param.partition("=")
+            if key.strip():
+                if key.strip() not in names:
+                    raise ValueError(f"Unknown anomaly threshold {key.strip()} for {sensor_type}")
+                thresholds[names[key.strip()]] = float(value)
+        rules[sensor_type] = AnomalyRule(**thresholds)
+    return rules
+
+
+class AnomalyDetector:
+    """
+    Streaming outlier detection for numeric readings of the sensor types in `rules`. Every tracked
+    sensor owns one slot in a set of NumPy arrays: a ring buffer of its last `window` values (float32)
+    with their running sum and sum of squares for the rolling z-score, an exponentially weighted mean
+    and variance (weight `alpha` for the newest value), and the timestamp of its last reading. The rate
+    of change is a reading's distance from the EWMA divided by the time since the sensor's previous
+    reading, but never by less than `rate_span` seconds, so the jitter of a sensor reporting every
+    second does not read as a steep slope while a real climb still does. That is a fixed
+    4 * window + 64 bytes of array space per sensor, plus its entry in the sensor id index; once
+    `max_sensors` are tracked, the least recently updated one gives up its slot.
+    z-scores only count once `min_samples` values are known. Each reading is scored against the state
+    before it, then folded in.
+
+    observe() handles one reading in a few microseconds; observe_batch() updates a micro-batch with
+    array operations, one round per repeat of the same sensor within the batch.
+    """
+
+    def __init__(self, rules, window=32, alpha=0.1, rate_span=60.0, min_samples=16, max_sensors=500000,
+                 initial_capacity=1024):
+        self.rules = dict(rules)
+        self.window = window
+        self.alpha = alpha
+        self.rate_span = rate_span
+        self.min_samples = min_samples
+        self.max_sensors = max_sensors
+        self.evicted = 0
+        self._type_codes = {sensor_type: code for code, sensor_type in enumerate(self.rules)}
+        rules = list(self.rules.values())
+        self._z = np.array([r.z for r in rules], dtype=np.float64)
+        self._rate = np.array([r.rate for r in rules], dtype=np.float64)
+        self._minimum = np.array([r.minimum for r in rules], dtype=np.float64)
+        self._maximum = np.array([r.maximum for r in rules], dtype=np.float64)
+        # a floor of 0 still avoids dividing by zero
+        self._min_std = np.maximum(np.array([r.min_std for r in rules], dtype=np.float64), 1e-9)
+        self._slots = {}
+        self._sensor_ids = []
+        self._tick = 0
+        self._lock = threading.Lock()
+        self._allocate(min(initial_capacity, max_sensors))
+
+    def _allocate(self, capacity):
+        """
+        Grow every per-sensor array to capacity slots, keeping the existing ones.
+        """
+        def grow(array, shape, dtype):
+            grown = np.zeros(shape, dtype=dtype)
+            if array is not None:
+                grown[:len(array)] = array
+            return grown
+        existing = getattr(self, "_ring", None)
+        keep = (lambda name: getattr(self, name)) if existing is not None else (lambda name: None)
+        self._ring = grow(existing, (capacity, self.window), np.float32)
+        self._head = grow(keep("_head"), capacity, np.int32)
+        self._fill = grow(keep("_fill"), capacity, np.int32)
+        self._sum = grow(keep("_sum"), capacity, np.float64)
+        self._sumsq = grow(keep("_sumsq"), capacity, np.float64)
+        self._ewm = grow(keep("_ewm"), capacity, np.float64)
+        self._ewv = grow(keep("_ewv"), capacity, np.float64)
+        self._last_t = grow(keep("_last_t"), capacity, np.float64)
+        self._count = grow(keep("_count"), capacity, np.int64)
+        # update order, for picking the slot to give up once max_sensors are tracked
+        self._touched = grow(keep("_touched"), capacity, np.int64)
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in (
+            "_ring", "_head", "_fill", "_sum", "_sumsq", "_ewm", "_ewv", "_last_t", "_count", "_touched"))
+
+    def _slot(self, sensor_id):
+        """
+        The slot of a sensor, assigning a cleared one to a sensor seen for the first time.
+        """
+        self._tick += 1
+        slot = self._slots.get(sensor_id)
+        if slot is None:
+            if len(self._sensor_ids) < len(self._ring):
+                slot = len(self._sensor_ids)
+                self._sensor_ids.append(sensor_id)
+            elif len(self._ring) < self.max_sensors:
+                self._allocate(min(len(self._ring) * 2, self.max_sensors))
+                slot = len(self._sensor_ids)
+                self._sensor_ids.append(sensor_id)
+            else:
+                slot = int(np.argmin(self._touched))
+                del self._slots[self._sensor_ids[slot]]
+                self._sensor_ids[slot] = sensor_id
+                self.evicted += 1
+            self._slots[sensor_id] = slot
+            self._head[slot] = self._fill[slot] = self._count[slot] = 0
+            self._sum[slot] = self._sumsq[slot] = self._ewm[slot] = self._ewv[slot] = 0.0
+        self._touched[slot] = self._tick
+        return slot
+
+    def observe(self, sensor_id, sensor_type, value, timestamp):
+        """
+        Score one reading and fold it into its sensor's state. Returns the ANOMALY_* flags it raised,
+        0 for a normal reading or one that is not tracked (non-numeric, or a type without a rule).
+        """
+        code = self._type_codes.get(sensor_type)
+        if code is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return 0
+        x = float(value)
+        t = float(timestamp)
+        with self._lock:
+            slot = self._slot(sensor_id)
+            count = int(self._count[slot])
+            flags = 0
+            if not self._minimum[code] <= x <= self._maximum[code]:
+                flags |= ANOMALY_RANGE
+            ewm = float(self._ewm[slot])
+            if count:
+                span = max(t - float(self._last_t[slot]), self.rate_span)
+                if span > 0 and abs(x - ewm) / span > self._rate[code]:
+                    flags |= ANOMALY_RATE
+            if count >= self.min_samples:
+                z = float(self._z[code])
+                min_std = float(self._min_std[code])
+                fill = max(int(self._fill[slot]), 1)
+                mean = float(self._sum[slot]) / fill
+                std = max(math.sqrt(max(float(self._sumsq[slot]) / fill - mean * mean, 0.0)), min_std)
+                if abs(x - mean) / std > z:
+                    flags |= ANOMALY_ZSCORE
+                # the variance starts from 0; scale it up by the weight its count-1 updates have had so far
+                ewv = float(self._ewv[slot]) / (1.0 - (1.0 - self.alpha) ** max(count - 1, 1))
+                if abs(x - ewm) / max(math.sqrt(ewv), min_std) > z:
+                    flags |= ANOMALY_EWMA
+
+            # ring buffer and running sums; recomputed from the buffer on every wrap so rounding never builds up
+            stored = np.float32(x)
+            head = int(self._head[slot])
+            ring = self._ring[slot]
+            if self._fill[slot] == self.window:
+                old = float(ring[head])
+                self._sum[slot] -= old
+                self._sumsq[slot] -= old * old
+            else:
+                self._fill[slot] += 1
+            ring[head] = stored
+            head = (head + 1) % self.window
+            self._head[slot] = head
+            if head == 0:
+                self._sum[slot] = float(ring.sum(dtype=np.float64))
+                self._sumsq[slot] = float(np.dot(ring.astype(np.float64), ring))
+            else:
+                self._sum[slot] += float(stored)
+                self._sumsq[slot] += float(stored) * float(stored)
+
+            if count:
+                diff = x - ewm
+                increment = self.alpha * diff
+                self._ewm[slot] += increment
+                self._ewv[slot] = (1.0 - self.alpha) * (float(self._ewv[slot]) + diff * increment)
+            else:
+                self._ewm[slot] = x
+            self._last_t[slot] = t
+            self._count[slot] = count + 1
+            return flags
+
+    def observe_batch(self, sensor_ids, sensor_types, values, timestamps):
+        """
+        Batch counterpart of observe() over equal-length sequences; readings of one sensor are folded in
+        the order given. Returns a uint8 array of ANOMALY_* flags, 0 for normal or untracked readings.
+        """
+        n = len(sensor_ids)
+        flags = np.zeros(n, dtype=np.uint8)
+        codes = np.fromiter((self._type_codes.get(t, -1) for t in sensor_types), dtype=np.int64, count=n)
+        numeric = np.fromiter((isinstance(v, (int, float)) and not isinstance(v, bool) for v in values),
+                              dtype=bool, count=n)
+        rows = np.flatnonzero((codes >= 0) & numeric)
+        if not rows.size:
+            return flags
+        x = np.array([values[i] for i in rows], dtype=np.float64)
+        t = np.array([timestamps[i] for i in rows], dtype=np.float64)
+        codes = codes[rows]
+        with self._lock:
+            slots = np.fromiter((self._slot(sensor_ids[i]) for i in rows), dtype=np.int64, count=rows.size)
+            # occurrence rank of every row among the rows of its sensor: round r updates each sensor's r-th reading
+            order = np.argsort(slots, kind="stable")
+            ordered = slots[order]
+            starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+            rank = np.empty(rows.size, dtype=np.int64)
+            rank[order] = np.arange(rows.size) - np.repeat(starts, np.diff(np.r_[starts, rows.size]))
+            for r in range(int(rank.max()) + 1):
+                step = np.flatnonzero(rank == r)
+                flags[rows[step]] = self._observe_step(slots[step], codes[step], x[step], t[step])
+        return flags
+
+    def _observe_step(self, s, codes, x, t):
+        """
+        observe() for readings of distinct slots s, as array operations.
+        """
+        count = self._count[s]
+        flags = np.zeros(len(s), dtype=np.uint8)
+        flags[(x < self._minimum[codes]) | (x > self._maximum[codes])] |= ANOMALY_RANGE
+
+        ewm = self._ewm[s]
+        span = np.maximum(t - self._last_t[s], self.rate_span)
+        moving = (count > 0) & (span > 0)
+        rate = np.zeros(len(s))
+        rate[moving] = np.abs(x[moving] - ewm[moving]) / span[moving]
+        flags[moving & (rate > self._rate[codes])] |= ANOMALY_RATE
+
+        scored = count >= self.min_samples
+        z = self._z[codes]
+        min_std = self._min_std[codes]
+        fill = np.maximum(self._fill[s], 1)
+        mean = self._sum[s] / fill
+        std = np.maximum(np.sqrt(np.maximum(self._sumsq[s] / fill - mean * mean, 0.0)), min_std)
+        flags[scored & (np.abs(x - mean) / std > z)] |= ANOMALY_ZSCORE
+        ewv = self._ewv[s] / np.where(scored, 1.0 - (1.0 - self.alpha) ** np.maximum(count - 1, 1), 1.0)
+        flags[scored & (np.abs(x - ewm) / np.maximum(np.sqrt(ewv), min_std) > z)] |= ANOMALY_EWMA
+
+        stored = x.astype(np.float32)
+        head = self._head[s]
+        full = self._fill[s] == self.window
+        old = self._ring[s, head].astype(np.float64)
+        self._sum[s] -= np.where(full, old, 0.0)
+        self._sumsq[s] -= np.where(full, old * old, 0.0)
+        self._fill[s] += ~full
+        self._ring[s, head] = stored
+        head = (head + 1) % self.window
+        self._head[s] = head
+        self._sum[s] += stored
+        self._sumsq[s] += stored.astype(np.float64) ** 2
+        wrapped = s[head == 0]
+        if wrapped.size:
+            ring = self._ring[wrapped].astype(np.float64)
+            self._sum[wrapped] = ring.sum(axis=1)
+            self._sumsq[wrapped] = (ring * ring).sum(axis=1)
+
+        diff = x - ewm
+        increment = self.alpha * diff
+        seen = count > 0
+        self._ewm[s] = np.where(seen, ewm + increment, x)
+        self._ewv[s] = np.where(seen, (1.0 - self.alpha) * (self._ewv[s] + diff * increment), 0.0)
+        self._last_t[s] = t
+        self._count[s] = count + 1
+        return flags
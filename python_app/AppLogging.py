@@ -0,0 +1,166 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+ROOT_LOGGER = "home_security"
+
+_listener = None
+_queue_handler = None
+
+
+def get_logger(category):
+    """
+    Logger for one category, e.g. "mqtt", "mysql", "claims". Levels can be set per category.
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` records per `interval` seconds for each logger and message
+    template at min_level or above, so the same warning repeated for every message cannot flood
+    the output. Records are keyed by the unformatted message, so lazy %-style arguments keep
+    repeats on one key. The next record let through after a quiet spell reports how many were
+    suppressed.
+    """
+
+    def __init__(self, burst=10, interval=60.0, min_level=logging.WARNING, max_keys=10000):
+        super().__init__()
+        self.burst = burst
+        self.min_level = min_level
+        self.interval = interval
+        self.max_keys = max_keys
+        # (logger, template) -> [window start, records let through, records suppressed]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.burst <= 0 or record.levelno < self.min_level:
+            return True
+        key = (record.name, record.msg)
+        now = record.created
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                if window is None and len(self._windows) >= self.max_keys:
+                    self._windows.clear()
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without formatting them and without ever blocking the
+    caller: when the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # formatting (including the %-args) happens on the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with any `extra=` fields of the record included as keys.
+    """
+
+    _reserved = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "category": record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._reserved and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            line += f" (suppressed {suppressed} similar)"
+        return line
+
+
+def parse_category_levels(spec):
+    """
+    Parse "mqtt=DEBUG,mysql=WARNING" into a dict of category -> level name.
+    """
+    levels = {}
+    for item in (spec or "").split(","):
+        category, _, level = item.partition("=")
+        if category.strip() and level.strip():
+            levels[category.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level="INFO", category_levels="", fmt="text", queue_size=10000, rate_burst=10, rate_interval=60.0,
+                  stream=None):
+    """
+    Route all application logging through a bounded queue to a single writer thread.
+    Safe to call more than once; later calls replace the earlier configuration.
+    """
+    global _listener, _queue_handler
+    stop_logging()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level.upper())
+    root.propagate = False
+    for category, category_level in parse_category_levels(category_levels).items():
+        get_logger(category).setLevel(category_level)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(TextFormatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    _queue_handler.addFilter(RateLimitFilter(rate_burst, rate_interval))
+    root.handlers = [_queue_handler]
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """
+    Write out everything still queued and stop the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if _queue_handler is not None and _queue_handler.dropped:
+            sys.stdout.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} WARNING [{ROOT_LOGGER}] "
+                             f"dropped {_queue_handler.dropped} log records while the log queue was full\n")
+            sys.stdout.flush()
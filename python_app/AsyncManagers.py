@@ -0,0 +1,202 @@
+import asyncio
+
+from mysql.connector.aio import connect as mysql_connect
+from neo4j import AsyncGraphDatabase
+from pymongo import AsyncMongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from AppLogging import get_logger
+from LiveState import location_of, property_of
+from Metrics import metrics
+from MysqlDatabaseManager import ROLLUPS
+
+log = get_logger("store")
+
+
+class AsyncMySQLManager:
+    """
+    asyncio counterpart of MySQLDatabaseManager's batched sensor writes, on mysql.connector.aio.
+    Rows, SQL and rollups come from the wrapped synchronous manager, which also owns schema setup,
+    claims and the spool that failed batches go to.
+    """
+
+    def __init__(self, manager, pool_size=5):
+        self.manager = manager
+        self.pool_size = pool_size
+        # one slot per connection, held from _acquire to _release; a broken connection gives its slot
+        # back like a healthy one, so waiting writers always wake up
+        self._slots = asyncio.Semaphore(pool_size)
+        self._idle = []
+
+    async def _acquire(self):
+        await self._slots.acquire()
+        try:
+            if self._idle:
+                return self._idle.pop()
+            return await mysql_connect(host=self.manager.host, user=self.manager.user,
+                                       password=self.manager.password, database=self.manager.database)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release(self, conn, broken=False):
+        try:
+            if not broken:
+                self._idle.append(conn)
+                return
+            # a failed batch may leave the connection unusable; open a fresh one next time
+            try:
+                await conn.close()
+            except Exception:
+                pass
+        finally:
+            self._slots.release()
+
+    async def write(self, items):
+        """
+        Insert (topic, sensor_data) pairs with one executemany plus the rollup upserts, in one
+        transaction. Failed batches are spooled for replay.
+        """
+        if not items:
+            return
+        manager = self.manager
+        rows = [manager._sensor_row(topic, sensor_data) for topic, sensor_data in items]
+        metrics.observe("backend_batch_size", len(rows), backend="mysql")
+        try:
+            with metrics.timed("backend_write_seconds", backend="mysql", op="sensor_rows"):
+                conn = await self._acquire()
+                broken = False
+                try:
+                    cursor = await conn.cursor()
+                    await cursor.executemany(manager._sensor_insert_sql(), rows)
+                    if manager.rollups:
+                        for suffix, width in ROLLUPS:
+                            await cursor.executemany(manager._rollup_upsert_sql(f"{manager.sensor_table}_{suffix}"),
+                                                     manager._rollup_rows(rows, width))
+                    await conn.commit()
+                    await cursor.close()
+                except Exception:
+                    broken = True
+                    raise
+                finally:
+                    await self._release(conn, broken)
+        except Exception as e:
+            log.error("Error inserting %d sensor rows into MySQL: %s", len(rows), e)
+            manager._spool_rows(rows)
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+
+class AsyncMongoManager:
+    """
+    asyncio counterpart of MongodbDbManager's insert_many batches, on pymongo's AsyncMongoClient.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._client = None
+
+    def _collection(self):
+        if self._client is None:
+            manager = self.manager
+            if manager.username and manager.password:
+                self._client = AsyncMongoClient(
+                    f"mongodb://{manager.username}:{manager.password}@{manager.host}:{manager.port}/{manager.dbName}"
+                    f"?authSource={manager.auth_source}")
+            else:
+                self._client = AsyncMongoClient(manager.host, manager.port)
+        return self._client[self.manager.dbName].get_collection(self.manager.sensor_collection_name,
+                                                                write_concern=self.manager.write_concern)
+
+    async def write(self, items):
+        """
+        Insert (topic, sensor_data) pairs with one unordered insert_many. Only failures that could
+        succeed on retry (connection, write concern) are spooled.
+        """
+        if not items:
+            return
+        documents = [self.manager._prepare_document(topic, dict(sensor_data)) for topic, sensor_data in items]
+        metrics.observe("backend_batch_size", len(documents), backend="mongo")
+        try:
+            with metrics.timed("backend_write_seconds", backend="mongo", op="insert_many"):
+                await self._collection().insert_many(documents, ordered=False)
+        except BulkWriteError as bwe:
+            for err in bwe.details.get("writeErrors", []):
+                log.error("Error inserting into MongoDB: %s", err.get("errmsg", ""))
+            if bwe.details.get("writeConcernErrors"):
+                self.manager._spool_documents(documents)
+        except PyMongoError as e:
+            log.error("Error inserting %d documents into MongoDB: %s", len(documents), e)
+            self.manager._spool_documents(documents)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class AsyncNeo4jManager:
+    """
+    asyncio counterpart of Neo4jManager.write_sensor_events on the neo4j async driver; the Cypher
+    and the topology registry are shared with the wrapped synchronous manager.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._driver = None
+
+    @staticmethod
+    async def _run_statements(tx, statements):
+        for query, parameters in statements:
+            result = await tx.run(query, parameters)
+            await result.consume()
+
+    async def write(self, items):
+        if not items:
+            return
+        manager = self.manager
+        rows = []
+        for topic, sensor_data in items:
+            location = location_of(topic)
+            rows.append({"sensor_id": sensor_data["sensor_id"], "sensor_type": sensor_data["type"],
+                         "location_name": location, "property_id": property_of(location),
+                         "timestamp": sensor_data["timestamp"], "value": sensor_data["value"]})
+        topology_rows = manager._topology_rows(rows)
+        statements = manager._batch_statements(topology_rows, manager._event_rows(rows))
+        metrics.observe("backend_batch_size", len(rows), backend="neo4j")
+        try:
+            if self._driver is None:
+                self._driver = AsyncGraphDatabase.driver(manager.uri, auth=(manager.user, manager.password))
+            with metrics.timed("backend_write_seconds", backend="neo4j", op="sensor_events"):
+                async with self._driver.session() as session:
+                    await session.execute_write(self._run_statements, statements)
+        except Exception as e:
+            log.error("Error writing %d sensor events to Neo4j: %s", len(rows), e)
+            if manager.spool is not None:
+                manager.spool.append(rows)
+            return
+        manager._register_topology(topology_rows)
+
+    async def close(self):
+        if self._driver is not None:
+            await self._driver.close()
+            self._driver = None
+
+
+class AsyncMemoryStore:
+    """
+    Wraps a MemoryManagers stand-in so the asyncio entry point can run against STORAGE_BACKEND=memory.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    async def write(self, items):
+        for topic, sensor_data in items:
+            self.store(topic, sensor_data)
+
+    async def close(self):
+        pass
+
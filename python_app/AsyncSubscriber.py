@@ -0,0 +1,302 @@
+import asyncio
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import paho.mqtt.client as mqtt
+from config import (
+    MQTT_BROKER_PORT, MQTT_BROKER_HOST, STORAGE_BACKEND, MYSQL_POOL_SIZE,
+    ASYNC_BATCH_SIZE, ASYNC_BATCH_LATENCY, ASYNC_MAX_IN_FLIGHT, ASYNC_QUEUE_SIZE,
+    DEADBAND_STORES, DEADBAND_RULES, DEADBAND_HEARTBEAT, MYSQL_ROLLUPS, PIPELINE_STATS_INTERVAL,
+    SENSOR_STATE_SNAPSHOT_PATH, METRICS_HOST, METRICS_PORT, METRICS_PROFILER,
+    LIVE_STATE_HOST, LIVE_STATE_PORT, BACKEND_INIT_TIMEOUT,
+    LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL,
+)
+from AppLogging import get_logger, setup_logging, stop_logging
+from AsyncManagers import AsyncMemoryStore, AsyncMongoManager, AsyncMySQLManager, AsyncNeo4jManager
+from DamageAnalyzer import analyze_sensor_batch_and_trigger_claims, claim_worker, sensor_state
+from Deadband import build_deadband_filters
+from db_manager import (
+    store_mysql, store_mongo, store_neo4j, init_dbs, flush_dbs, readiness,
+    mysql_db_manager, mongo_manager, neo4j_manager,
+)
+from LiveState import start_live_state_server
+from Metrics import metrics, start_metrics_server
+from Subscriber import (
+    MQTT_SUBCRIBER_TOPIC, after_event, on_connect, on_message, restore_from_stores, router, snapshot_sensor_state,
+)
+
+log = get_logger("mqtt")
+
+
+class AsyncioMqtt:
+    """
+    Drives a paho client from the asyncio event loop instead of loop_forever: its socket is watched
+    with add_reader/add_writer and paho's housekeeping (keepalive, retries, reconnects) runs once a
+    second, so MQTT callbacks run on the event loop thread. pause()/resume() stop and restart reading
+    from the socket, which pushes backpressure back to the broker.
+    """
+
+    def __init__(self, loop, client, read_packets=100):
+        self.loop = loop
+        self.client = client
+        self.read_packets = read_packets
+        self._sock = None
+        self._paused = False
+        self._closing = False
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = lambda c, userdata, sock: loop.add_writer(sock, c.loop_write)
+        client.on_socket_unregister_write = lambda c, userdata, sock: loop.remove_writer(sock)
+
+    def _read(self):
+        self.client.loop_read(self.read_packets)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._sock = sock
+        if not self._paused:
+            self.loop.add_reader(sock, self._read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self._sock = None
+
+    def pause(self):
+        if not self._paused:
+            self._paused = True
+            if self._sock is not None:
+                self.loop.remove_reader(self._sock)
+
+    def resume(self):
+        if self._paused:
+            self._paused = False
+            if self._sock is not None:
+                self.loop.add_reader(self._sock, self._read)
+
+    async def housekeeping(self):
+        while not self._closing:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN and not self._closing:
+                try:
+                    self.client.reconnect()
+                    log.info("Reconnected to MQTT broker at %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+                except OSError as e:
+                    log.warning("MQTT reconnect failed: %s", e)
+            await asyncio.sleep(1)
+
+    def close(self):
+        self._closing = True
+        self.client.disconnect()
+        self.client.loop_write()
+
+
+class AsyncIngest:
+    """
+    Collects decoded readings into batches and writes each batch to every store concurrently, with at
+    most max_in_flight batches outstanding. The routing table and per-store deadband filters run as
+    batches are formed, in arrival order. Damage analysis gets every reading routed to it, batch by
+    batch in arrival order, on a single worker thread, exactly like the threaded pipeline's analysis stage.
+    """
+
+    def __init__(self, stores, accept=None, analysis_handler=analyze_sensor_batch_and_trigger_claims,
+                 batch_size=500, batch_latency=0.05, max_in_flight=4, max_queued=10000, mqtt_loop=None, route=None):
+        self.stores = stores
+        self.accept = accept or {}
+        self.route = route
+        self.analysis_handler = analysis_handler
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.max_queued = max_queued
+        self.mqtt_loop = mqtt_loop
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._writes = set()
+        self._analysis = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis")
+        self.processed = 0
+        self.errors = 0
+
+    def submit(self, topic, sensor_data):
+        self._queue.put_nowait((topic, sensor_data))
+        if self.mqtt_loop is not None and self._queue.qsize() >= self.max_queued:
+            self.mqtt_loop.pause()
+
+    async def _next_batch(self):
+        item = await self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = asyncio.get_running_loop().time() + self.batch_latency
+        while len(batch) < self.batch_size:
+            if self._queue.empty():
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            if item is None:
+                # keep the stop marker for the next call
+                self._queue.put_nowait(None)
+                break
+            batch.append(item)
+        if self.mqtt_loop is not None and self._queue.qsize() < self.max_queued // 2:
+            self.mqtt_loop.resume()
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if batch is None:
+                return
+            await self._slots.acquire()
+            routes = None if self.route is None else [self.route(t, d["type"]) for t, d in batch]
+            writes = {}
+            routed = batch if routes is None else [item for item, to in zip(batch, routes) if "analysis" in to]
+            if routed:
+                # queued here, not in the task, so analysis sees batches strictly in arrival order
+                writes["analysis"] = loop.run_in_executor(self._analysis, self.analysis_handler,
+                                                          [topic for topic, _ in routed], [data for _, data in routed])
+            for name, store in self.stores.items():
+                routed = batch if routes is None else [item for item, to in zip(batch, routes) if name in to]
+                accept = self.accept.get(name)
+                items = routed if accept is None else [(t, d) for t, d in routed if accept(t, d)]
+                writes[name] = store.write(items)
+            task = asyncio.create_task(self._write(batch, writes))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch, writes):
+        try:
+            with metrics.timed("stage_handler_seconds", stage="async_batch"):
+                results = await asyncio.gather(*writes.values(), return_exceptions=True)
+            for name, result in zip(writes, results):
+                if isinstance(result, Exception):
+                    self.errors += 1
+                    log.error("[%s] Error handling a batch of %d readings: %s", name, len(batch), result)
+            self.processed += len(batch)
+        finally:
+            self._slots.release()
+
+    async def stop(self, runner):
+        """
+        Write out everything already received, then stop the analysis thread.
+        """
+        self._queue.put_nowait(None)
+        await runner
+        if self._writes:
+            await asyncio.gather(*self._writes)
+        self._analysis.shutdown(wait=True)
+
+    def stats(self):
+        return {"queue_depth": self._queue.qsize(), "in_flight": len(self._writes),
+                "processed": self.processed, "errors": self.errors}
+
+
+def build_async_stores():
+    """
+    name -> async store with write(items) and close(), mirroring the threaded pipeline's store stages.
+    """
+    if STORAGE_BACKEND == "memory":
+        return {"mysql": AsyncMemoryStore(store_mysql), "mongo": AsyncMemoryStore(store_mongo),
+                "neo4j": AsyncMemoryStore(store_neo4j)}
+    return {
+        "mysql": AsyncMySQLManager(mysql_db_manager, MYSQL_POOL_SIZE),
+        "mongo": AsyncMongoManager(mongo_manager),
+        "neo4j": AsyncNeo4jManager(neo4j_manager),
+    }
+
+
+async def report_stats(ingest):
+    while True:
+        await asyncio.sleep(PIPELINE_STATS_INTERVAL)
+        get_logger("pipeline").info("%s", ingest.stats())
+
+
+async def serve(topic, protocol, client_id, analysis_handler=analyze_sensor_batch_and_trigger_claims):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    stores = build_async_stores()
+    deadband = build_deadband_filters(DEADBAND_STORES, DEADBAND_RULES, DEADBAND_HEARTBEAT, MYSQL_ROLLUPS)
+    client = mqtt.Client(client_id=client_id, protocol=protocol)
+    mqtt_loop = AsyncioMqtt(loop, client)
+    ingest = AsyncIngest(stores, {name: f.accept for name, f in deadband.items()}, analysis_handler,
+                         batch_size=ASYNC_BATCH_SIZE, batch_latency=ASYNC_BATCH_LATENCY,
+                         max_in_flight=ASYNC_MAX_IN_FLIGHT, max_queued=ASYNC_QUEUE_SIZE, mqtt_loop=mqtt_loop,
+                         route=router)
+
+    def collect_ingest_metrics():
+        stats = ingest.stats()
+        yield "async_queue_depth", "gauge", "Readings waiting to be batched by the asyncio ingest.", {}, stats["queue_depth"]
+        yield "async_batches_in_flight", "gauge", "Batches being written by the asyncio ingest.", {}, stats["in_flight"]
+    metrics.register_collector(collect_ingest_metrics)
+
+    client.user_data_set({"topic": topic, "submit": ingest.submit})
+    client.on_connect = on_connect
+    client.on_message = on_message
+    router.start()
+    runner = asyncio.create_task(ingest.run())
+    housekeeping = None
+    reporter = asyncio.create_task(report_stats(ingest))
+    try:
+        log.info("Attempting to connect to MQTT broker...")
+        client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+        housekeeping = asyncio.create_task(mqtt_loop.housekeeping())
+        await stop.wait()
+        log.info("MQTT client stopped by signal.")
+    except Exception as e:
+        log.error("An error occurred in the MQTT client loop: %s", e)
+    finally:
+        mqtt_loop.close()
+        router.stop()
+        for task in (housekeeping, reporter):
+            if task is not None:
+                task.cancel()
+        await ingest.stop(runner)
+        get_logger("pipeline").info("%s", ingest.stats())
+        for store in stores.values():
+            await store.close()
+
+
+def run(topic=MQTT_SUBCRIBER_TOPIC, protocol=mqtt.MQTTv311, client_id="", state_path=SENSOR_STATE_SNAPSHOT_PATH,
+        metrics_port=METRICS_PORT, live_state_port=LIVE_STATE_PORT, run_retention=True):
+    """
+    asyncio counterpart of Subscriber.run: one event loop reads MQTT and writes batches to the three
+    stores through their async drivers. Schema setup, the spool replay, retention and claim filing
+    keep using the synchronous managers.
+    """
+    setup_logging(LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL)
+    metrics_server = start_metrics_server(METRICS_HOST, metrics_port, METRICS_PROFILER, readiness.report)
+    init_dbs(retention=run_retention)
+    sensor_state.restore(state_path)
+    claim_worker.start()
+    live_state_server = start_live_state_server(LIVE_STATE_HOST, live_state_port)
+    incidents_rebuilt = threading.Event()
+    restore_from_stores(incidents_rebuilt, live_state_server=live_state_server)
+    stop_snapshots = threading.Event()
+    threading.Thread(target=snapshot_sensor_state, args=(stop_snapshots, state_path), daemon=True).start()
+    try:
+        asyncio.run(serve(topic, protocol, client_id,
+                          after_event(incidents_rebuilt, analyze_sensor_batch_and_trigger_claims, BACKEND_INIT_TIMEOUT)))
+    finally:
+        stop_snapshots.set()
+        claim_worker.stop()
+        get_logger("claims").info("%s", claim_worker.stats())
+        sensor_state.snapshot(state_path)
+        flush_dbs()
+        if neo4j_manager:
+            neo4j_manager.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if live_state_server is not None:
+            live_state_server.shutdown()
+        log.info("Application gracefully shutting down...")
+        stop_logging()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,307 @@
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import time
+
+import numpy as np
+
+from config import (
+    BACKFILL_WORKERS, BACKFILL_CHUNK_HOURS, BACKFILL_BATCH_SIZE, BACKFILL_CHECKPOINT_PATH, NEO4J_EVENT_MODEL,
+    SENSOR_STATE_TEMPERATURE_WINDOW, CLAIM_QUIET_PERIOD, CLAIM_MAX_OPEN_INCIDENTS,
+    LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL,
+)
+from AppLogging import get_logger, setup_logging, stop_logging
+from Codecs import dumps_json
+from DamageAnalyzer import DAMAGE_NONE, DAMAGE_TYPE_NAMES, analyze_batch, readings_to_columns
+from IncidentCache import Incident, IncidentCache
+from LiveState import location_of, property_of
+from SensorState import SensorStateEngine
+from db_manager import mongo_manager, mysql_db_manager, neo4j_manager
+
+log = get_logger("backfill")
+
+TARGETS = ("mysql", "neo4j")
+
+# options of the running backfill, set in each worker process by _init_worker
+_options = None
+
+
+def time_chunks(start, end, hours):
+    """
+    Split [start, end) into consecutive ranges of `hours` hours. Both ends are widened to whole hours
+    so every boundary is also a rollup bucket boundary.
+    """
+    chunk_start = start.replace(minute=0, second=0, microsecond=0)
+    if end != end.replace(minute=0, second=0, microsecond=0):
+        end = end.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+    step = datetime.timedelta(hours=hours)
+    chunks = []
+    while chunk_start < end:
+        chunks.append((chunk_start, min(chunk_start + step, end)))
+        chunk_start += step
+    return chunks
+
+
+def chunk_key(start, end):
+    return f"{start:%Y-%m-%dT%H:%M}/{end:%Y-%m-%dT%H:%M}"
+
+
+def load_checkpoint(path):
+    """
+    {chunk key: {"targets", "documents", "finished_at"}} of the chunks finished by earlier runs.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get("chunks", {})
+
+
+def save_checkpoint(path, chunks):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"chunks": chunks}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+class DryRunAnalysis:
+    """
+    Runs readings through the vectorized damage analyzer with its own sensor state and incident cache,
+    counting the alerts it would raise and the claims it would file without filing anything. The state
+    starts empty with every chunk, so leak durations and incidents that span a chunk boundary are split.
+    """
+
+    def __init__(self):
+        self.state = SensorStateEngine(temperature_window=SENSOR_STATE_TEMPERATURE_WINDOW)
+        self.incidents = IncidentCache(quiet_period=CLAIM_QUIET_PERIOD, max_entries=CLAIM_MAX_OPEN_INCIDENTS)
+        self.alerts = collections.Counter()
+        self.filed = []
+        self._claim_ids = itertools.count()
+
+    def add(self, topics, readings):
+        columns = readings_to_columns(topics, readings, self.state)
+        damage_codes, costs, _ = analyze_batch(columns)
+        for i in np.flatnonzero(damage_codes != DAMAGE_NONE):
+            category = DAMAGE_TYPE_NAMES[damage_codes[i]]
+            sensor_id, timestamp, cost = readings[i]["sensor_id"], readings[i]["timestamp"], float(costs[i])
+            self.alerts[category] += 1
+            incident = self.incidents.get(sensor_id, category, timestamp)
+            if incident is None:
+                incident = Incident(next(self._claim_ids), sensor_id, category, location_of(topics[i]), cost, None,
+                                    timestamp)
+                self.incidents.add(incident)
+                self.filed.append(incident)
+            else:
+                self.incidents.touch(incident, timestamp)
+                incident.estimated_cost = max(incident.estimated_cost, cost)
+
+    def summary(self):
+        claims, costs = collections.Counter(), collections.Counter()
+        for incident in self.filed:
+            claims[incident.damage_type] += 1
+            costs[incident.damage_type] += incident.estimated_cost
+        return {"alerts": dict(self.alerts), "claims": dict(claims), "estimated_cost": dict(costs)}
+
+
+def _reading(document):
+    """
+    (topic, sensor_data) of a stored document as it arrived over MQTT, timestamp in epoch seconds,
+    or None when the document lacks a field the live path requires.
+    """
+    timestamp = document.get("timestamp")
+    sensor_data = {
+        "sensor_id": document.get("sensor_id"),
+        "type": document.get("type"),
+        "timestamp": timestamp.timestamp() if isinstance(timestamp, datetime.datetime) else timestamp,
+        "value": document.get("value"),
+    }
+    if not all([sensor_data["sensor_id"], sensor_data["type"], timestamp is not None, sensor_data["value"] is not None]):
+        return None
+    return document.get("_mqtt_topic", ""), sensor_data
+
+
+def _write_batch(batch, targets, analysis):
+    """
+    Write one batch of (topic, sensor_data, document) to the targets with their batch APIs, which raise on failure.
+    """
+    if "mysql" in targets:
+        now = datetime.datetime.now()
+        mysql_db_manager.write_sensor_rows([
+            (datetime.datetime.fromtimestamp(sensor_data["timestamp"]), topic, sensor_data["sensor_id"],
+             sensor_data["type"], dumps_json(sensor_data["value"]), location_of(topic), document.get("_received_at", now))
+            for topic, sensor_data, document in batch
+        ])
+    if "neo4j" in targets:
+        neo4j_manager.write_sensor_events([
+            {"sensor_id": sensor_data["sensor_id"], "sensor_type": sensor_data["type"],
+             "location_name": location_of(topic), "property_id": property_of(location_of(topic)),
+             "timestamp": sensor_data["timestamp"], "value": sensor_data["value"]}
+            for topic, sensor_data, _ in batch
+        ])
+    if analysis is not None:
+        analysis.add([topic for topic, _, _ in batch], [sensor_data for _, sensor_data, _ in batch])
+
+
+def _init_worker(options):
+    global _options
+    # Ctrl-C reaches the whole process group; the parent stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL)
+    _options = options
+
+
+def backfill_chunk(chunk):
+    """
+    Stream one chunk's documents from MongoDB and write them to the targets batch by batch. Unless
+    appending, the chunk's range is cleared in the targets first, so a chunk interrupted halfway can
+    simply be run again. Runs in a worker process; failures are returned, not raised.
+    """
+    start, end = chunk
+    targets, batch_size = _options["targets"], _options["batch_size"]
+    analysis = DryRunAnalysis() if _options["analyze"] else None
+    result = {"chunk": chunk, "documents": 0, "skipped": 0, "error": None, "analysis": None}
+    started = time.monotonic()
+    try:
+        if not _options["append"]:
+            if "mysql" in targets:
+                mysql_db_manager.delete_range(start, end, batch_size)
+            if "neo4j" in targets:
+                neo4j_manager.delete_sensor_events_between(start, end, batch_size)
+        batch = []
+        for document in mongo_manager.iter_readings(start, end, batch_size):
+            reading = _reading(document)
+            if reading is None:
+                result["skipped"] += 1
+                continue
+            batch.append(reading + (document,))
+            if len(batch) >= batch_size:
+                _write_batch(batch, targets, analysis)
+                result["documents"] += len(batch)
+                batch = []
+        if batch:
+            _write_batch(batch, targets, analysis)
+            result["documents"] += len(batch)
+        if analysis is not None:
+            result["analysis"] = analysis.summary()
+    except Exception as e:
+        log.error("Chunk %s failed after %d readings: %s", chunk_key(start, end), result["documents"], e)
+        result["error"] = str(e)
+    result["seconds"] = time.monotonic() - started
+    return result
+
+
+def backfill(start, end, targets=TARGETS, workers=BACKFILL_WORKERS, chunk_hours=BACKFILL_CHUNK_HOURS,
+             batch_size=BACKFILL_BATCH_SIZE, checkpoint_path=BACKFILL_CHECKPOINT_PATH, append=False, analyze=False):
+    """
+    Rebuild the targets' readings in [start, end) from MongoDB, `workers` chunks at a time in separate
+    processes. Chunks already finished for all the targets according to the checkpoint are skipped and
+    each chunk is recorded there as soon as it finishes. With no targets nothing is written or recorded.
+    Returns the keys of the chunks that failed.
+    """
+    chunks = time_chunks(start, end, chunk_hours)
+    finished = load_checkpoint(checkpoint_path) if targets else {}
+    pending = [chunk for chunk in chunks
+               if not targets or not set(targets) <= set(finished.get(chunk_key(*chunk), {}).get("targets", ()))]
+    log.info("Backfilling %s from %s to %s: %d chunks of %dh, %d already done, %d workers",
+             ", ".join(targets) or "nothing (dry run)", chunks[0][0] if chunks else start,
+             chunks[-1][1] if chunks else end, len(chunks), chunk_hours, len(chunks) - len(pending), workers)
+    if not pending:
+        return []
+
+    managers = {"mysql": mysql_db_manager, "neo4j": neo4j_manager}
+    for name, manager in [("mongo", mongo_manager)] + [(target, managers[target]) for target in targets]:
+        if not manager.initialize():
+            raise RuntimeError(f"{name} is not available")
+    mongo_manager.ensure_time_index()
+
+    failed = []
+    totals = collections.Counter()
+    analysis = {"alerts": collections.Counter(), "claims": collections.Counter(), "estimated_cost": collections.Counter()}
+    options = {"targets": tuple(targets), "batch_size": batch_size, "append": append, "analyze": analyze}
+    started = time.monotonic()
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(min(workers, len(pending)), initializer=_init_worker, initargs=(options,)) as pool:
+        for done, result in enumerate(pool.imap_unordered(backfill_chunk, pending), 1):
+            key = chunk_key(*result["chunk"])
+            if result["error"] is not None:
+                failed.append(key)
+            else:
+                totals["documents"] += result["documents"]
+                totals["skipped"] += result["skipped"]
+                for name, counts in (result["analysis"] or {}).items():
+                    analysis[name].update(counts)
+                if targets:
+                    entry = finished.setdefault(key, {"targets": []})
+                    entry.update(targets=sorted(set(entry["targets"]) | set(targets)), documents=result["documents"],
+                                 finished_at=datetime.datetime.now().isoformat(timespec="seconds"))
+                    save_checkpoint(checkpoint_path, finished)
+            elapsed = time.monotonic() - started
+            log.info("[%d/%d] %s %s: %d readings in %.1fs; %d readings so far, %.0f/s, about %.0fs left",
+                     done, len(pending), key, "failed" if result["error"] is not None else "done",
+                     result["documents"], result["seconds"], totals["documents"], totals["documents"] / elapsed,
+                     elapsed / done * (len(pending) - done))
+
+    elapsed = time.monotonic() - started
+    log.info("Backfilled %d readings in %.1fs (%.0f/s), skipped %d incomplete documents, %d chunks failed",
+             totals["documents"], elapsed, totals["documents"] / elapsed if elapsed else 0, totals["skipped"], len(failed))
+    if analyze:
+        for category in sorted(analysis["alerts"]):
+            log.info("Dry-run analysis: %s would raise %d alerts and file %d claims ($%.2f)", category,
+                     analysis["alerts"][category], analysis["claims"][category], analysis["estimated_cost"][category])
+    return failed
+
+
+def _timestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO date/time: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild MySQL and Neo4j readings from the raw MongoDB collection.")
+    parser.add_argument("--start", type=_timestamp, required=True, help="first reading time, e.g. 2024-05-01 or 2024-05-01T06:00")
+    parser.add_argument("--end", type=_timestamp, default=datetime.datetime.now().replace(minute=0, second=0, microsecond=0),
+                        help="end of the range (exclusive), by default the start of the current hour")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated stores to write: mysql, neo4j")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--chunk-hours", type=int, default=BACKFILL_CHUNK_HOURS)
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=BACKFILL_CHECKPOINT_PATH, help="file recording finished chunks")
+    parser.add_argument("--append", action="store_true",
+                        help="write without first clearing each chunk's range in the targets (only for empty ranges)")
+    parser.add_argument("--analyze", action="store_true",
+                        help="also run damage analysis over the readings and report the claims it would file")
+    parser.add_argument("--dry-run", action="store_true", help="read and analyze only; write nothing")
+    args = parser.parse_args()
+    targets = [] if args.dry_run else [t.strip() for t in args.targets.split(",") if t.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(sorted(unknown))}")
+    if "neo4j" in targets and NEO4J_EVENT_MODEL == "chain":
+        parser.error("the chain event model links events in arrival order and cannot be backfilled in chunks")
+    if args.start >= args.end:
+        parser.error("--start must be before --end")
+
+    setup_logging(LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL)
+    status = 0
+    try:
+        failed = backfill(args.start, args.end, targets, args.workers, args.chunk_hours, args.batch_size,
+                          args.checkpoint, args.append, args.analyze)
+        if failed:
+            log.error("%d chunks failed (%s); run the same command again to retry them", len(failed), ", ".join(failed))
+            status = 1
+    except RuntimeError as e:
+        log.error("Backfill not started: %s", e)
+        status = 1
+    except KeyboardInterrupt:
+        log.warning("Interrupted; finished chunks are recorded in %s", args.checkpoint)
+        status = 130
+    finally:
+        stop_logging()
+    raise SystemExit(status)
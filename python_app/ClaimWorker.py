@@ -0,0 +1,132 @@
+import heapq
+import itertools
+import threading
+import time
+
+from AppLogging import get_logger
+from Metrics import metrics
+
+log = get_logger("claims")
+
+# damage category -> rank; lower ranks are written first, then higher estimated costs
+CLAIM_PRIORITIES = {"fire": 0, "structural_stress": 1, "water_leak": 2}
+
+
+class ClaimWorker:
+    """
+    Writes claims on a background thread so damage analysis, and with it ingest, never waits on the
+    claim stores. submit(row) queues the full current state of one claim (a dict with the claims
+    table's columns plus timestamp_event, and reading_at for a newly filed claim); the worker takes
+    the most urgent claims first (fire, then structural, then water, each by estimated cost) and
+    hands up to batch_size of them at a time to write_batch, which must raise on failure and be
+    idempotent per claim_id. A claim submitted again while still queued replaces its queued state,
+    so the queue never holds more than one entry per claim. Failed batches are retried max_attempts
+    times with exponential backoff and then handed to spill (e.g. a spool), or logged as lost.
+    """
+
+    def __init__(self, write_batch, spill=None, batch_size=100, max_attempts=5, retry_backoff=0.5, max_backoff=30.0):
+        self.write_batch = write_batch
+        self.spill = spill
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.written = 0
+        self.retries = 0
+        self.spilled = 0
+        # heap of [rank, -estimated_cost, seq, claim_id, row]; an entry whose row is None was superseded
+        self._heap = []
+        self._queued = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _priority(row):
+        return CLAIM_PRIORITIES.get(row["damage_category"], len(CLAIM_PRIORITIES)), -float(row["estimated_cost"])
+
+    def submit(self, row):
+        with self._cond:
+            entry = self._queued.get(row["claim_id"])
+            if entry is not None:
+                # keep when and from which reading the claim was first filed
+                row = dict(row, timestamp_filed=entry[4]["timestamp_filed"], reading_at=entry[4].get("reading_at"))
+                if self._priority(row) >= tuple(entry[:2]):
+                    entry[4] = row
+                    return
+                entry[4] = None
+            entry = [*self._priority(row), next(self._seq), row["claim_id"], row]
+            self._queued[row["claim_id"]] = entry
+            heapq.heappush(self._heap, entry)
+            self._cond.notify()
+
+    def _take_batch(self):
+        rows = []
+        while self._heap and len(rows) < self.batch_size:
+            entry = heapq.heappop(self._heap)
+            if entry[4] is None:
+                continue
+            del self._queued[entry[3]]
+            rows.append(entry[4])
+        return rows
+
+    def _write(self, rows):
+        backoff = self.retry_backoff
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with metrics.timed("claim_seconds", action="write"):
+                    self.write_batch(rows)
+                break
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    log.error("Writing %d claims failed after %d attempts: %s", len(rows), attempt, e)
+                    if self.spill is not None and self.spill(rows):
+                        self.spilled += len(rows)
+                    else:
+                        log.error("Lost %d claims: %s", len(rows), ", ".join(row["claim_id"] for row in rows))
+                    return
+                self.retries += 1
+                log.warning("Writing %d claims failed, retrying in %.1fs: %s", len(rows), backoff, e)
+                # once stopping, remaining attempts run back to back so shutdown is not held up
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        now = time.time()
+        for row in rows:
+            if row.get("reading_at") is not None:
+                metrics.observe("claim_latency_seconds", now - row["reading_at"], category=row["damage_category"])
+        self.written += len(rows)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queued and not self._stop.is_set():
+                    self._cond.wait()
+                rows = self._take_batch()
+            if rows:
+                metrics.observe("claim_batch_size", len(rows))
+                self._write(rows)
+            elif self._stop.is_set():
+                return
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="claim-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Write out every queued claim, then stop the worker thread.
+        """
+        with self._cond:
+            self._stop.set()
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._queued)
+        return {"queued": queued, "written": self.written, "retries": self.retries, "spilled": self.spilled}
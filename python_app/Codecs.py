@@ -0,0 +1,188 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+from AppLogging import get_logger
+
+log = get_logger("codecs")
+
+
+class CodecError(ValueError):
+    pass
+
+
+class JsonCodec:
+    """
+    JSON decoded straight from the payload bytes, with orjson when it is installed.
+    """
+    name = "json"
+    content_types = ("application/json",)
+
+    def __init__(self, use_orjson=True):
+        self.use_orjson = use_orjson and orjson is not None
+
+    def decode(self, payload):
+        try:
+            if self.use_orjson:
+                return orjson.loads(payload)
+            return json.loads(payload)
+        except ValueError as e:
+            raise CodecError(str(e)) from e
+
+    def encode(self, obj):
+        if self.use_orjson:
+            return orjson.dumps(obj)
+        return json.dumps(obj).encode("utf-8")
+
+
+class MsgPackCodec:
+    name = "msgpack"
+    content_types = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+    def decode(self, payload):
+        try:
+            return msgpack.unpackb(payload, raw=False)
+        except (ValueError, TypeError, msgpack.UnpackException) as e:
+            raise CodecError(str(e)) from e
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+
+class CborCodec:
+    name = "cbor"
+    content_types = ("application/cbor",)
+
+    def decode(self, payload):
+        try:
+            return cbor2.loads(payload)
+        except (ValueError, TypeError, EOFError) as e:
+            raise CodecError(str(e)) from e
+
+    def encode(self, obj):
+        return cbor2.dumps(obj)
+
+
+CODECS = {"json": JsonCodec()}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgPackCodec()
+if cbor2 is not None:
+    CODECS["cbor"] = CborCodec()
+
+
+def dumps_json(value):
+    """
+    Serialize a value to a JSON str, using orjson when possible.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(value)
+
+
+def topic_matches(topic_filter, topic):
+    """
+    MQTT topic filter match supporting + and # wildcards.
+    """
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class CodecRegistry:
+    """
+    Picks the codec for a message: an MQTT v5 content-type property wins, then the first matching
+    topic rule, then the default. Topic lookups are cached per concrete topic, up to max_cached
+    topics; the cache starts over once it is full. Rules naming a codec that is unknown or not
+    installed are skipped with a warning.
+    """
+
+    def __init__(self, topic_rules=None, default="json", max_cached=100000):
+        self.topic_rules = []
+        for topic_filter, name in topic_rules or []:
+            if name in CODECS:
+                self.topic_rules.append((topic_filter, CODECS[name]))
+            else:
+                log.warning("Ignoring codec rule %s=%s: codec not available (have %s)",
+                            topic_filter, name, ", ".join(sorted(CODECS)))
+        self.default = CODECS[default]
+        self.by_content_type = {ct: codec for codec in CODECS.values() for ct in codec.content_types}
+        self.max_cached = max_cached
+        self._topic_cache = {}
+
+    def select(self, topic, content_type=None):
+        if content_type:
+            codec = self.by_content_type.get(content_type.split(";", 1)[0].strip().lower())
+            if codec is None:
+                raise CodecError(f"Unsupported content type: {content_type}")
+            return codec
+        if not self.topic_rules:
+            return self.default
+        codec = self._topic_cache.get(topic)
+        if codec is None:
+            codec = self.default
+            for topic_filter, rule_codec in self.topic_rules:
+                if topic_matches(topic_filter, topic):
+                    codec = rule_codec
+                    break
+            if len(self._topic_cache) >= self.max_cached:
+                self._topic_cache.clear()
+            self._topic_cache[topic] = codec
+        return codec
+
+    def decode(self, topic, payload, content_type=None):
+        return self.select(topic, content_type).decode(payload)
+
+
+def parse_topic_rules(spec):
+    """
+    Parse "filter=codec;filter=codec" into a list of (filter, codec name) pairs.
+    """
+    rules = []
+    for item in (spec or "").split(";"):
+        if "=" in item:
+            topic_filter, name = item.rsplit("=", 1)
+            rules.append((topic_filter.strip(), name.strip()))
+    return rules
+
+
+def compile_validator(schema):
+    """
+    Build a predicate for a flat dict schema of key -> accepted types (None: any non-null value).
+    The checks are generated into a single expression so validation is one function call.
+    """
+    clauses = ["type(r) is dict"]
+    namespace = {}
+    for i, (key, types) in enumerate(schema.items()):
+        clauses.append(f"r.get({key!r}) is not None")
+        if types:
+            namespace[f"t{i}"] = types
+            clauses.append(f"isinstance(r[{key!r}], t{i})")
+    return eval("lambda r: " + " and ".join(clauses), namespace)
+
+
+SENSOR_READING_SCHEMA = {
+    "sensor_id": str,
+    "type": str,
+    "value": None,
+    "timestamp": (int, float),
+}
+validate_reading = compile_validator(SENSOR_READING_SCHEMA)
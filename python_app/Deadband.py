@@ -0,0 +1,98 @@
+import threading
+
+from AppLogging import get_logger
+from Metrics import metrics
+
+log = get_logger("deadband")
+
+
+class DeadbandRule:
+    """
+    When a reading differs enough from the last one passed for its sensor. Numbers must move by
+    more than `absolute`, or by more than `relative` times the last value; any other value
+    (booleans, structural_stress dicts) passes only when it changed.
+    """
+    __slots__ = ("absolute", "relative")
+
+    def __init__(self, absolute=0.0, relative=None):
+        self.absolute = absolute
+        self.relative = relative
+
+    def changed(self, last, value):
+        numeric = (int, float)
+        if isinstance(value, bool) or isinstance(last, bool) or not isinstance(value, numeric) \
+                or not isinstance(last, numeric):
+            return value != last
+        delta = abs(value - last)
+        if self.relative is not None:
+            return delta > self.relative * abs(last)
+        return delta > self.absolute
+
+
+def parse_deadband_rules(spec):
+    """
+    Parse "temperature=0.5,humidity=2%,door_contact=change" into a dict of sensor type -> DeadbandRule:
+    a number is an absolute band, a percentage a relative one, "change" passes any change.
+    """
+    rules = {}
+    for item in (spec or "").split(","):
+        sensor_type, _, band = item.partition("=")
+        sensor_type, band = sensor_type.strip(), band.strip()
+        if not sensor_type or not band:
+            continue
+        if band == "change":
+            rules[sensor_type] = DeadbandRule()
+        elif band.endswith("%"):
+            rules[sensor_type] = DeadbandRule(relative=float(band[:-1]) / 100)
+        else:
+            rules[sensor_type] = DeadbandRule(absolute=float(band))
+    return rules
+
+
+class DeadbandFilter:
+    """
+    Per-store change detection: accept(topic, sensor_data) is False for a reading that stays within
+    its type's deadband of the last reading passed for the same sensor, unless `heartbeat` seconds
+    (reading time) have gone by since then. Types without a rule always pass, as does the first
+    reading of a sensor and any reading older than the last one passed.
+    """
+
+    def __init__(self, store, rules, heartbeat=300.0):
+        self.store = store
+        self.rules = rules
+        self.heartbeat = heartbeat
+        # sensor_id -> (value, timestamp) of the last reading passed
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def accept(self, topic, sensor_data):
+        sensor_type = sensor_data["type"]
+        rule = self.rules.get(sensor_type)
+        if rule is None:
+            return True
+        sensor_id = sensor_data["sensor_id"]
+        value = sensor_data["value"]
+        timestamp = sensor_data["timestamp"]
+        with self._lock:
+            last = self._last.get(sensor_id)
+            if last is not None and timestamp < last[1]:
+                return True
+            if last is None or (self.heartbeat and timestamp - last[1] >= self.heartbeat) or rule.changed(last[0], value):
+                self._last[sensor_id] = (value, timestamp)
+                return True
+        metrics.inc("deadband_suppressed_total", store=self.store, type=sensor_type)
+        return False
+
+
+def build_deadband_filters(stores, rules_spec, heartbeat, mysql_rollups=False):
+    """
+    One DeadbandFilter per store name in `stores`, sharing the parsed rules. mysql_rollups says whether
+    MySQL maintains rollups, which are then folded from the filtered rows only.
+    """
+    rules = parse_deadband_rules(rules_spec)
+    if stores:
+        log.info("Deadband filtering %s: %s", ", ".join(stores), rules_spec)
+    if "mysql" in stores and mysql_rollups:
+        log.warning("MySQL rollups are folded from deadband-filtered rows: their counts and averages cover "
+                    "the readings written, not every reading received")
+    return {store: DeadbandFilter(store, rules, heartbeat) for store in stores}
@@ -0,0 +1,292 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import time
+import urllib.parse
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import (
+    EXPORT_DIR, EXPORT_CHUNK_ROWS, EXPORT_SETTLE_SECONDS, EXPORT_COMPRESSION,
+    LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL,
+)
+from AppLogging import get_logger, setup_logging, stop_logging
+from Codecs import dumps_json
+from LiveState import location_of
+from db_manager import mongo_manager, mysql_db_manager
+
+log = get_logger("export")
+
+STATE_FILE = "_export_state.json"
+
+READING_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us")),
+    ("sensor_id", pa.string()),
+    ("sensor_type", pa.string()),
+    ("topic", pa.string()),
+    ("received_at", pa.timestamp("us")),
+    ("value_number", pa.float64()),
+    ("value_bool", pa.bool_()),
+    ("value_text", pa.string()),
+    ("value_level", pa.string()),
+    ("value_vibration_hz", pa.float64()),
+    ("value_json", pa.string()),
+])
+
+CLAIM_SCHEMA = pa.schema([
+    ("claim_id", pa.string()),
+    ("timestamp_filed", pa.timestamp("us")),
+    ("damage_type", pa.string()),
+    ("damage_category", pa.string()),
+    ("estimated_cost", pa.float64()),
+    ("description", pa.string()),
+    ("status", pa.string()),
+    ("sensor_id", pa.string()),
+    ("last_alert_at", pa.timestamp("us")),
+    ("alert_count", pa.int32()),
+    ("incident_status", pa.string()),
+])
+
+# fields of object values that get a column of their own, e.g. structural_stress {"level": "high", "vibration_hz": 8.1}
+OBJECT_FIELDS = {"level": ("value_level", str), "vibration_hz": ("value_vibration_hz", float)}
+
+
+def _object_field(key, value):
+    column = OBJECT_FIELDS.get(key)
+    if column is None:
+        return None
+    name, kind = column
+    if kind is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return name, float(value)
+    if isinstance(value, kind):
+        return name, value
+    return None
+
+
+def flatten_value(value, row):
+    """
+    Spread a reading's value over the typed value columns of row: numbers (temperature, humidity) into
+    value_number, booleans (water_leak, smoke_detector, door_contact) into value_bool, strings into
+    value_text and the known fields of objects (structural_stress) into their own columns. Anything else,
+    including objects with other fields, is kept whole as JSON in value_json.
+    """
+    if isinstance(value, bool):
+        row["value_bool"] = value
+    elif isinstance(value, (int, float)):
+        row["value_number"] = float(value)
+    elif isinstance(value, str):
+        row["value_text"] = value
+    elif isinstance(value, dict) and value and all(_object_field(k, v) for k, v in value.items()):
+        row.update(_object_field(k, v) for k, v in value.items())
+    elif value is not None:
+        row["value_json"] = dumps_json(value)
+    return row
+
+
+def _reading_row(timestamp, topic, sensor_id, sensor_type, value, location, received_at):
+    return flatten_value(value, {"timestamp": timestamp, "sensor_id": sensor_id, "sensor_type": sensor_type,
+                                 "topic": topic, "received_at": received_at, "location": location})
+
+
+def mysql_readings(start, end, chunk_rows):
+    for rows in mysql_db_manager.iter_sensor_rows(start, end, chunk_rows):
+        yield [_reading_row(r["timestamp"], r["topic"], r["sensor_id"], r["sensor_type"],
+                            json.loads(r["value"]) if isinstance(r["value"], (str, bytes)) else r["value"],
+                            r["location"], r["received_at"])
+               for r in rows]
+
+
+def mongo_readings(start, end, chunk_rows):
+    documents = mongo_manager.iter_readings(start, end, chunk_rows)
+    while True:
+        chunk = list(itertools.islice(documents, chunk_rows))
+        if not chunk:
+            return
+        yield [_reading_row(doc.get("timestamp"), doc.get("_mqtt_topic"), doc.get("sensor_id"), doc.get("type"),
+                            doc.get("value"), location_of(doc.get("_mqtt_topic", "")), doc.get("_received_at"))
+               for doc in chunk]
+
+
+def mysql_claims(start, end, chunk_rows):
+    for rows in mysql_db_manager.iter_claim_rows(start, end, chunk_rows):
+        for row in rows:
+            row["estimated_cost"] = float(row["estimated_cost"]) if row["estimated_cost"] is not None else None
+        yield rows
+
+
+# dataset -> (schema, {source: chunked row reader})
+DATASETS = {
+    "readings": (READING_SCHEMA, {"mysql": mysql_readings, "mongo": mongo_readings}),
+    "claims": (CLAIM_SCHEMA, {"mysql": mysql_claims}),
+}
+
+
+def day_windows(start, end):
+    """
+    Split [start, end) at midnight, so each window belongs to one date partition.
+    """
+    while start < end:
+        midnight = datetime.datetime.combine(start.date() + datetime.timedelta(days=1), datetime.time())
+        yield start, min(midnight, end)
+        start = midnight
+
+
+class WindowWriter:
+    """
+    Parquet files for one export window, one per location at
+    <root>/date=<day>/location=<location>/part-<window start>-<window end>.parquet (hive partitioning,
+    location URL-encoded). Rows are buffered per location and every buffer is written out as a row
+    group once chunk_rows rows are waiting in total, so memory is bounded by the chunk size, not by
+    the window. Files are written under hidden temporary names and moved into place by commit(), so
+    an interrupted window leaves nothing that readers of the dataset would pick up, and exporting the
+    same window again replaces its files.
+    """
+
+    def __init__(self, root, schema, start, end, chunk_rows, compression):
+        self.root = root
+        self.schema = schema
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.directory = os.path.join(root, f"date={start:%Y-%m-%d}")
+        self.filename = f"part-{start:%Y%m%dT%H%M%S}-{end:%Y%m%dT%H%M%S}.parquet"
+        self.rows = 0
+        self._buffers = {}
+        self._buffered = 0
+        self._writers = {}
+
+    def _path(self, location, temporary=False):
+        directory = os.path.join(self.directory, "location=" + urllib.parse.quote(location or "unknown", safe=""))
+        return os.path.join(directory, "." + self.filename + ".tmp" if temporary else self.filename)
+
+    def add(self, rows):
+        for row in rows:
+            self._buffers.setdefault(row["location"], []).append(row)
+        self._buffered += len(rows)
+        if self._buffered >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        for location, rows in self._buffers.items():
+            writer = self._writers.get(location)
+            if writer is None:
+                path = self._path(location, temporary=True)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = self._writers[location] = pq.ParquetWriter(path, self.schema, compression=self.compression)
+            writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=self.schema))
+            self.rows += len(rows)
+        self._buffers = {}
+        self._buffered = 0
+
+    def commit(self):
+        """
+        Write what is still buffered, close the files and move them into place. Returns the number of files.
+        """
+        self._flush()
+        for location, writer in self._writers.items():
+            writer.close()
+            os.replace(self._path(location, temporary=True), self._path(location))
+        return len(self._writers)
+
+    def abort(self):
+        for location, writer in self._writers.items():
+            writer.close()
+            os.remove(self._path(location, temporary=True))
+        self._writers = {}
+
+
+def load_watermark(root):
+    path = os.path.join(root, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return datetime.datetime.fromisoformat(json.load(f)["watermark"])
+
+
+def save_watermark(root, watermark, source):
+    tmp = os.path.join(root, "." + STATE_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"watermark": watermark.isoformat(), "source": source}, f)
+    os.replace(tmp, os.path.join(root, STATE_FILE))
+
+
+def export(dataset, source="mysql", out_dir=EXPORT_DIR, since=None, until=None, chunk_rows=EXPORT_CHUNK_ROWS,
+           compression=EXPORT_COMPRESSION):
+    """
+    Export rows of dataset ("readings" or "claims", by reading time or filing time) with
+    since <= time < until to Parquet under <out_dir>/<dataset>, one day at a time. since defaults to
+    where the previous export of the dataset stopped, until to EXPORT_SETTLE_SECONDS before now; the
+    end of every finished day window is saved as the new starting point. Returns the number of rows exported.
+    """
+    schema, sources = DATASETS[dataset]
+    read = sources[source]
+    root = os.path.join(out_dir, dataset)
+    os.makedirs(root, exist_ok=True)
+    since = since or load_watermark(root)
+    if since is None:
+        raise ValueError(f"no earlier export in {root}; pass a start time")
+    until = until or (datetime.datetime.now() - datetime.timedelta(seconds=EXPORT_SETTLE_SECONDS)).replace(
+        second=0, microsecond=0)
+    if since >= until:
+        log.info("Nothing to export for %s: already exported up to %s", dataset, since)
+        return 0
+
+    log.info("Exporting %s from %s, %s to %s, into %s", dataset, source, since, until, root)
+    total = 0
+    started = time.monotonic()
+    for start, end in day_windows(since, until):
+        window_started = time.monotonic()
+        writer = WindowWriter(root, schema, start, end, chunk_rows, compression)
+        try:
+            for rows in read(start, end, chunk_rows):
+                writer.add(rows)
+            files = writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+        save_watermark(root, end, source)
+        total += writer.rows
+        elapsed = time.monotonic() - started
+        log.info("%s to %s: %d rows in %d files in %.1fs; %d rows so far, %.0f/s", start, end, writer.rows, files,
+                 time.monotonic() - window_started, total, total / elapsed if elapsed else 0)
+    return total
+
+
+def _timestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO date/time: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export readings or claims to Parquet partitioned by date and location. Without --since an "
+                    "export continues where the previous one of the same dataset stopped.")
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("--source", choices=["mysql", "mongo"], default="mysql",
+                        help="where readings are read from; claims only live in MySQL")
+    parser.add_argument("--out", default=EXPORT_DIR, help="dataset root directory")
+    parser.add_argument("--since", type=_timestamp, help="start time, e.g. 2024-05-01; needed for the first export")
+    parser.add_argument("--until", type=_timestamp, help="end time (exclusive), by default a few minutes ago")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS, help="rows read and written at a time")
+    parser.add_argument("--compression", default=EXPORT_COMPRESSION)
+    args = parser.parse_args()
+    if args.source not in DATASETS[args.dataset][1]:
+        parser.error(f"{args.dataset} cannot be exported from {args.source}")
+    if args.since is None and load_watermark(os.path.join(args.out, args.dataset)) is None:
+        parser.error(f"no earlier {args.dataset} export in {args.out}; pass --since")
+
+    setup_logging(LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL)
+    status = 0
+    try:
+        exported = export(args.dataset, args.source, args.out, args.since, args.until, args.chunk_rows, args.compression)
+        log.info("Exported %d %s rows.", exported, args.dataset)
+    except KeyboardInterrupt:
+        log.warning("Interrupted; the next export resumes after the last finished day")
+        status = 130
+    finally:
+        stop_logging()
+    raise SystemExit(status)
@@ -0,0 +1,90 @@
+import collections
+import threading
+
+
+class Incident:
+    __slots__ = ("claim_id", "sensor_id", "damage_type", "location", "estimated_cost", "details",
+                 "opened_at", "last_alert_at", "alert_count", "persisted_at")
+
+    def __init__(self, claim_id, sensor_id, damage_type, location, estimated_cost, details, opened_at,
+                 last_alert_at=None, alert_count=1):
+        self.claim_id = claim_id
+        self.sensor_id = sensor_id
+        self.damage_type = damage_type
+        self.location = location
+        self.estimated_cost = estimated_cost
+        self.details = details
+        self.opened_at = opened_at
+        self.last_alert_at = last_alert_at if last_alert_at is not None else opened_at
+        self.alert_count = alert_count
+        # last alert time written to the claims table
+        self.persisted_at = self.last_alert_at
+
+
+class IncidentCache:
+    """
+    Open incidents keyed by (sensor_id, damage_type). An incident stays open while alerts keep
+    arriving and closes once no alert has been seen for quiet_period seconds. When more than
+    max_entries incidents are open, the least recently alerted one is evicted (and closed).
+    Times are epoch seconds taken from the readings.
+    """
+
+    def __init__(self, quiet_period=1800.0, max_entries=100000):
+        self.quiet_period = quiet_period
+        self.max_entries = max_entries
+        self._incidents = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self._incidents)
+
+    def get(self, sensor_id, damage_type, now):
+        """
+        Return the open incident for the key, or None if there is none or it has gone quiet.
+        """
+        with self._lock:
+            incident = self._incidents.get((sensor_id, damage_type))
+            if incident is None or now - incident.last_alert_at > self.quiet_period:
+                return None
+            return incident
+
+    def add(self, incident):
+        """
+        Register a newly opened incident. Returns incidents closed to make room or that it replaces.
+        """
+        key = (incident.sensor_id, incident.damage_type)
+        closed = []
+        with self._lock:
+            previous = self._incidents.pop(key, None)
+            if previous is not None:
+                closed.append(previous)
+            self._incidents[key] = incident
+            while len(self._incidents) > self.max_entries:
+                closed.append(self._incidents.popitem(last=False)[1])
+        return closed
+
+    def touch(self, incident, now):
+        """
+        Record a repeat alert on an open incident.
+        """
+        with self._lock:
+            incident.last_alert_at = max(incident.last_alert_at, now)
+            incident.alert_count += 1
+            self.suppressed += 1
+            self._incidents.move_to_end((incident.sensor_id, incident.damage_type))
+
+    def expire(self, now):
+        """
+        Remove and return incidents that have been quiet for longer than quiet_period.
+        Entries are kept in alert order, so the scan stops at the first incident still active.
+        """
+        closed = []
+        with self._lock:
+            while self._incidents:
+                key, incident = next(iter(self._incidents.items()))
+                if now - incident.last_alert_at <= self.quiet_period:
+                    break
+                closed.append(incident)
+                del self._incidents[key]
+        return closed
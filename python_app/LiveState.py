@@ -0,0 +1,180 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from AppLogging import get_logger
+from Codecs import dumps_json
+
+log = get_logger("live_state")
+
+
+def location_of(topic):
+    """
+    Location level of a sensor topic (home/<location>/<sensor_id>/sensor).
+    """
+    topic_parts = topic.split('/')
+    return topic_parts[1] if len(topic_parts) > 1 else "unknown"
+
+
+def property_of(location):
+    """
+    Property id a location belongs to; the same derivation the Neo4j topology uses.
+    """
+    return "property_" + location.replace(" ", "_")
+
+
+class LastValue:
+    __slots__ = ("sensor_type", "location", "value", "timestamp", "received_at")
+
+    def __init__(self, sensor_type, location, value, timestamp, received_at):
+        self.sensor_type = sensor_type
+        self.location = location
+        self.value = value
+        self.timestamp = timestamp
+        self.received_at = received_at
+
+
+class LastValueCache:
+    """
+    Latest reading per sensor_id, indexed by location and property, so current home state is answered
+    from memory. A reading older than the one already cached for its sensor is ignored; a sensor
+    reported under a new location moves there.
+    """
+
+    def __init__(self):
+        self._sensors = {}
+        # location -> set of sensor_ids, property_id -> set of locations
+        self._locations = {}
+        self._properties = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sensors)
+
+    def update(self, location, sensor_id, sensor_type, value, timestamp, received_at=None):
+        with self._lock:
+            record = self._sensors.get(sensor_id)
+            if record is not None and timestamp < record.timestamp:
+                return False
+            if record is None or record.location != location:
+                if record is not None:
+                    self._locations.get(record.location, set()).discard(sensor_id)
+                self._locations.setdefault(location, set()).add(sensor_id)
+                self._properties.setdefault(property_of(location), set()).add(location)
+            self._sensors[sensor_id] = LastValue(sensor_type, location, value, timestamp,
+                                                 received_at if received_at is not None else time.time())
+            return True
+
+    def _sensor_view(self, sensor_id, record):
+        return {
+            "sensor_id": sensor_id,
+            "type": record.sensor_type,
+            "location": record.location,
+            "value": record.value,
+            "timestamp": record.timestamp,
+            "received_at": record.received_at,
+        }
+
+    def _location_view(self, location):
+        sensors = [self._sensor_view(sensor_id, self._sensors[sensor_id])
+                   for sensor_id in sorted(self._locations.get(location, ()))]
+        return {
+            "location": location,
+            "property_id": property_of(location),
+            "last_update": max((s["timestamp"] for s in sensors), default=None),
+            "sensors": sensors,
+        }
+
+    def sensor(self, sensor_id):
+        with self._lock:
+            record = self._sensors.get(sensor_id)
+            return self._sensor_view(sensor_id, record) if record is not None else None
+
+    def location(self, location):
+        with self._lock:
+            if not self._locations.get(location):
+                return None
+            return self._location_view(location)
+
+    def locations(self):
+        with self._lock:
+            return [self._location_view(location) for location in sorted(self._locations) if self._locations[location]]
+
+    def property(self, property_id):
+        with self._lock:
+            locations = sorted(l for l in self._properties.get(property_id, ()) if self._locations.get(l))
+            if not locations:
+                return None
+            return {"property_id": property_id, "locations": [self._location_view(l) for l in locations]}
+
+    def summary(self):
+        with self._lock:
+            locations = sorted(l for l, ids in self._locations.items() if ids)
+            return {
+                "sensors": len(self._sensors),
+                "locations": locations,
+                "properties": sorted({property_of(l) for l in locations}),
+            }
+
+
+live_state = LastValueCache()
+
+
+class _LiveStateHandler(BaseHTTPRequestHandler):
+    """
+    GET /state                      sensor count, locations and properties
+    GET /state/sensors/<sensor_id>  latest reading of one sensor
+    GET /state/locations            every location with its sensors
+    GET /state/locations/<name>     one location
+    GET /state/properties/<id>      every location of one property
+    """
+    cache = live_state
+
+    def do_GET(self):
+        parts = [unquote(p) for p in urlparse(self.path).path.strip("/").split("/")]
+        body = None
+        if parts == ["state"]:
+            body = self.cache.summary()
+        elif parts == ["state", "locations"]:
+            body = self.cache.locations()
+        elif len(parts) == 3 and parts[:2] == ["state", "sensors"]:
+            body = self.cache.sensor(parts[2])
+        elif len(parts) == 3 and parts[:2] == ["state", "locations"]:
+            body = self.cache.location(parts[2])
+        elif len(parts) == 3 and parts[:2] == ["state", "properties"]:
+            body = self.cache.property(parts[2])
+        if body is None:
+            self._reply(404, {"error": "not found"})
+        else:
+            self._reply(200, body)
+
+    def _reply(self, status, body):
+        data = dumps_json(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_live_state_server(host, port, cache=live_state):
+    """
+    Serve the cache read API from a daemon thread. Returns the server, or None when port is 0 or
+    cannot be bound.
+    """
+    if not port:
+        return None
+    handler = type("LiveStateHandler", (_LiveStateHandler,), {"cache": cache})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        log.error("Could not listen on %s:%s: %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="live-state-http", daemon=True).start()
+    log.info("Serving live state on http://%s:%s/state", host, port)
+    return server
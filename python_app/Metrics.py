@@ -0,0 +1,266 @@
+import bisect
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from AppLogging import get_logger
+
+log = get_logger("metrics")
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                          for k, v in labels) + "}"
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, keyed by metric name and label values, rendered in the
+    Prometheus text exposition format. Recording is a dict lookup plus one short lock, so it is
+    cheap enough for per-message use. Collectors are callables run at scrape time that yield
+    (name, type, help, labels, value) for values owned elsewhere, e.g. pipeline queue depth.
+    """
+
+    def __init__(self, prefix="home_security"):
+        self.prefix = prefix
+        self._help = {}
+        self._series = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, metric_type, help_text, buckets=LATENCY_BUCKETS):
+        self._help[name] = (metric_type, help_text, buckets)
+
+    def _get(self, name, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = factory()
+        return series
+
+    def inc(self, name, amount=1, **labels):
+        self._get(name, labels, Counter).inc(amount)
+
+    def observe(self, name, value, **labels):
+        buckets = self._help.get(name, (None, None, LATENCY_BUCKETS))[2]
+        self._get(name, labels, lambda: Histogram(buckets)).observe(value)
+
+    def timed(self, name, **labels):
+        """
+        Context manager observing the elapsed seconds into histogram `name`; an exception escaping
+        the block also counts towards `<name without _seconds>_errors_total` with the same labels.
+        """
+        return _Timer(self, name, labels)
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        by_name = collections.defaultdict(list)
+        with self._lock:
+            items = list(self._series.items())
+        for (name, labels), series in items:
+            by_name[name].append((labels, series))
+        for name in sorted(by_name):
+            full_name = f"{self.prefix}_{name}"
+            metric_type, help_text, _ = self._help.get(name, (None, None, None))
+            first = by_name[name][0][1]
+            metric_type = metric_type or ("histogram" if isinstance(first, Histogram) else "counter")
+            if help_text:
+                lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for labels, series in sorted(by_name[name], key=lambda item: item[0]):
+                if isinstance(series, Histogram):
+                    with series._lock:
+                        counts, total, count = list(series.counts), series.sum, series.count
+                    cumulative = 0
+                    for bound, bucket_count in zip(series.bounds + (float("inf"),), counts):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {total}")
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {count}")
+                else:
+                    lines.append(f"{full_name}{_format_labels(labels)} {series.value}")
+        described = set()
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                log.error("Collector %s failed: %s", collector, e)
+                continue
+            for name, metric_type, help_text, labels, value in samples:
+                full_name = f"{self.prefix}_{name}"
+                if full_name not in described:
+                    lines.append(f"# HELP {full_name} {help_text}")
+                    lines.append(f"# TYPE {full_name} {metric_type}")
+                    described.add(full_name)
+                lines.append(f"{full_name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            base = self.name[:-len("_seconds")] if self.name.endswith("_seconds") else self.name
+            self.registry.inc(base + "_errors_total", **self.labels)
+        return False
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all other threads every `interval` seconds and counts them in collapsed
+    ("frame;frame;frame count") form, which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+
+    def profile(self, seconds):
+        stacks = collections.Counter()
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(frames))] += 1
+            time.sleep(self.interval)
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("decode_seconds", "histogram", "Time to decode and validate one MQTT payload.")
+metrics.describe("messages_received_total", "counter", "MQTT messages received.")
+metrics.describe("messages_rejected_total", "counter", "MQTT messages rejected before the pipeline, by reason.")
+metrics.describe("backend_write_seconds", "histogram", "Time per store write call, by backend and operation.")
+metrics.describe("backend_write_errors_total", "counter", "Failed store write calls, by backend and operation.")
+metrics.describe("backend_query_seconds", "histogram", "Time per store read query, by backend and table.")
+metrics.describe("backend_batch_size", "histogram", "Rows or documents per store write call.", SIZE_BUCKETS)
+metrics.describe("stage_handler_seconds", "histogram", "Time spent in a pipeline stage handler per call.")
+metrics.describe("stage_queue_wait_seconds", "histogram", "Time a reading waited in a pipeline stage queue.")
+metrics.describe("analysis_seconds", "histogram", "Vectorized damage analysis time per batch, excluding claim filing.")
+metrics.describe("analysis_batch_size", "histogram", "Readings per batched damage analysis call.", SIZE_BUCKETS)
+metrics.describe("anomalies_total", "counter", "Numeric readings flagged by the anomaly detector, by type and kind.")
+metrics.describe("routing_reloads_total", "counter", "Routing rule file reloads, by result.")
+metrics.describe("deadband_suppressed_total", "counter", "Readings not written to a store by its deadband filter, by type.")
+metrics.describe("claim_seconds", "histogram", "Time per claim batch write attempt by the claim worker.")
+metrics.describe("claim_batch_size", "histogram", "Claims per claim worker write.", SIZE_BUCKETS)
+metrics.describe("claim_latency_seconds", "histogram", "Time from the triggering reading to its claim being written, by category.",
+                 (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = metrics
+    profiler = None
+    health = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self._reply(200, self.registry.render(), "text/plain; version=0.0.4")
+        elif url.path == "/profile" and self.profiler is not None:
+            seconds = float(parse_qs(url.query).get("seconds", ["10"])[0])
+            self._reply(200, self.profiler.profile(min(seconds, 300.0)), "text/plain")
+        elif url.path in ("/health", "/ready") and self.health is not None:
+            # /health answers while the process is up; /ready only once every backend is
+            ready, backends = self.health()
+            status = 200 if ready or url.path == "/health" else 503
+            self._reply(status, json.dumps({"ready": ready, "backends": backends}) + "\n", "application/json")
+        else:
+            self._reply(404, "not found\n", "text/plain")
+
+    def _reply(self, status, body, content_type):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host, port, profiler=False, health=None):
+    """
+    Serve /metrics (and /profile?seconds=N when profiler is set) from a daemon thread. health is a
+    callable returning (ready, {backend: state}), served as JSON on /health and /ready.
+    Returns the server, or None when port is 0 or cannot be bound.
+    """
+    if not port:
+        return None
+    handler = type("MetricsHandler", (_MetricsHandler,), {"profiler": SamplingProfiler() if profiler else None,
+                                                          "health": staticmethod(health) if health else None})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        log.error("Could not listen on %s:%s: %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
@@ -1,8 +1,21 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, WriteConcern
+from bson.errors import InvalidDocument
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
 import datetime
+import threading
+import time
+
+from AppLogging import get_logger
+from Metrics import metrics
+
+log = get_logger("mongo")
+
+TTL_INDEX_NAME = "_received_at_ttl"
+TIME_INDEX_NAME = "timestamp_1"
 
 class MongodbDbManager:
-    def __init__(self,host,port,dbName,sensor_collection_name,username=None, password=None, auth_source='admin'):
+    def __init__(self,host,port,dbName,sensor_collection_name,username=None, password=None, auth_source='admin',
+                 batch_size=500, max_latency=1.0, write_concern_w=1, timeseries=False, connect_timeout=30.0):
         self.host = host
         self.port = port
         self.dbName = dbName
@@ -11,31 +24,306 @@ class MongodbDbManager:
         self.password = password
         self.auth_source = auth_source
 
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.write_concern = WriteConcern(w=write_concern_w)
+        self.timeseries = timeseries
+        self.connect_timeout = connect_timeout
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self._stop_flusher = threading.Event()
+        self.spool = None
+
     def get_client(self):
-        try:
-            if self.username and self.password:
-                uri = (f"mongodb://{self.username}:{self.password}"f"@{self.host}:{self.port}/{self.dbName}"f"?authSource={self.auth_source}")
-                client = MongoClient(uri)
-            else:
-                client = MongoClient(self.host, self.port)
-            return client
-        except Exception as e:
-            print(f"Error connecting to MongoDB: {e}")
+        """
+        Return the process-wide MongoClient, creating it on first use.
+        """
+        if self._client is not None:
+            return self._client
+        with self._client_lock:
+            if self._client is not None:
+                return self._client
+            timeout_ms = int(self.connect_timeout * 1000)
+            try:
+                if self.username and self.password:
+                    uri = (f"mongodb://{self.username}:{self.password}"f"@{self.host}:{self.port}/{self.dbName}"f"?authSource={self.auth_source}")
+                    self._client = MongoClient(uri, serverSelectionTimeoutMS=timeout_ms, connectTimeoutMS=timeout_ms)
+                else:
+                    self._client = MongoClient(self.host, self.port, serverSelectionTimeoutMS=timeout_ms,
+                                               connectTimeoutMS=timeout_ms)
+                return self._client
+            except Exception as e:
+                log.error("Error connecting to MongoDB: %s", e)
+                return None
+
+    def get_collection(self):
+        client = self.get_client()
+        if client is None:
             return None
+        return client[self.dbName].get_collection(self.sensor_collection_name, write_concern=self.write_concern)
 
-    def insert_sensor_data(self,topic,sensor_data):
+    def create_timeseries_collection(self):
+        """
+        Create the sensor collection as a time-series collection keyed on timestamp/sensor_id.
+        Does nothing if the collection already exists.
+        """
         client = self.get_client()
-        if client:
+        if client is None:
+            return
+        db = client[self.dbName]
+        try:
+            if self.sensor_collection_name in db.list_collection_names():
+                return
+            db.create_collection(
+                self.sensor_collection_name,
+                timeseries={"timeField": "timestamp", "metaField": "sensor_id", "granularity": "seconds"}
+            )
+            log.info("Created MongoDB time-series collection %s.", self.sensor_collection_name)
+        except CollectionInvalid:
+            pass
+        except PyMongoError as e:
+            log.error("Error creating MongoDB time-series collection: %s", e)
+
+    def ensure_ttl(self, expire_after_seconds):
+        """
+        Expire documents expire_after_seconds after _received_at through a TTL index, updating the
+        index in place when the period changes. Time-series collections expire on their timeField instead.
+        """
+        client = self.get_client()
+        if client is None:
+            return
+        db = client[self.dbName]
+        expire_after_seconds = int(expire_after_seconds)
+        try:
+            if self.timeseries:
+                db.command("collMod", self.sensor_collection_name, expireAfterSeconds=expire_after_seconds)
+                return
+            collection = db[self.sensor_collection_name]
+            index = collection.index_information().get(TTL_INDEX_NAME)
+            if index is None:
+                collection.create_index([("_received_at", 1)], name=TTL_INDEX_NAME,
+                                        expireAfterSeconds=expire_after_seconds)
+                log.info("Created TTL index on _received_at (%d s).", expire_after_seconds)
+            elif index.get("expireAfterSeconds") != expire_after_seconds:
+                db.command("collMod", self.sensor_collection_name,
+                           index={"name": TTL_INDEX_NAME, "expireAfterSeconds": expire_after_seconds})
+                log.info("Updated TTL index on _received_at to %d s.", expire_after_seconds)
+        except PyMongoError as e:
+            log.error("Error setting up MongoDB expiry: %s", e)
+
+    def delete_readings_before(self, cutoff, sensor_types=None, exclude_types=None, batch_size=5000):
+        """
+        Delete documents received before cutoff, limited to sensor_types or to every type not in
+        exclude_types, batch_size documents per delete. Returns the number deleted.
+        Time-series collections only support deletes on the metaField, so they rely on expiry alone.
+        """
+        if self.timeseries:
+            return 0
+        collection = self.get_collection()
+        if collection is None:
+            return 0
+        query = {"_received_at": {"$lt": cutoff}}
+        if sensor_types:
+            query["type"] = {"$in": list(sensor_types)}
+        elif exclude_types:
+            query["type"] = {"$nin": list(exclude_types)}
+        deleted = 0
+        while True:
+            ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).limit(batch_size)]
+            if not ids:
+                return deleted
+            deleted += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+            if len(ids) < batch_size:
+                return deleted
+
+    def ensure_time_index(self):
+        """
+        Index documents on timestamp so time-ranged reads (backfills) do not scan the whole collection.
+        Time-series collections are already organized by their timeField.
+        """
+        if self.timeseries:
+            return
+        collection = self.get_collection()
+        if collection is None:
+            return
+        try:
+            collection.create_index([("timestamp", 1)], name=TIME_INDEX_NAME)
+        except PyMongoError as e:
+            log.error("Error creating MongoDB timestamp index: %s", e)
+
+    def iter_readings(self, start, end, batch_size=5000):
+        """
+        Documents with start <= timestamp < end, oldest first, streamed through one server-side cursor
+        that fetches batch_size documents per round trip. Raises on failure.
+        """
+        collection = self.get_collection()
+        if collection is None:
+            raise PyMongoError("MongoDB client unavailable")
+        with collection.find({"timestamp": {"$gte": start, "$lt": end}}, sort=[("timestamp", 1)],
+                             batch_size=batch_size, no_cursor_timeout=True, allow_disk_use=True) as cursor:
+            yield from cursor
+
+    def fetch_latest_readings(self, since):
+        """
+        Latest document per sensor_id among documents received since the given datetime.
+        """
+        collection = self.get_collection()
+        if collection is None:
+            return []
+        pipeline = [
+            {"$match": {"_received_at": {"$gte": since}}},
+            {"$sort": {"timestamp": 1}},
+            {"$group": {"_id": "$sensor_id", "doc": {"$last": "$$ROOT"}}},
+        ]
+        try:
+            with metrics.timed("backend_query_seconds", backend="mongo", table=self.sensor_collection_name):
+                return [row["doc"] for row in collection.aggregate(pipeline, allowDiskUse=True)]
+        except PyMongoError as e:
+            log.error("Error loading latest readings from MongoDB: %s", e)
+            return []
+
+    def initialize(self):
+        """
+        Check that MongoDB answers, then create the time-series collection if configured.
+        Returns False when MongoDB cannot be reached.
+        """
+        client = self.get_client()
+        if client is None:
+            return False
+        try:
+            client.admin.command("ping")
+        except PyMongoError as e:
+            log.error("MongoDB unavailable: %s", e)
+            return False
+        if self.timeseries:
+            self.create_timeseries_collection()
+        return True
+
+    def _prepare_document(self, topic, sensor_data):
+        sensor_data["_mqtt_topic"] = topic
+        sensor_data["_received_at"] = datetime.datetime.now()
+        if "timestamp" in sensor_data and isinstance(sensor_data["timestamp"], (int, float)):
+            sensor_data["timestamp"] = datetime.datetime.fromtimestamp(sensor_data["timestamp"])
+        return sensor_data
+
+    def insert_sensor_data(self,topic,sensor_data):
+        collection = self.get_collection()
+        document = self._prepare_document(topic, sensor_data)
+        if collection is None:
+            self._spool_documents([document])
+            return
+        try:
+            with metrics.timed("backend_write_seconds", backend="mongo", op="insert_one"):
+                collection.insert_one(document)
+        except Exception as e:
+            log.error("Error inserting into MongoDB: %s", e)
+            self._spool_documents([document])
+
+    def write_documents(self, documents):
+        """
+        Insert documents with one unordered insert_many. Raises on failure; duplicate-key errors are
+        ignored so replaying a batch that was partly written is safe.
+        """
+        collection = self.get_collection()
+        if collection is None:
+            raise PyMongoError("MongoDB client unavailable")
+        metrics.observe("backend_batch_size", len(documents), backend="mongo")
+        try:
+            with metrics.timed("backend_write_seconds", backend="mongo", op="insert_many"):
+                collection.insert_many(documents, ordered=False)
+        except BulkWriteError as bwe:
+            errors = [err for err in bwe.details.get("writeErrors", []) if err.get("code") != 11000]
+            if errors or bwe.details.get("writeConcernErrors"):
+                raise
+
+    @staticmethod
+    def is_permanent_error(error):
+        """
+        Whether a failed write can never succeed as it is: documents the server rejected, or that cannot
+        be encoded at all. Write concern errors and connection failures are worth retrying.
+        """
+        if isinstance(error, BulkWriteError):
+            return bool(error.details.get("writeErrors")) and not error.details.get("writeConcernErrors")
+        return isinstance(error, InvalidDocument)
+
+    def _spool_documents(self, documents):
+        if self.spool is not None:
+            self.spool.append(documents)
+            log.info("Spooled %d documents for MongoDB replay.", len(documents))
+
+    def buffer_sensor_data(self, topic, sensor_data):
+        """
+        Queue a document for the next insert_many batch. The document is copied so callers
+        can keep using their dict.
+        """
+        document = self._prepare_document(topic, dict(sensor_data))
+        with self._buffer_lock:
+            self._buffer.append(document)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered documents with one unordered insert_many. Returns (inserted, failed) where
+        failed is a list of (document, error message) pairs.
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                documents, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if not documents:
+                return 0, []
+            collection = self.get_collection()
+            if collection is None:
+                self._spool_documents(documents)
+                return 0, [(doc, "MongoDB client unavailable") for doc in documents]
+            metrics.observe("backend_batch_size", len(documents), backend="mongo")
             try:
-                db = client[self.dbName]
-                collection = db[self.sensor_collection_name]
-                sensor_data["_mqtt_topic"] = topic
-                sensor_data["_received_at"] = datetime.datetime.now()
-                if "timestamp" in sensor_data and isinstance(sensor_data["timestamp"], (int, float)):
-                    sensor_data["timestamp"] = datetime.datetime.fromtimestamp(sensor_data["timestamp"])
-
-                result = collection.insert_one(sensor_data)
-            except Exception as e:
-                print(f"Error inserting into MongoDB: {e}")
-            finally:
-                client.close()
\ No newline at end of file
+                with metrics.timed("backend_write_seconds", backend="mongo", op="insert_many"):
+                    result = collection.insert_many(documents, ordered=False)
+                return len(result.inserted_ids), []
+            except BulkWriteError as bwe:
+                failed = [(documents[err["index"]], err.get("errmsg", "")) for err in bwe.details.get("writeErrors", [])]
+                for doc, errmsg in failed:
+                    log.error("Error inserting into MongoDB: sensor_id=%s timestamp=%s: %s", doc.get('sensor_id'), doc.get('timestamp'), errmsg)
+                # documents rejected by the server (e.g. validation) would fail again, so only
+                # write-concern failures are worth replaying
+                if bwe.details.get("writeConcernErrors"):
+                    self._spool_documents(documents)
+                return bwe.details.get("nInserted", 0), failed
+            except PyMongoError as e:
+                log.error("Error inserting %d documents into MongoDB: %s", len(documents), e)
+                self._spool_documents(documents)
+                return 0, [(doc, str(e)) for doc in documents]
+
+    def _flush_loop(self):
+        while not self._stop_flusher.wait(self.max_latency / 2):
+            if time.monotonic() - self._last_flush >= self.max_latency:
+                self.flush()
+
+    def start_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stop_flusher.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="mongo-flusher", daemon=True)
+            self._flusher.start()
+
+    def shutdown(self):
+        """
+        Stop the background flusher, write out anything still buffered and close the client.
+        """
+        self._stop_flusher.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.max_latency * 2)
+            self._flusher = None
+        inserted, _ = self.flush()
+        if inserted:
+            log.info("Flushed %d buffered documents into MongoDB on shutdown.", inserted)
+        if self._client is not None:
+            self._client.close()
+            self._client = None
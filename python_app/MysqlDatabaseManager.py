@@ -1,10 +1,55 @@
-import json
-
 import mysql.connector
+from mysql.connector import pooling
 import datetime
+import threading
+import time
+
+from AppLogging import get_logger
+from Codecs import dumps_json
+from Metrics import metrics
+
+log = get_logger("mysql")
+
+# rollup table suffix -> bucket width in seconds, coarsest first
+ROLLUPS = (("1h", 3600), ("1m", 60))
+GROUPABLE_COLUMNS = ("sensor_id", "location", "sensor_type")
+# numeric view of the JSON value column for raw-table aggregates; booleans count as 0/1
+RAW_NUMERIC_VALUE = """
+    CASE JSON_TYPE(value)
+        WHEN 'BOOLEAN' THEN JSON_UNQUOTE(value) = 'true'
+        WHEN 'INTEGER' THEN JSON_UNQUOTE(value) + 0
+        WHEN 'UNSIGNED INTEGER' THEN JSON_UNQUOTE(value) + 0
+        WHEN 'DOUBLE' THEN JSON_UNQUOTE(value) + 0
+        WHEN 'DECIMAL' THEN JSON_UNQUOTE(value) + 0
+    END
+"""
+
+
+def _to_days(day):
+    """
+    MySQL TO_DAYS() of a date.
+    """
+    return day.toordinal() + 365
+
+
+def _numeric_value(value_json):
+    """
+    Numeric value of a JSON-encoded reading for rollups: numbers as-is, booleans as 0/1, else None.
+    """
+    if value_json == "true":
+        return 1.0
+    if value_json == "false":
+        return 0.0
+    try:
+        return float(value_json)
+    except (TypeError, ValueError):
+        return None
+
 
 class MySQLDatabaseManager:
-    def __init__(self, host, user, password, database, sensor_table, claims_table):
+    def __init__(self, host, user, password, database, sensor_table, claims_table,
+                 pool_size=5, batch_size=500, flush_interval=1.0, rollups=True, partition_days_ahead=7,
+                 connect_timeout=30):
         self.host = host
         self.user = user
         self.password = password
@@ -14,24 +59,60 @@ class MySQLDatabaseManager:
         self.conn = None
         self.cursor = None
 
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self._stop_flusher = threading.Event()
+        self.spool = None
+        self.rollups = rollups
+        self.partition_days_ahead = partition_days_ahead
+        self.connect_timeout = connect_timeout
+
     def connect(self, use_database=True):
         if use_database:
             self.conn = mysql.connector.connect(
                 host=self.host,
                 user=self.user,
                 password=self.password,
-                database=self.database
+                database=self.database,
+                connection_timeout=self.connect_timeout
             )
         else:
             self.conn = mysql.connector.connect(
                 host=self.host,
                 user=self.user,
                 password=self.password,
-                database=self.database
+                connection_timeout=self.connect_timeout
             )
         self.cursor = self.conn.cursor()
         return self.conn
 
+    def get_connection(self):
+        """
+        Borrow a connection from the persistent pool. Closing it returns it to the pool.
+        """
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pooling.MySQLConnectionPool(
+                        pool_name=f"{self.database}_pool",
+                        pool_size=self.pool_size,
+                        pool_reset_session=False,
+                        host=self.host,
+                        user=self.user,
+                        password=self.password,
+                        database=self.database,
+                        connection_timeout=self.connect_timeout
+                    )
+        return self._pool.get_connection()
+
     def close(self):
         if self.cursor:
             self.cursor.close()
@@ -45,19 +126,53 @@ class MySQLDatabaseManager:
 
     def create_tables(self):
         self.connect()
+        # partitioned by day so retention can drop whole partitions; the partitioning column has to be
+        # part of the primary key
         sensor_table_query = f"""
             CREATE TABLE IF NOT EXISTS {self.sensor_table} (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME,
+                id INT AUTO_INCREMENT,
+                timestamp DATETIME NOT NULL,
                 topic VARCHAR(255),
                 sensor_id VARCHAR(255),
                 sensor_type VARCHAR(255),
                 value JSON,
                 location VARCHAR(255),
-                received_at DATETIME
+                received_at DATETIME,
+                PRIMARY KEY (id, timestamp)
+            )
+            PARTITION BY RANGE (TO_DAYS(timestamp)) (
+                PARTITION p_start VALUES LESS THAN ({_to_days(datetime.date.today())}),
+                PARTITION p_future VALUES LESS THAN MAXVALUE
             )
         """
         self.cursor.execute(sensor_table_query)
+        self._partition_existing_table(self.sensor_table)
+        self._ensure_indexes(self.sensor_table, {
+            f"idx_{self.sensor_table}_sensor_time": "(sensor_id, timestamp)",
+            f"idx_{self.sensor_table}_location_time": "(location, timestamp)",
+        })
+
+        if self.rollups:
+            for suffix, _ in ROLLUPS:
+                rollup_table = f"{self.sensor_table}_{suffix}"
+                self.cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {rollup_table} (
+                        bucket_start DATETIME NOT NULL,
+                        sensor_id VARCHAR(255) NOT NULL,
+                        location VARCHAR(255) NOT NULL,
+                        sensor_type VARCHAR(255) NOT NULL,
+                        count INT NOT NULL,
+                        numeric_count INT NOT NULL,
+                        sum_value DOUBLE,
+                        min_value DOUBLE,
+                        max_value DOUBLE,
+                        last_value JSON,
+                        last_timestamp DATETIME,
+                        PRIMARY KEY (sensor_id, location, sensor_type, bucket_start),
+                        INDEX idx_{rollup_table}_location_time (location, bucket_start),
+                        INDEX idx_{rollup_table}_time (bucket_start)
+                    )
+                """)
 
         claims_table_query = f"""
             CREATE TABLE IF NOT EXISTS {self.claims_table} (
@@ -68,72 +183,569 @@ class MySQLDatabaseManager:
                 description TEXT,
                 status VARCHAR(50),
                 sensor_id VARCHAR(255),
-                location VARCHAR(255)
+                location VARCHAR(255),
+                damage_category VARCHAR(50),
+                last_alert_at DATETIME,
+                alert_count INT DEFAULT 1,
+                incident_status VARCHAR(20) DEFAULT 'open'
             )
         """
         self.cursor.execute(claims_table_query)
+        # claims tables created before incident tracking lack these columns
+        self._ensure_columns(self.claims_table, {
+            "damage_category": "VARCHAR(50)",
+            "last_alert_at": "DATETIME",
+            "alert_count": "INT DEFAULT 1",
+            "incident_status": "VARCHAR(20) DEFAULT 'open'",
+        })
+        self._ensure_indexes(self.claims_table, {
+            f"idx_{self.claims_table}_filed": "(timestamp_filed)",
+        })
 
         self.conn.commit()
         self.close()
 
+    def _ensure_columns(self, table, columns):
+        self.cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+            (self.database, table)
+        )
+        existing = {row[0] for row in self.cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    def _partitions(self, cursor, table):
+        """
+        (name, upper bound as TO_DAYS or None for MAXVALUE) of each partition, in order.
+        """
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (self.database, table))
+        return [(name, None if bound == "MAXVALUE" else int(bound)) for name, bound in cursor.fetchall()]
+
+    def _partition_existing_table(self, table):
+        """
+        Convert a sensor table created before day partitioning. Rebuilds the table once; everything
+        already stored lands in p_start, which retention drops once its newest day has expired. Rows
+        without a timestamp cannot be partitioned; rather than deleting them, the conversion is refused
+        until the operator has dealt with them.
+        """
+        if self._partitions(self.cursor, table):
+            return
+        self.cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE timestamp IS NULL")
+        (undated,) = self.cursor.fetchone()
+        if undated:
+            raise RuntimeError(
+                f"Cannot partition {table} by day: {undated} rows have no timestamp. Set their timestamp or "
+                f"remove them (DELETE FROM {table} WHERE timestamp IS NULL), then start again.")
+        log.warning("Partitioning existing table %s by day; this rebuilds the table once.", table)
+        self.cursor.execute(f"""
+            ALTER TABLE {table}
+            MODIFY timestamp DATETIME NOT NULL,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, timestamp)
+        """)
+        self.cursor.execute(f"""
+            ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(timestamp)) (
+                PARTITION p_start VALUES LESS THAN ({_to_days(datetime.date.today())}),
+                PARTITION p_future VALUES LESS THAN MAXVALUE
+            )
+        """)
+
+    def ensure_partitions(self, today=None):
+        """
+        Split p_future so there is one partition per day up to partition_days_ahead days from today.
+        Returns the number of partitions added.
+        """
+        today = today or datetime.date.today()
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            bounds = [bound for _, bound in self._partitions(cursor, self.sensor_table) if bound is not None]
+            first = datetime.date.fromordinal(max(bounds) - 365) if bounds else today
+            days = [first + datetime.timedelta(days=i)
+                    for i in range((today + datetime.timedelta(days=self.partition_days_ahead) - first).days + 1)]
+            if days:
+                definitions = ", ".join(
+                    f"PARTITION p{day:%Y%m%d} VALUES LESS THAN ({_to_days(day + datetime.timedelta(days=1))})"
+                    for day in days
+                )
+                cursor.execute(f"""
+                    ALTER TABLE {self.sensor_table} REORGANIZE PARTITION p_future INTO (
+                        {definitions}, PARTITION p_future VALUES LESS THAN MAXVALUE
+                    )
+                """)
+            cursor.close()
+            return len(days)
+        finally:
+            conn.close()
+
+    def drop_partitions_before(self, cutoff_day):
+        """
+        Drop day partitions whose readings are all older than cutoff_day. Returns the dropped names.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            expired = [name for name, bound in self._partitions(cursor, self.sensor_table)
+                       if bound is not None and bound <= _to_days(cutoff_day)]
+            if expired:
+                cursor.execute(f"ALTER TABLE {self.sensor_table} DROP PARTITION {', '.join(expired)}")
+            cursor.close()
+            return expired
+        finally:
+            conn.close()
+
+    def _delete_in_batches(self, sql, params, batch_size):
+        deleted = 0
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            while True:
+                cursor.execute(f"{sql} LIMIT {int(batch_size)}", params)
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+            cursor.close()
+            return deleted
+        finally:
+            conn.close()
+
+    def delete_readings_before(self, cutoff, sensor_types=None, exclude_types=None, batch_size=5000):
+        """
+        Delete raw readings older than cutoff, limited to sensor_types or to every type not in
+        exclude_types, in batches of batch_size rows. Returns the number of rows deleted.
+        """
+        conditions, params = ["timestamp < %s"], [cutoff]
+        if sensor_types:
+            conditions.append(f"sensor_type IN ({', '.join(['%s'] * len(sensor_types))})")
+            params.extend(sensor_types)
+        if exclude_types:
+            conditions.append(f"sensor_type NOT IN ({', '.join(['%s'] * len(exclude_types))})")
+            params.extend(exclude_types)
+        return self._delete_in_batches(f"DELETE FROM {self.sensor_table} WHERE {' AND '.join(conditions)}",
+                                       tuple(params), batch_size)
+
+    def delete_rollups_before(self, suffix, cutoff, batch_size=5000):
+        return self._delete_in_batches(f"DELETE FROM {self.sensor_table}_{suffix} WHERE bucket_start < %s",
+                                       (cutoff,), batch_size)
+
+    def delete_range(self, start, end, batch_size=5000):
+        """
+        Delete raw readings with start <= timestamp < end and the rollup buckets starting in that range,
+        in batches of batch_size rows, so the range can be written again from scratch. Rollups are only
+        exact when start and end fall on hour boundaries. Returns the number of raw rows deleted.
+        """
+        deleted = self._delete_in_batches(
+            f"DELETE FROM {self.sensor_table} WHERE timestamp >= %s AND timestamp < %s", (start, end), batch_size)
+        if self.rollups:
+            for suffix, _ in ROLLUPS:
+                self._delete_in_batches(
+                    f"DELETE FROM {self.sensor_table}_{suffix} WHERE bucket_start >= %s AND bucket_start < %s",
+                    (start, end), batch_size)
+        return deleted
+
+    def _ensure_indexes(self, table, indexes):
+        self.cursor.execute(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+            (self.database, table)
+        )
+        existing = {row[0] for row in self.cursor.fetchall()}
+        for name, columns in indexes.items():
+            if name not in existing:
+                self.cursor.execute(f"CREATE INDEX {name} ON {table} {columns}")
+
     def initialize(self):
+        """
+        Create the database, tables and upcoming partitions. Returns False when MySQL cannot be reached
+        or the schema cannot be created.
+        """
         try:
             self.create_database()
             self.create_tables()
-            print("MySQL database and tables initialized successfully.")
+            self.ensure_partitions()
+            log.info("MySQL database and tables initialized successfully.")
+            return True
         except mysql.connector.Error as err:
-            print(f"Error initializing MySQL: {err}")
+            log.error("Error initializing MySQL: %s", err)
+            return False
+
+
+    def _sensor_row(self, topic, sensor_data):
+        topic_parts = topic.split('/')
+        location = topic_parts[1] if len(topic_parts) > 1 else "unknown"
+        return (
+            datetime.datetime.fromtimestamp(sensor_data.get("timestamp")),
+            topic,
+            sensor_data.get("sensor_id"),
+            sensor_data.get("type"),
+            dumps_json(sensor_data.get("value")),
+            location,
+            datetime.datetime.now()
+        )
 
+    def _sensor_insert_sql(self):
+        return f"""
+            INSERT INTO {self.sensor_table} (timestamp, topic, sensor_id, sensor_type, value, location, received_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
 
     def insert_sensor_data(self, topic, sensor_data):
+        row = self._sensor_row(topic, sensor_data)
         try:
-            conn = self.connect()
-            cursor = conn.cursor()
+            self.write_sensor_rows([row])
+        except mysql.connector.Error as err:
+            log.error("Error inserting sensor data into MySQL: %s", err)
+            self._spool_rows([row])
 
-            topic_parts = topic.split('/')
-            location = topic_parts[1] if len(topic_parts) > 1 else "unknown"
+    def _rollup_upsert_sql(self, rollup_table):
+        # last_value is assigned before last_timestamp so it still compares against the old timestamp
+        return f"""
+            INSERT INTO {rollup_table} (bucket_start, sensor_id, location, sensor_type, count, numeric_count,
+                                        sum_value, min_value, max_value, last_value, last_timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                count = count + VALUES(count),
+                numeric_count = numeric_count + VALUES(numeric_count),
+                sum_value = COALESCE(sum_value + VALUES(sum_value), sum_value, VALUES(sum_value)),
+                min_value = COALESCE(LEAST(min_value, VALUES(min_value)), min_value, VALUES(min_value)),
+                max_value = COALESCE(GREATEST(max_value, VALUES(max_value)), max_value, VALUES(max_value)),
+                last_value = IF(VALUES(last_timestamp) >= last_timestamp, VALUES(last_value), last_value),
+                last_timestamp = GREATEST(last_timestamp, VALUES(last_timestamp))
+        """
 
-            sql = f"""
-                INSERT INTO {self.sensor_table} (timestamp, topic, sensor_id, sensor_type, value, location, received_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+    @staticmethod
+    def _bucket_start(timestamp, width):
+        if width >= 3600:
+            return timestamp.replace(minute=0, second=0, microsecond=0)
+        return timestamp.replace(second=0, microsecond=0)
+
+    @staticmethod
+    def _rollup_rows(rows, width):
+        """
+        Pre-aggregate prepared sensor rows into one upsert row per (bucket, sensor_id, location, sensor_type).
+        """
+        buckets = {}
+        for timestamp, _topic, sensor_id, sensor_type, value_json, location, _received_at in rows:
+            key = (MySQLDatabaseManager._bucket_start(timestamp, width), sensor_id, location, sensor_type)
+            number = _numeric_value(value_json)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [0, 0, None, None, None, value_json, timestamp]
+            bucket[0] += 1
+            if number is not None:
+                bucket[1] += 1
+                bucket[2] = number if bucket[2] is None else bucket[2] + number
+                bucket[3] = number if bucket[3] is None else min(bucket[3], number)
+                bucket[4] = number if bucket[4] is None else max(bucket[4], number)
+            if timestamp >= bucket[6]:
+                bucket[5] = value_json
+                bucket[6] = timestamp
+        return [key + tuple(bucket) for key, bucket in buckets.items()]
+
+    def write_sensor_rows(self, rows):
+        """
+        Insert prepared sensor rows with one executemany and fold them into the rollup tables in the
+        same transaction. Raises on failure.
+        """
+        metrics.observe("backend_batch_size", len(rows), backend="mysql")
+        with metrics.timed("backend_write_seconds", backend="mysql", op="sensor_rows"):
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.executemany(self._sensor_insert_sql(), rows)
+                if self.rollups:
+                    for suffix, width in ROLLUPS:
+                        cursor.executemany(self._rollup_upsert_sql(f"{self.sensor_table}_{suffix}"),
+                                           self._rollup_rows(rows, width))
+                conn.commit()
+                cursor.close()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    @staticmethod
+    def is_permanent_error(error):
+        """
+        Whether a failed write can never succeed as it is (bad data, a violated constraint), as opposed
+        to the server being unreachable or busy.
+        """
+        return isinstance(error, (mysql.connector.DataError, mysql.connector.IntegrityError))
+
+    def pick_rollup(self, start, end, interval=None):
+        """
+        Coarsest table that can answer [start, end) bucketed by `interval` seconds: a rollup table
+        when both ends fall on its bucket boundaries and the interval is a multiple of its width,
+        otherwise the raw sensor table. Returns (table name, bucket width in seconds or None).
+        """
+        if self.rollups:
+            for suffix, width in ROLLUPS:
+                aligned = all(t == self._bucket_start(t, width) for t in (start, end))
+                if aligned and (interval is None or interval % width == 0):
+                    return f"{self.sensor_table}_{suffix}", width
+        return self.sensor_table, None
+
+    def aggregate_readings(self, start, end, interval=None, group_by=("sensor_id",), sensor_id=None, location=None,
+                           sensor_type=None):
+        """
+        count/avg/min/max of readings in [start, end), per `interval`-second bucket (one bucket for the
+        whole range when interval is None) and per group_by columns, answered from the coarsest rollup
+        that covers the range exactly. Returns dicts with period_start, the group_by columns, count,
+        avg_value, min_value and max_value; avg/min/max only consider numeric and boolean (0/1) values.
+        e.g. hourly average temperature per location:
+            aggregate_readings(start, end, interval=3600, group_by=("location",), sensor_type="temperature")
+        """
+        unknown = set(group_by) - set(GROUPABLE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot group sensor readings by {sorted(unknown)}")
+        table, width = self.pick_rollup(start, end, interval)
+        if width is None:
+            time_column = "timestamp"
+            measures = f"""
+                COUNT(*) AS count,
+                AVG({RAW_NUMERIC_VALUE}) AS avg_value,
+                MIN({RAW_NUMERIC_VALUE}) AS min_value,
+                MAX({RAW_NUMERIC_VALUE}) AS max_value
             """
-            values = (
-                datetime.datetime.fromtimestamp(sensor_data.get("timestamp")),
-                topic,
-                sensor_data.get("sensor_id"),
-                sensor_data.get("type"),
-                json.dumps(sensor_data.get("value")),
-                location,
-                datetime.datetime.now()
-            )
-            cursor.execute(sql, values)
-            conn.commit()
+        else:
+            time_column = "bucket_start"
+            measures = """
+                SUM(count) AS count,
+                SUM(sum_value) / NULLIF(SUM(numeric_count), 0) AS avg_value,
+                MIN(min_value) AS min_value,
+                MAX(max_value) AS max_value
+            """
+        if interval is None:
+            bucket = "%s"
+            bucket_params = [start]
+        else:
+            bucket = f"FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP({time_column}) / %s) * %s)"
+            bucket_params = [interval, interval]
+
+        conditions = [f"{time_column} >= %s", f"{time_column} < %s"]
+        params = [start, end]
+        for column, value in (("sensor_id", sensor_id), ("location", location), ("sensor_type", sensor_type)):
+            if value is not None:
+                conditions.append(f"{column} = %s")
+                params.append(value)
+        group_columns = "".join(f", {column}" for column in group_by)
+        sql = f"""
+            SELECT {bucket} AS period_start{group_columns}, {measures}
+            FROM {table}
+            WHERE {" AND ".join(conditions)}
+            GROUP BY period_start{group_columns}
+            ORDER BY period_start{group_columns}
+        """
+        with metrics.timed("backend_query_seconds", backend="mysql", table=table):
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(sql, bucket_params + params)
+                rows = cursor.fetchall()
+                cursor.close()
+                return rows
+            finally:
+                conn.close()
+
+    def _spool_rows(self, rows):
+        if self.spool is not None:
+            self.spool.append(rows)
+            log.info("Spooled %d sensor rows for MySQL replay.", len(rows))
+
+    def buffer_sensor_data(self, topic, sensor_data):
+        """
+        Queue a reading for the next batched insert. Flushes immediately once batch_size rows are waiting;
+        the background flusher takes care of the time threshold.
+        """
+        row = self._sensor_row(topic, sensor_data)
+        with self._buffer_lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered readings with a single multi-row executemany insert.
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if not rows:
+                return 0
+            try:
+                self.write_sensor_rows(rows)
+                return len(rows)
+            except mysql.connector.Error as err:
+                log.error("Error flushing %d sensor rows into MySQL: %s", len(rows), err)
+                self._spool_rows(rows)
+                return 0
+
+    def _flush_loop(self):
+        while not self._stop_flusher.wait(self.flush_interval / 2):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def start_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stop_flusher.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="mysql-flusher", daemon=True)
+            self._flusher.start()
+
+    def shutdown(self):
+        """
+        Stop the background flusher and write out anything still buffered.
+        """
+        self._stop_flusher.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval * 2)
+            self._flusher = None
+        flushed = self.flush()
+        if flushed:
+            log.info("Flushed %d buffered sensor rows into MySQL on shutdown.", flushed)
+
+    def upsert_claims(self, rows):
+        """
+        Write a batch of claim rows (dicts with the claims table's columns) with one executemany.
+        Rows are keyed on claim_id, so a retried or replayed batch updates claims that already exist
+        instead of duplicating them. Updates only move forward: the estimate (with its damage type and
+        description), last_alert_at and alert_count never decrease and a closed incident stays closed.
+        status and timestamp_filed are only set on insert. Raises on failure.
+        """
+        sql = f"""
+            INSERT INTO {self.claims_table} (claim_id, timestamp_filed, damage_type, estimated_cost, description, status, sensor_id, location,
+                                             damage_category, last_alert_at, alert_count, incident_status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                damage_type = IF(VALUES(estimated_cost) >= estimated_cost, VALUES(damage_type), damage_type),
+                description = IF(VALUES(estimated_cost) >= estimated_cost, VALUES(description), description),
+                estimated_cost = GREATEST(estimated_cost, VALUES(estimated_cost)),
+                last_alert_at = GREATEST(COALESCE(last_alert_at, VALUES(last_alert_at)), VALUES(last_alert_at)),
+                alert_count = GREATEST(COALESCE(alert_count, 0), VALUES(alert_count)),
+                incident_status = IF(incident_status = 'closed', incident_status, VALUES(incident_status))
+        """
+        values = [(row["claim_id"], row["timestamp_filed"], row["damage_type"], row["estimated_cost"], row["description"],
+                   row["status"], row["sensor_id"], row["location"], row["damage_category"], row["last_alert_at"],
+                   row["alert_count"], row["incident_status"]) for row in rows]
+        metrics.observe("backend_batch_size", len(values), backend="mysql")
+        with metrics.timed("backend_write_seconds", backend="mysql", op="claim_upsert"):
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.executemany(sql, values)
+                conn.commit()
+                cursor.close()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    def _stream_rows(self, sql, params, batch_size):
+        """
+        Yield the rows of a query as lists of up to batch_size dicts, read through an unbuffered cursor so
+        only one batch is held in memory however many rows match. Raises on failure.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+        finally:
+            # a consumer that stops early leaves the rest of the result on the connection
+            if conn.unread_result:
+                conn.consume_results()
             conn.close()
-        except mysql.connector.Error as err:
-            print(f"Error inserting sensor data into MySQL: {err}")
 
-    def insert_claim(self, claim_id, timestamp_filed, damage_type, estimated_cost, description, status, sensor_id, location):
+    def iter_sensor_rows(self, start, end, batch_size=10000):
+        """
+        Raw readings with start <= timestamp < end, in batches of up to batch_size dicts; see _stream_rows.
+        """
+        return self._stream_rows(f"""
+            SELECT timestamp, topic, sensor_id, sensor_type, value, location, received_at
+            FROM {self.sensor_table}
+            WHERE timestamp >= %s AND timestamp < %s
+        """, (start, end), batch_size)
+
+    def iter_claim_rows(self, start, end, batch_size=10000):
+        """
+        Claims filed with start <= timestamp_filed < end, in batches of up to batch_size dicts; see _stream_rows.
+        """
+        return self._stream_rows(f"""
+            SELECT claim_id, timestamp_filed, damage_type, damage_category, estimated_cost, description, status,
+                   sensor_id, location, last_alert_at, alert_count, incident_status
+            FROM {self.claims_table}
+            WHERE timestamp_filed >= %s AND timestamp_filed < %s
+        """, (start, end), batch_size)
+
+    def fetch_open_incidents(self, since):
+        """
+        Claims whose incident is still open and that have alerted since the given datetime.
+        """
         try:
-            conn = self.connect()
-            cursor = conn.cursor()
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(f"""
+                    SELECT claim_id, sensor_id, location, damage_category, damage_type, estimated_cost, description,
+                           timestamp_filed, last_alert_at, alert_count
+                    FROM {self.claims_table}
+                    WHERE incident_status = 'open' AND last_alert_at >= %s
+                    ORDER BY last_alert_at
+                """, (since,))
+                rows = cursor.fetchall()
+                cursor.close()
+                return rows
+            finally:
+                conn.close()
+        except mysql.connector.Error as err:
+            log.error("Error loading open incidents from MySQL: %s", err)
+            return []
 
+    def fetch_latest_readings(self, since):
+        """
+        Latest reading per sensor_id among readings since the given datetime, as dicts with sensor_id,
+        sensor_type, location, value (JSON text) and timestamp. Read from the hourly rollup when rollups
+        are kept, which holds the last value of every hour, otherwise from the raw table.
+        """
+        if self.rollups:
             sql = f"""
-                INSERT INTO {self.claims_table} (claim_id, timestamp_filed, damage_type, estimated_cost, description, status, sensor_id, location)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                SELECT sensor_id, sensor_type, location, last_value AS value, last_timestamp AS timestamp
+                FROM {self.sensor_table}_1h
+                WHERE bucket_start >= %s
+                ORDER BY last_timestamp
             """
-            values = (
-                claim_id,
-                timestamp_filed,
-                damage_type,
-                estimated_cost,
-                description,
-                status,
-                sensor_id,
-                location
-            )
-            cursor.execute(sql, values)
-            conn.commit()
-            conn.close()
-            print(f"Claim {claim_id} inserted into MySQL successfully.")
+        else:
+            sql = f"""
+                SELECT r.sensor_id, r.sensor_type, r.location, r.value, r.timestamp
+                FROM {self.sensor_table} r
+                JOIN (SELECT sensor_id, MAX(timestamp) AS timestamp FROM {self.sensor_table}
+                      WHERE timestamp >= %s GROUP BY sensor_id) latest
+                  ON r.sensor_id = latest.sensor_id AND r.timestamp = latest.timestamp
+                ORDER BY r.timestamp
+            """
+        try:
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(sql, (self._bucket_start(since, 3600) if self.rollups else since,))
+                latest = {row["sensor_id"]: row for row in cursor.fetchall()}
+                cursor.close()
+                return list(latest.values())
+            finally:
+                conn.close()
         except mysql.connector.Error as err:
-            print(f"Error inserting claim into MySQL: {err}")
+            log.error("Error loading latest readings from MySQL: %s", err)
+            return []
@@ -1,7 +1,22 @@
 from neo4j import GraphDatabase
-from neo4j.exceptions import ServiceUnavailable
+from neo4j.exceptions import AuthError, ClientError, Forbidden, ServiceUnavailable
 import datetime
-import json
+import threading
+import time
+
+from AppLogging import get_logger
+from Codecs import dumps_json
+from Metrics import metrics
+
+log = get_logger("neo4j")
+
+# how SensorEvents hang off their sensor:
+# flat      (Sensor)-[:HAS_EVENT]->(SensorEvent)
+# bucketed  (Sensor)-[:HAS_BUCKET]->(SensorEventBucket per sensor and hour/day)-[:HAS_EVENT]->(SensorEvent)
+# chain     (Sensor)-[:LATEST_EVENT]->(SensorEvent), each event linked to the next by [:NEXT]
+EVENT_MODEL_FLAT = "flat"
+EVENT_MODEL_BUCKETED = "bucketed"
+EVENT_MODEL_CHAIN = "chain"
 
 
 class Neo4jManager:
@@ -10,39 +25,118 @@ class Neo4jManager:
                  property_label="Property",
                  sensor_label="Sensor",
                  sensor_event_label="SensorEvent",
-                 damage_event_label="DamageEvent"):
+                 damage_event_label="DamageEvent",
+                 batch_size=500, flush_interval=1.0,
+                 event_model=EVENT_MODEL_FLAT, event_bucket="day", connect_timeout=30.0):
+        if event_model not in (EVENT_MODEL_FLAT, EVENT_MODEL_BUCKETED, EVENT_MODEL_CHAIN):
+            raise ValueError(f"Unknown Neo4j event model: {event_model}")
+        if event_bucket not in ("hour", "day"):
+            raise ValueError(f"Unknown Neo4j event bucket: {event_bucket}")
         self._driver = None
         self.location_label = location_label
         self.property_label = property_label
         self.sensor_label = sensor_label
         self.sensor_event_label = sensor_event_label
         self.damage_event_label = damage_event_label
+        self.bucket_label = sensor_event_label + "Bucket"
+        self.summary_label = sensor_event_label + "Summary"
+        self.event_model = event_model
+        self.event_bucket = event_bucket
 
-        try:
-            self._driver = GraphDatabase.driver(uri, auth=(user, password))
-            self._driver.verify_connectivity()
-            print("Connected to Neo4j")
-        except ServiceUnavailable as e:
-            print(f" Neo4j unavailable: {e}")
-            self._driver = None
-        except Exception as e:
-            print(f" Error connecting to Neo4j: {e}")
-            self._driver = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # sensor_id -> (location_name, property_id) already merged into the graph
+        self._registry = {}
+        self._registry_lock = threading.Lock()
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self._stop_flusher = threading.Event()
+        self.spool = None
+
+        self.uri = uri
+        self.user = user
+        self.password = password
+        self.connect_timeout = connect_timeout
+        # connected on first use (normally initialize()), so constructing the manager does no I/O
+        self._connect_lock = threading.Lock()
+
+    def _connect(self):
+        with self._connect_lock:
+            if self._driver:
+                return self._driver
+            driver = None
+            try:
+                driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password),
+                                              connection_timeout=self.connect_timeout,
+                                              connection_acquisition_timeout=self.connect_timeout)
+                driver.verify_connectivity()
+                self._driver = driver
+                log.info("Connected to Neo4j")
+            except ServiceUnavailable as e:
+                log.error("Neo4j unavailable: %s", e)
+            except Exception as e:
+                log.error("Error connecting to Neo4j: %s", e)
+            if self._driver is None and driver is not None:
+                driver.close()
+            return self._driver
 
     def close(self):
         if self._driver:
             self._driver.close()
-            print("Neo4j connection closed")
+            log.info("Neo4j connection closed")
+
+    def _schema_statements(self):
+        unique = {
+            "location_name": (self.location_label, "name"),
+            "property_id": (self.property_label, "property_id"),
+            "sensor_id": (self.sensor_label, "sensor_id"),
+            "sensor_event_bucket_id": (self.bucket_label, "bucket_id"),
+        }
+        indexes = {
+            "sensor_event_time": (self.sensor_event_label, "n.timestamp"),
+            "sensor_event_sensor_time": (self.sensor_event_label, "n.sensor_id, n.timestamp"),
+            "sensor_event_bucket_start": (self.bucket_label, "n.sensor_id, n.start"),
+            "sensor_event_summary_day": (self.summary_label, "n.sensor_id, n.day"),
+            "damage_event_claim": (self.damage_event_label, "n.claim_id"),
+            "damage_event_time": (self.damage_event_label, "n.timestamp"),
+        }
+        for name, (label, key) in unique.items():
+            yield f"CREATE CONSTRAINT {name}_unique IF NOT EXISTS FOR (n:{label}) REQUIRE n.{key} IS UNIQUE"
+        for name, (label, keys) in indexes.items():
+            yield f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON ({keys})"
+
+    def initialize(self):
+        """
+        Connect, then create the uniqueness constraints behind every topology MERGE and the indexes
+        used by event lookups, pruning and claim updates. Existing ones are left alone.
+        Returns False when Neo4j cannot be reached.
+        """
+        if not self._driver and not self._connect():
+            log.error("Neo4j driver is not initialized; skipping schema setup.")
+            return False
+        with self._driver.session() as session:
+            for statement in self._schema_statements():
+                try:
+                    session.run(statement).consume()
+                except Exception as e:
+                    # e.g. duplicate sensor_ids written before the constraint existed
+                    log.error("Error creating Neo4j schema (%s): %s", statement, e)
+        log.info("Neo4j constraints and indexes are in place.")
+        return True
 
     def _execute_query(self, query, parameters = None):
-        if not self._driver:
-            print("Neo4j driver is not initialized.")
+        if not self._driver and not self._connect():
+            log.error("Neo4j driver is not initialized.")
             return None
         try:
-            with self._driver.session() as session:
-                return session.run(query, parameters)
+            with metrics.timed("backend_write_seconds", backend="neo4j", op="query"):
+                with self._driver.session() as session:
+                    return session.run(query, parameters)
         except Exception as e:
-            print(f" Error executing Neo4J query: {e}")
+            log.error("Error executing Neo4J query: %s", e)
             return None
 
     def create_or_get_location(self, location_name):
@@ -74,7 +168,7 @@ class Neo4jManager:
         MATCH (loc:{self.location_label} {{name: $location_name}})
         MATCH (prop:{self.property_label} {{property_id: $property_id}})
         MERGE (s:{self.sensor_label} {{sensor_id: $sensor_id}})
-        ON CREATE SET s.type = $sensor_type
+        SET s.type = coalesce(s.type, $sensor_type)
         MERGE (s)-[:LOCATED_IN]->(loc)
         MERGE (loc)-[:PART_OF]->(prop)
         RETURN s, loc, prop
@@ -88,52 +182,452 @@ class Neo4jManager:
 
     def record_sensor_event(self, sensor_id, timestamp, value, event_type="reading"):
         """
-        Record a new sensor event node linked to its sensor.
+        Record a new sensor event node linked to its sensor according to the event model.
         """
         if isinstance(timestamp, (int, float)):
             timestamp = datetime.datetime.fromtimestamp(timestamp).isoformat()
+        if not self._driver and not self._connect():
+            log.error("Neo4j driver is not initialized.")
+            return None
+        row = {"sensor_id": sensor_id, "timestamp": timestamp, "value": dumps_json(value), "event_type": event_type}
+        try:
+            with metrics.timed("backend_write_seconds", backend="neo4j", op="query"):
+                with self._driver.session() as session:
+                    session.execute_write(lambda tx: tx.run(*self._event_statement([row])).consume())
+        except Exception as e:
+            log.error("Error executing Neo4J query: %s", e)
+            return None
+        return row
 
+    def write_damage_events(self, rows):
+        """
+        MERGE one damage event per claim in a single transaction, linked to its sensor. Each row is a
+        dict with claim_id, sensor_id, damage_type, estimated_cost, description and timestamp_event
+        (epoch seconds). Keyed on claim_id, so retrying a batch updates rather than duplicates; an
+        older, lower estimate never replaces a higher one. A sensor first seen here is created without
+        a type, which its next event batch fills in. Raises on failure.
+        """
+        if not self._driver and not self._connect():
+            raise ServiceUnavailable("Neo4j driver is not initialized.")
         query = f"""
-        MATCH (s:{self.sensor_label} {{sensor_id: $sensor_id}})
+        UNWIND $rows AS row
+        MERGE (s:{self.sensor_label} {{sensor_id: row.sensor_id}})
+        MERGE (d:{self.damage_event_label} {{claim_id: row.claim_id}})
+        ON CREATE SET d.timestamp = datetime(row.timestamp)
+        MERGE (s)-[:CAUSED]->(d)
+        WITH d, row
+        WHERE d.estimated_cost IS NULL OR row.estimated_cost >= d.estimated_cost
+        SET d.type = row.damage_type, d.estimated_cost = row.estimated_cost, d.description = row.description
+        """
+        event_rows = [{"claim_id": row["claim_id"], "sensor_id": row["sensor_id"], "damage_type": row["damage_type"],
+                       "estimated_cost": float(row["estimated_cost"]), "description": row["description"],
+                       "timestamp": datetime.datetime.fromtimestamp(row["timestamp_event"]).isoformat()}
+                      for row in rows]
+        metrics.observe("backend_batch_size", len(event_rows), backend="neo4j")
+        with metrics.timed("backend_write_seconds", backend="neo4j", op="damage_events"):
+            with self._driver.session() as session:
+                session.execute_write(lambda tx: tx.run(query, {"rows": event_rows}).consume())
+        return len(event_rows)
+
+    def prune_sensor_events(self, cutoff, sensor_types=None, exclude_types=None, batch_size=5000, compact=False):
+        """
+        Remove SensorEvents older than cutoff from sensors of sensor_types (or of every type not in
+        exclude_types), batch_size events per transaction. With compact, each batch is first folded
+        into one SensorEventSummary per sensor and day (count, first and last timestamp).
+        Events are found through the timestamp index whatever the event model; events written before
+        they carried a sensor_id are found through HAS_EVENT. Buckets left empty are removed too.
+        Only SensorEvent nodes are matched, so DamageEvents and their claims are never touched.
+        Returns the number of events removed.
+        """
+        if not self._driver and not self._connect():
+            raise ServiceUnavailable("Neo4j driver is not initialized.")
+        if isinstance(cutoff, datetime.datetime):
+            cutoff = cutoff.isoformat()
+        type_condition = None
+        if sensor_types:
+            type_condition = "s.type IN $sensor_types"
+        elif exclude_types:
+            type_condition = "NOT s.type IN $exclude_types"
+        matches = [
+            f"""
+            MATCH (e:{self.sensor_event_label})
+            WHERE e.timestamp < datetime($cutoff) AND e.sensor_id IS NOT NULL
+            MATCH (s:{self.sensor_label} {{sensor_id: e.sensor_id}})
+            {f"WHERE {type_condition}" if type_condition else ""}
+            WITH s, e LIMIT $batch_size
+            """,
+            f"""
+            MATCH (s:{self.sensor_label})-[:HAS_EVENT]->(e:{self.sensor_event_label})
+            WHERE e.timestamp < datetime($cutoff) AND e.sensor_id IS NULL {f"AND {type_condition}" if type_condition else ""}
+            WITH s, e LIMIT $batch_size
+            """,
+        ]
+        if compact:
+            action = f"""
+            WITH s, date(e.timestamp) AS day, collect(e) AS events
+            MERGE (s)-[:HAS_SUMMARY]->(d:{self.summary_label} {{sensor_id: s.sensor_id, day: day}})
+            ON CREATE SET d.count = 0
+            WITH d, events,
+                 reduce(t = events[0].timestamp, x IN events | CASE WHEN x.timestamp < t THEN x.timestamp ELSE t END) AS first,
+                 reduce(t = events[0].timestamp, x IN events | CASE WHEN x.timestamp > t THEN x.timestamp ELSE t END) AS last
+            SET d.count = d.count + size(events),
+                d.first_timestamp = CASE WHEN d.first_timestamp IS NULL OR first < d.first_timestamp THEN first ELSE d.first_timestamp END,
+                d.last_timestamp = CASE WHEN d.last_timestamp IS NULL OR last > d.last_timestamp THEN last ELSE d.last_timestamp END
+            FOREACH (x IN events | DETACH DELETE x)
+            RETURN sum(size(events)) AS removed
+            """
+        else:
+            action = """
+            DETACH DELETE e
+            RETURN count(*) AS removed
+            """
+        parameters = {"cutoff": cutoff, "sensor_types": list(sensor_types or []),
+                      "exclude_types": list(exclude_types or []), "batch_size": batch_size}
+        removed = sum(self._run_in_batches(match + action, parameters, batch_size) for match in matches)
+        self._run_in_batches(f"""
+            MATCH (b:{self.bucket_label})
+            WHERE b.start < datetime($cutoff) AND NOT (b)-[:HAS_EVENT]->()
+            WITH b LIMIT $batch_size
+            DETACH DELETE b
+            RETURN count(*) AS removed
+            """, parameters, batch_size)
+        return removed
+
+    def delete_sensor_events_between(self, start, end, batch_size=5000):
+        """
+        Remove SensorEvents with start <= timestamp < end, batch_size per transaction, and the buckets
+        they leave empty, so the range can be written again from scratch. Meant for the flat and
+        bucketed models; removing events from the middle of a chain breaks its NEXT links.
+        Returns the number of events removed.
+        """
+        if not self._driver and not self._connect():
+            raise ServiceUnavailable("Neo4j driver is not initialized.")
+        if isinstance(start, datetime.datetime):
+            start = start.isoformat()
+        if isinstance(end, datetime.datetime):
+            end = end.isoformat()
+        parameters = {"start": start, "end": end, "batch_size": batch_size}
+        removed = self._run_in_batches(f"""
+            MATCH (e:{self.sensor_event_label})
+            WHERE e.timestamp >= datetime($start) AND e.timestamp < datetime($end)
+            WITH e LIMIT $batch_size
+            DETACH DELETE e
+            RETURN count(*) AS removed
+            """, parameters, batch_size)
+        self._run_in_batches(f"""
+            MATCH (b:{self.bucket_label})
+            WHERE b.start >= datetime.truncate('{self.event_bucket}', datetime($start)) AND b.start < datetime($end)
+              AND NOT (b)-[:HAS_EVENT]->()
+            WITH b LIMIT $batch_size
+            DETACH DELETE b
+            RETURN count(*) AS removed
+            """, parameters, batch_size)
+        return removed
+
+    def _run_in_batches(self, query, parameters, batch_size):
+        """
+        Re-run a write query returning `removed` until a run removes fewer than batch_size.
+        """
+        removed = 0
+        while True:
+            with self._driver.session() as session:
+                record = session.execute_write(lambda tx: tx.run(query, parameters).single())
+            batch = (record["removed"] if record is not None else 0) or 0
+            removed += batch
+            if batch < batch_size:
+                return removed
+
+    def _event_records(self, query, parameters):
+        if not self._driver and not self._connect():
+            raise ServiceUnavailable("Neo4j driver is not initialized.")
+        with metrics.timed("backend_query_seconds", backend="neo4j", table=self.sensor_event_label):
+            with self._driver.session() as session:
+                return session.execute_read(lambda tx: [
+                    {"timestamp": record["timestamp"].to_native(), "value": record["value"], "type": record["type"]}
+                    for record in tx.run(query, parameters)
+                ])
+
+    def latest_sensor_events(self, sensor_id, limit=10):
+        """
+        The most recent `limit` events of a sensor, newest first, as dicts with timestamp, value (JSON
+        text) and type. Bucketed and chained models only touch the newest buckets or chain links.
+        """
+        limit = int(limit)
+        if limit <= 0:
+            return []
+        event = "RETURN e.timestamp AS timestamp, e.value AS value, e.type AS type"
+        if self.event_model == EVENT_MODEL_CHAIN:
+            query = f"""
+            MATCH (:{self.sensor_label} {{sensor_id: $sensor_id}})-[:LATEST_EVENT]->(last:{self.sensor_event_label})
+            MATCH path = (e:{self.sensor_event_label})-[:NEXT*0..{limit - 1}]->(last)
+            WITH e, length(path) AS distance
+            ORDER BY distance
+            {event}
+            """
+        elif self.event_model == EVENT_MODEL_BUCKETED:
+            query = f"""
+            MATCH (b:{self.bucket_label})
+            WHERE b.sensor_id = $sensor_id AND b.start IS NOT NULL
+            WITH b ORDER BY b.start DESC LIMIT $limit
+            MATCH (b)-[:HAS_EVENT]->(e:{self.sensor_event_label})
+            WITH e ORDER BY e.timestamp DESC LIMIT $limit
+            {event}
+            """
+        else:
+            query = f"""
+            MATCH (e:{self.sensor_event_label})
+            WHERE e.sensor_id = $sensor_id AND e.timestamp IS NOT NULL
+            WITH e ORDER BY e.timestamp DESC LIMIT $limit
+            {event}
+            """
+        return self._event_records(query, {"sensor_id": sensor_id, "limit": limit})
+
+    def sensor_events_between(self, sensor_id, start, end):
+        """
+        Events of a sensor with start <= timestamp < end, oldest first. The bucketed model narrows the
+        search to the buckets overlapping the range; the others use the (sensor_id, timestamp) index.
+        """
+        if isinstance(start, datetime.datetime):
+            start = start.isoformat()
+        if isinstance(end, datetime.datetime):
+            end = end.isoformat()
+        in_range = "e.timestamp >= datetime($start) AND e.timestamp < datetime($end)"
+        if self.event_model == EVENT_MODEL_BUCKETED:
+            query = f"""
+            MATCH (b:{self.bucket_label})
+            WHERE b.sensor_id = $sensor_id
+              AND b.start >= datetime.truncate('{self.event_bucket}', datetime($start)) AND b.start < datetime($end)
+            MATCH (b)-[:HAS_EVENT]->(e:{self.sensor_event_label})
+            WHERE {in_range}
+            """
+        else:
+            query = f"""
+            MATCH (e:{self.sensor_event_label})
+            WHERE e.sensor_id = $sensor_id AND {in_range}
+            """
+        query += "RETURN e.timestamp AS timestamp, e.value AS value, e.type AS type ORDER BY e.timestamp"
+        return self._event_records(query, {"sensor_id": sensor_id, "start": start, "end": end})
+
+    def invalidate_sensor(self, sensor_id=None):
+        """
+        Forget registered topology for one sensor, or for all sensors when sensor_id is None.
+        """
+        with self._registry_lock:
+            if sensor_id is None:
+                self._registry.clear()
+            else:
+                self._registry.pop(sensor_id, None)
+
+    def _topology_rows(self, rows):
+        """
+        Pick the sensors whose location/property triple is not yet known to be in the graph.
+        A sensor reported under a new location is returned again so it gets re-linked.
+        """
+        pending = {}
+        with self._registry_lock:
+            for row in rows:
+                known = self._registry.get(row["sensor_id"])
+                if known != (row["location_name"], row["property_id"]):
+                    pending[row["sensor_id"]] = row
+        return list(pending.values())
+
+    def _register_topology(self, topology_rows):
+        with self._registry_lock:
+            for row in topology_rows:
+                self._registry[row["sensor_id"]] = (row["location_name"], row["property_id"])
+
+    @staticmethod
+    def _event_rows(rows):
+        event_rows = []
+        for row in rows:
+            timestamp = row["timestamp"]
+            if isinstance(timestamp, (int, float)):
+                timestamp = datetime.datetime.fromtimestamp(timestamp).isoformat()
+            event_rows.append({
+                "sensor_id": row["sensor_id"],
+                "timestamp": timestamp,
+                "value": dumps_json(row["value"]),
+                "event_type": row.get("event_type", "reading")
+            })
+        return event_rows
+
+    def _batch_statements(self, topology_rows, event_rows):
+        """
+        (query, parameters) pairs that write one batch; run in order within a single transaction.
+        """
+        statements = []
+        if topology_rows:
+            statements.append((f"""
+            UNWIND $rows AS row
+            MERGE (loc:{self.location_label} {{name: row.location_name}})
+            MERGE (prop:{self.property_label} {{property_id: row.property_id}})
+            ON CREATE SET prop.address = ""
+            MERGE (loc)-[:PART_OF]->(prop)
+            MERGE (s:{self.sensor_label} {{sensor_id: row.sensor_id}})
+            SET s.type = coalesce(s.type, row.sensor_type)
+            WITH s, loc
+            OPTIONAL MATCH (s)-[old:LOCATED_IN]->(other)
+            WHERE other <> loc
+            WITH s, loc, collect(old) AS stale
+            FOREACH (r IN stale | DELETE r)
+            MERGE (s)-[:LOCATED_IN]->(loc)
+            """, {"rows": topology_rows}))
+        statements.append(self._event_statement(event_rows))
+        return statements
+
+    def _write_batch(self, tx, topology_rows, event_rows):
+        for query, parameters in self._batch_statements(topology_rows, event_rows):
+            tx.run(query, parameters).consume()
+
+    def _event_statement(self, event_rows):
+        if self.event_model == EVENT_MODEL_CHAIN:
+            return self._event_chain_statement(event_rows)
+        if self.event_model == EVENT_MODEL_BUCKETED:
+            attach = f"""
+            WITH s, row, datetime(row.timestamp) AS ts
+            WITH s, row, ts, datetime.truncate('{self.event_bucket}', ts) AS start
+            MERGE (b:{self.bucket_label} {{bucket_id: row.sensor_id + '|' + toString(start)}})
+            ON CREATE SET b.sensor_id = row.sensor_id, b.start = start
+            MERGE (s)-[:HAS_BUCKET]->(b)
+            WITH b AS parent, row, ts
+            """
+        else:
+            attach = "WITH s AS parent, row, datetime(row.timestamp) AS ts"
+        return f"""
+        UNWIND $rows AS row
+        MATCH (s:{self.sensor_label} {{sensor_id: row.sensor_id}})
+        {attach}
         CREATE (e:{self.sensor_event_label} {{
-            timestamp: datetime($timestamp),
-            value: $value,
-            type: $event_type
+            sensor_id: row.sensor_id,
+            timestamp: ts,
+            value: row.value,
+            type: row.event_type
         }})
-        CREATE (s)-[:HAS_EVENT]->(e)
-        RETURN e
+        CREATE (parent)-[:HAS_EVENT]->(e)
+        """, {"rows": event_rows}
+
+    def _event_chain_statement(self, event_rows):
         """
-        return self._execute_query(query, {
-            "sensor_id": sensor_id,
-            "timestamp": timestamp,
-            "value": json.dumps(value),
-            "event_type": event_type
-        })
+        Append each sensor's events, in timestamp order, after its LATEST_EVENT and move the pointer.
+        Setting last_event_at first takes the sensor's write lock, so concurrent batches for the same
+        sensor append one after the other instead of forking the chain.
+        """
+        by_sensor = {}
+        for row in sorted(event_rows, key=lambda r: r["timestamp"]):
+            by_sensor.setdefault(row["sensor_id"], []).append(row)
+        sensors = [{"sensor_id": sensor_id, "events": events} for sensor_id, events in by_sensor.items()]
+        return f"""
+        UNWIND $sensors AS row
+        MATCH (s:{self.sensor_label} {{sensor_id: row.sensor_id}})
+        SET s.last_event_at = datetime(row.events[-1].timestamp)
+        WITH s, row
+        OPTIONAL MATCH (s)-[old:LATEST_EVENT]->(previous:{self.sensor_event_label})
+        WITH s, row, old, previous
+        UNWIND row.events AS event
+        CREATE (e:{self.sensor_event_label} {{
+            sensor_id: row.sensor_id,
+            timestamp: datetime(event.timestamp),
+            value: event.value,
+            type: event.event_type
+        }})
+        WITH s, old, previous, collect(e) AS created
+        FOREACH (i IN range(0, size(created) - 2) |
+            FOREACH (a IN [created[i]] | FOREACH (b IN [created[i + 1]] | CREATE (a)-[:NEXT]->(b))))
+        FOREACH (p IN CASE WHEN previous IS NULL THEN [] ELSE [previous] END | CREATE (p)-[:NEXT]->(head(created)))
+        FOREACH (r IN CASE WHEN old IS NULL THEN [] ELSE [old] END | DELETE r)
+        WITH s, created
+        CREATE (s)-[:LATEST_EVENT]->(last(created))
+        """, {"sensors": sensors}
 
-    def create_damage_event(self, sensor_id, damage_type, estimated_cost, description, timestamp, claim_id=None):
+    def write_sensor_events(self, rows):
         """
-        Create a damage event node linked to the sensor.
+        Write a batch of readings in one transaction. Each row is a dict with sensor_id, sensor_type,
+        location_name, property_id, timestamp, value and optionally event_type.
+        Topology MERGEs are only sent for sensors not already in the registry cache. Raises on failure,
+        reconnecting first if the driver was never established.
         """
-        if isinstance(timestamp, (int, float)):
-            timestamp = datetime.datetime.fromtimestamp(timestamp).isoformat()
+        if not self._driver and not self._connect():
+            raise ServiceUnavailable("Neo4j driver is not initialized.")
 
-        query = f"""
-        MATCH (s:{self.sensor_label} {{sensor_id: $sensor_id}})
-        CREATE (d:{self.damage_event_label} {{
-            type: $damage_type,
-            estimated_cost: $estimated_cost,
-            description: $description,
-            timestamp: datetime($timestamp),
-            claim_id: $claim_id
-        }})
-        CREATE (s)-[:CAUSED]->(d)
-        RETURN d
+        event_rows = self._event_rows(rows)
+        topology_rows = self._topology_rows(rows)
+
+        metrics.observe("backend_batch_size", len(event_rows), backend="neo4j")
+        with metrics.timed("backend_write_seconds", backend="neo4j", op="sensor_events"):
+            with self._driver.session() as session:
+                session.execute_write(self._write_batch, topology_rows, event_rows)
+
+        self._register_topology(topology_rows)
+        return len(event_rows)
+
+    @staticmethod
+    def is_permanent_error(error):
         """
-        return self._execute_query(query, {
+        Whether a failed write can never succeed as it is: the server rejected the statement or its data
+        (a ClientError such as a constraint violation), but not over credentials or permissions.
+        """
+        return isinstance(error, ClientError) and not isinstance(error, (AuthError, Forbidden))
+
+    def store_sensor_events(self, rows):
+        """
+        Like write_sensor_events, but failed batches are printed and spooled for replay instead of raised.
+        """
+        if not rows:
+            return 0
+        try:
+            return self.write_sensor_events(rows)
+        except Exception as e:
+            log.error("Error writing %d sensor events to Neo4j: %s", len(rows), e)
+            if self.spool is not None:
+                self.spool.append(rows)
+                log.info("Spooled %d sensor events for Neo4j replay.", len(rows))
+            return 0
+
+    def buffer_sensor_event(self, sensor_id, sensor_type, location_name, property_id, timestamp, value, event_type="reading"):
+        """
+        Queue a reading for the next store_sensor_events batch.
+        """
+        row = {
             "sensor_id": sensor_id,
-            "damage_type": damage_type,
-            "estimated_cost": float(estimated_cost),
-            "description": description,
+            "sensor_type": sensor_type,
+            "location_name": location_name,
+            "property_id": property_id,
             "timestamp": timestamp,
-            "claim_id": claim_id
-        })
\ No newline at end of file
+            "value": value,
+            "event_type": event_type
+        }
+        with self._buffer_lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._buffer_lock:
+                rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            return self.store_sensor_events(rows)
+
+    def _flush_loop(self):
+        while not self._stop_flusher.wait(self.flush_interval / 2):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def start_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stop_flusher.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="neo4j-flusher", daemon=True)
+            self._flusher.start()
+
+    def shutdown(self):
+        """
+        Stop the background flusher and write out anything still buffered.
+        """
+        self._stop_flusher.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval * 2)
+            self._flusher = None
+        flushed = self.flush()
+        if flushed:
+            log.info("Flushed %d buffered sensor events into Neo4j on shutdown.", flushed)
@@ -0,0 +1,241 @@
+import os
+import queue
+import threading
+import time
+
+from AppLogging import get_logger
+from Metrics import metrics
+from Spool import Spool
+
+log = get_logger("pipeline")
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_SPILL = "spill"
+
+
+class Stage:
+    """
+    A bounded queue drained by its own pool of worker threads.
+    When the queue is full, items are handled according to the overflow policy:
+    block the producer, drop the oldest queued item, or spill to an on-disk spool
+    that workers re-read once the queue has drained.
+    With max_batch > 1 the handler is called with lists (topics, readings) of up to max_batch
+    items that were already waiting in the queue.
+    An accept(topic, sensor_data) predicate, run by the producer, keeps readings it rejects out of the
+    queue altogether; they are counted as suppressed.
+    """
+
+    def __init__(self, name, handler, workers=1, max_size=10000, overflow=OVERFLOW_BLOCK, spill_dir="spill",
+                 max_batch=1, accept=None):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.max_batch = max_batch
+        self.accept = accept
+        self.overflow = overflow
+        self.spill_dir = os.path.join(spill_dir, name)
+        self._spool = Spool(self.spill_dir) if overflow == OVERFLOW_SPILL else None
+        self._queue = queue.Queue(maxsize=max_size)
+        self._threads = []
+        self._stop = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.suppressed = 0
+        self.unrouted = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def skip(self):
+        """
+        Count a reading that the routing table did not send to this stage.
+        """
+        with self._stats_lock:
+            self.unrouted += 1
+
+    def put(self, topic, sensor_data):
+        if self.accept is not None and not self.accept(topic, sensor_data):
+            with self._stats_lock:
+                self.suppressed += 1
+            return
+        item = (time.monotonic(), topic, sensor_data)
+        if self.overflow == OVERFLOW_BLOCK:
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._drop_oldest_and_put(item)
+                else:
+                    self._spill(topic, sensor_data)
+                    return
+        with self._stats_lock:
+            self.enqueued += 1
+
+    def _drop_oldest_and_put(self, item):
+        while True:
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                with self._stats_lock:
+                    self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                continue
+
+    def _spill(self, topic, sensor_data):
+        self._spool.append([{"topic": topic, "sensor_data": sensor_data}])
+        with self._stats_lock:
+            self.spilled += 1
+
+    def _reload_spill(self):
+        """
+        Move spilled items back onto the queue as far as there is room.
+        Returns the number of items moved.
+        """
+        with self._spill_lock:
+            room = self._queue.maxsize - self._queue.qsize()
+            if room <= 0:
+                return 0
+            records, position = self._spool.read_batch(room)
+            if not records:
+                return 0
+            moved = 0
+            for record in records:
+                try:
+                    self._queue.put_nowait((time.monotonic(), record["topic"], record["sensor_data"]))
+                except queue.Full:
+                    break
+                moved += 1
+            if moved < len(records):
+                # a producer took the room meanwhile; the rest stays in the spool, still ahead of later spills
+                position = self._spool.read_batch(moved)[1]
+            self._spool.commit(position)
+        with self._stats_lock:
+            self.enqueued += moved
+        return moved
+
+    def _run(self):
+        while True:
+            if self._spool is not None and self._queue.empty() and self._spool.has_pending():
+                self._reload_spill()
+            try:
+                enqueued_at, topic, sensor_data = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.overflow == OVERFLOW_SPILL and self._reload_spill():
+                    continue
+                if self._stop.is_set():
+                    return
+                continue
+            items = [(enqueued_at, topic, sensor_data)]
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lag = time.monotonic() - enqueued_at
+            metrics.observe("stage_queue_wait_seconds", lag, stage=self.name)
+            try:
+                with metrics.timed("stage_handler_seconds", stage=self.name):
+                    if self.max_batch > 1:
+                        self.handler([item[1] for item in items], [item[2] for item in items])
+                    else:
+                        self.handler(topic, sensor_data)
+            except Exception as e:
+                log.error("[%s] Error handling message from %s: %s", self.name, topic, e)
+                with self._stats_lock:
+                    self.errors += 1
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+            with self._stats_lock:
+                self.processed += len(items)
+                self.last_lag = lag
+                if lag > self.max_lag:
+                    self.max_lag = lag
+
+    def stop(self, timeout=5.0):
+        """
+        Let workers drain what is queued (and spilled), then stop them.
+        Anything still spilled at the timeout stays on disk for the next start.
+        """
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._threads = []
+        if self._spool is not None:
+            self._spool.close()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "suppressed": self.suppressed,
+                "unrouted": self.unrouted,
+                "errors": self.errors,
+                "last_lag_seconds": self.last_lag,
+                "max_lag_seconds": self.max_lag,
+            }
+
+
+class IngestPipeline:
+    """
+    Fans every decoded reading out to independent stages so a slow backend only backs up its own queue.
+    With a route(topic, sensor_type) callable returning stage names, a reading only goes to those stages.
+    """
+
+    def __init__(self, route=None):
+        self.stages = {}
+        self.route = route
+
+    def add_stage(self, name, handler, workers=1, max_size=10000, overflow=OVERFLOW_BLOCK, spill_dir="spill",
+                  max_batch=1, accept=None):
+        self.stages[name] = Stage(name, handler, workers, max_size, overflow, spill_dir, max_batch, accept)
+        return self.stages[name]
+
+    def start(self):
+        for stage in self.stages.values():
+            stage.start()
+
+    def submit(self, topic, sensor_data):
+        if self.route is None:
+            for stage in self.stages.values():
+                stage.put(topic, sensor_data)
+            return
+        destinations = self.route(topic, sensor_data["type"])
+        for name, stage in self.stages.items():
+            if name in destinations:
+                stage.put(topic, sensor_data)
+            else:
+                stage.skip()
+
+    def stop(self, timeout=5.0):
+        for stage in self.stages.values():
+            stage.stop(timeout)
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
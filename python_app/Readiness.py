@@ -0,0 +1,131 @@
+import threading
+import time
+
+from AppLogging import get_logger
+
+log = get_logger("startup")
+
+STATE_PENDING = "pending"
+STATE_CONNECTING = "connecting"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+class BackendState:
+    __slots__ = ("name", "state", "attempts", "error", "started_at", "ready_at", "event")
+
+    def __init__(self, name):
+        self.name = name
+        self.state = STATE_PENDING
+        self.attempts = 0
+        self.error = None
+        self.started_at = None
+        self.ready_at = None
+        self.event = threading.Event()
+
+    def to_dict(self, now):
+        started = self.started_at if self.started_at is not None else now
+        return {"state": self.state, "attempts": self.attempts, "error": self.error,
+                "seconds": round((self.ready_at if self.ready_at is not None else now) - started, 3)}
+
+
+class Readiness:
+    """
+    Brings backends up on their own daemon threads so a slow or unreachable store neither delays the
+    others nor the MQTT subscription. start(name, bootstrap) calls bootstrap() until it returns True,
+    backing off between failed attempts, so every attempt should be bounded by the driver's connect
+    timeout. Callbacks registered with on_ready run once all the backends they name are ready.
+    """
+
+    def __init__(self, retry_backoff=1.0, max_backoff=30.0, warn_after=30.0):
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.warn_after = warn_after
+        self._backends = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self, name, bootstrap):
+        with self._lock:
+            backend = self._backends.setdefault(name, BackendState(name))
+        backend.started_at = time.monotonic()
+        threading.Thread(target=self._bring_up, args=(backend, bootstrap), name=f"{name}-init", daemon=True).start()
+
+    def _bring_up(self, backend, bootstrap):
+        backoff = self.retry_backoff
+        warned = False
+        while not self._stop.is_set():
+            backend.state = STATE_CONNECTING
+            backend.attempts += 1
+            try:
+                ok = bootstrap()
+                backend.error = None if ok else "bootstrap failed"
+            except Exception as e:
+                ok = False
+                backend.error = str(e)
+            if ok:
+                backend.ready_at = time.monotonic()
+                backend.state = STATE_READY
+                backend.event.set()
+                log.info("%s ready after %.2fs (%d attempts)", backend.name, backend.ready_at - backend.started_at,
+                         backend.attempts)
+                self._run_callbacks()
+                return
+            backend.state = STATE_FAILED
+            if not warned and time.monotonic() - backend.started_at >= self.warn_after:
+                log.warning("%s still not ready after %.0fs: %s", backend.name, self.warn_after, backend.error)
+                warned = True
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def on_ready(self, names, callback):
+        """
+        Run callback() once every backend in names is ready: right away if they already are, else
+        on the thread of the last one to come up.
+        """
+        with self._lock:
+            self._callbacks.append((tuple(names), callback))
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        with self._lock:
+            due = [(names, callback) for names, callback in self._callbacks if all(self.is_ready(n) for n in names)]
+            self._callbacks = [item for item in self._callbacks if item not in due]
+        for names, callback in due:
+            try:
+                callback()
+            except Exception as e:
+                log.error("Startup step after %s failed: %s", ", ".join(names), e)
+
+    def is_ready(self, name):
+        backend = self._backends.get(name)
+        return backend is not None and backend.state == STATE_READY
+
+    def wait(self, names=None, timeout=None):
+        """
+        Wait until the named backends (all started ones by default) are ready or timeout seconds pass.
+        Returns True when they all are.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in names or list(self._backends):
+            backend = self._backends.get(name)
+            if backend is None:
+                return False
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not backend.event.wait(remaining):
+                return False
+        return True
+
+    def ready(self):
+        return bool(self._backends) and all(b.state == STATE_READY for b in self._backends.values())
+
+    def report(self):
+        """
+        (all backends ready, {name: {"state", "attempts", "error", "seconds"}}), as served on /ready and /health.
+        """
+        now = time.monotonic()
+        return self.ready(), {name: backend.to_dict(now) for name, backend in self._backends.items()}
+
+    def stop(self):
+        self._stop.set()
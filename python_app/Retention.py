@@ -0,0 +1,121 @@
+import datetime
+import threading
+
+from AppLogging import get_logger
+
+log = get_logger("retention")
+
+
+class RetentionPolicy:
+    """
+    Days of raw readings to keep per sensor type, with a default for types not listed.
+    """
+
+    def __init__(self, default_days, days_by_type=None, rollup_days=None):
+        self.default_days = default_days
+        self.days_by_type = dict(days_by_type or {})
+        self.rollup_days = dict(rollup_days or {})
+
+    @property
+    def max_days(self):
+        return max([self.default_days] + list(self.days_by_type.values()))
+
+    def shorter_than_max(self):
+        """
+        Yield (sensor_types, exclude_types, days) for every group of types that must be pruned before
+        the longest retention expires: each listed type on its own, then all unlisted types together.
+        """
+        longest = self.max_days
+        for sensor_type, days in sorted(self.days_by_type.items()):
+            if days < longest:
+                yield [sensor_type], None, days
+        if self.default_days < longest:
+            yield None, sorted(self.days_by_type), self.default_days
+
+
+def apply_retention(policy, mysql_manager=None, mongo_manager=None, neo4j_manager=None, batch_size=5000,
+                    compact_events=False, now=None):
+    """
+    One retention pass over the stores that are given:
+    - MySQL: new day partitions are created ahead, whole partitions older than the longest retention are
+      dropped, shorter-lived types are deleted in batches, and rollups are pruned per tier;
+    - MongoDB: the _received_at TTL index expires everything after the longest retention, shorter-lived
+      types are deleted in batches;
+    - Neo4j: SensorEvents are pruned (or compacted) per type in bounded transactions.
+    Claims and DamageEvents are never touched. Returns a dict of counts per store.
+    """
+    now = now or datetime.datetime.now()
+    longest_cutoff = now - datetime.timedelta(days=policy.max_days)
+    groups = list(policy.shorter_than_max())
+    summary = {}
+
+    if mysql_manager is not None:
+        mysql_manager.ensure_partitions(now.date())
+        dropped = mysql_manager.drop_partitions_before(longest_cutoff.date())
+        deleted = 0
+        for sensor_types, exclude_types, days in groups:
+            deleted += mysql_manager.delete_readings_before(now - datetime.timedelta(days=days), sensor_types,
+                                                            exclude_types, batch_size)
+        for suffix, days in policy.rollup_days.items():
+            deleted += mysql_manager.delete_rollups_before(suffix, now - datetime.timedelta(days=days), batch_size)
+        summary["mysql"] = {"partitions_dropped": len(dropped), "rows_deleted": deleted}
+
+    if mongo_manager is not None:
+        mongo_manager.ensure_ttl(policy.max_days * 86400)
+        deleted = 0
+        for sensor_types, exclude_types, days in groups:
+            deleted += mongo_manager.delete_readings_before(now - datetime.timedelta(days=days), sensor_types,
+                                                            exclude_types, batch_size)
+        summary["mongo"] = {"documents_deleted": deleted}
+
+    if neo4j_manager is not None:
+        removed = neo4j_manager.prune_sensor_events(longest_cutoff, batch_size=batch_size, compact=compact_events)
+        for sensor_types, exclude_types, days in groups:
+            removed += neo4j_manager.prune_sensor_events(now - datetime.timedelta(days=days), sensor_types,
+                                                         exclude_types, batch_size, compact_events)
+        summary["neo4j"] = {"events_removed": removed}
+    return summary
+
+
+class RetentionJob:
+    """
+    Runs apply_retention every interval seconds on a daemon thread. A failing store is logged and
+    skipped until the next run; the other stores are still pruned.
+    """
+
+    def __init__(self, policy, mysql_manager, mongo_manager, neo4j_manager, interval=3600.0, batch_size=5000,
+                 compact_events=False):
+        self.policy = policy
+        self.stores = {"mysql": mysql_manager, "mongo": mongo_manager, "neo4j": neo4j_manager}
+        self.interval = interval
+        self.batch_size = batch_size
+        self.compact_events = compact_events
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        for name, manager in self.stores.items():
+            try:
+                summary = apply_retention(self.policy, batch_size=self.batch_size, compact_events=self.compact_events,
+                                          **{f"{name}_manager": manager})
+                log.info("%s retention: %s", name, summary.get(name))
+            except Exception as e:
+                log.error("%s retention failed: %s", name, e)
+
+    def _loop(self):
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+
+from AppLogging import get_logger
+from Metrics import metrics
+
+log = get_logger("routing")
+
+DESTINATIONS = ("mysql", "mongo", "neo4j", "analysis")
+
+
+class RouteRule:
+    __slots__ = ("topic_filter", "types", "destinations")
+
+    def __init__(self, topic_filter, types, destinations):
+        unknown = set(destinations) - set(DESTINATIONS)
+        if unknown:
+            raise ValueError(f"Unknown routing destination(s) {', '.join(sorted(unknown))} for {topic_filter}")
+        self.topic_filter = topic_filter
+        # None matches every sensor type
+        self.types = frozenset(types) if types else None
+        self.destinations = frozenset(destinations)
+
+
+class _TrieNode:
+    __slots__ = ("children", "rules")
+
+    def __init__(self):
+        self.children = {}
+        # (rule index, rule) of the filters ending here
+        self.rules = []
+
+
+class TopicTrie:
+    """
+    MQTT topic filters stored level by level, "+" and "#" as ordinary child keys. A lookup follows
+    the topic's own level, "+" and "#" at each step, so its cost depends on the topic depth and the
+    wildcards in use, not on how many filters are stored.
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+
+    def insert(self, topic_filter, value):
+        node = self._root
+        for part in topic_filter.split("/"):
+            node = node.children.setdefault(part, _TrieNode())
+        node.rules.append(value)
+
+    def match(self, topic):
+        """
+        Values of every filter matching topic, in no particular order.
+        """
+        found = []
+        nodes = [self._root]
+        for part in topic.split("/"):
+            following = []
+            for node in nodes:
+                children = node.children
+                if "#" in children:
+                    found.extend(children["#"].rules)
+                child = children.get(part)
+                if child is not None:
+                    following.append(child)
+                child = children.get("+")
+                if child is not None:
+                    following.append(child)
+            if not following:
+                return found
+            nodes = following
+        for node in nodes:
+            found.extend(node.rules)
+            # "a/#" also matches "a"
+            if "#" in node.children:
+                found.extend(node.children["#"].rules)
+        return found
+
+
+class RoutingTable:
+    """
+    Compiled routing rules: route(topic, sensor_type) is the set of destinations of the first rule,
+    in declaration order, whose topic filter and sensor types match, or `default` when none does.
+    Results are cached per (topic, sensor type).
+    """
+
+    def __init__(self, rules=(), default=DESTINATIONS, max_cached=100000):
+        self.rules = list(rules)
+        self.default = frozenset(default)
+        self.max_cached = max_cached
+        self._trie = TopicTrie()
+        for index, rule in enumerate(self.rules):
+            self._trie.insert(rule.topic_filter, (index, rule))
+        self._cache = {}
+
+    def route(self, topic, sensor_type):
+        key = (topic, sensor_type)
+        destinations = self._cache.get(key)
+        if destinations is None:
+            best = None
+            for index, rule in self._trie.match(topic):
+                if (rule.types is None or sensor_type in rule.types) and (best is None or index < best[0]):
+                    best = (index, rule)
+            destinations = best[1].destinations if best is not None else self.default
+            if len(self._cache) >= self.max_cached:
+                self._cache.clear()
+            self._cache[key] = destinations
+        return destinations
+
+
+def parse_routing_rules(spec):
+    """
+    Parse "filter[:type,type]=dest,dest;..." into a list of RouteRules, e.g.
+    "home/+/+/sensor:temperature,humidity=mongo,analysis".
+    """
+    rules = []
+    for item in (spec or "").split(";"):
+        if "=" not in item:
+            continue
+        match, destinations = item.rsplit("=", 1)
+        topic_filter, _, types = match.partition(":")
+        rules.append(RouteRule(topic_filter.strip(), [t.strip() for t in types.split(",") if t.strip()],
+                               [d.strip() for d in destinations.split(",") if d.strip()]))
+    return rules
+
+
+def load_routing_file(path):
+    """
+    Read a routing table from a JSON file of the form
+    {"default": ["mysql", ...], "rules": [{"topic": "home/+/+/sensor", "types": ["temperature"], "to": ["mongo"]}]}
+    where "default" and "types" are optional.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    rules = [RouteRule(rule["topic"], rule.get("types"), rule["to"]) for rule in config.get("rules", [])]
+    return RoutingTable(rules, config.get("default", DESTINATIONS))
+
+
+class Router:
+    """
+    Routes readings with the current RoutingTable. With a path, start() loads the table from that file
+    and reloads it whenever its modification time changes, checked every `interval` seconds; a file
+    that fails to load leaves the previous table in place.
+    """
+
+    def __init__(self, table=None, path=None, interval=5.0):
+        self.table = table or RoutingTable()
+        self.path = path or None
+        self.interval = interval
+        self._mtime = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __call__(self, topic, sensor_type):
+        return self.table.route(topic, sensor_type)
+
+    def reload(self):
+        """
+        Load the rules file if it changed since the last load. Returns True when a new table was installed.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return False
+            # a broken file is reported once, not on every check, until it changes again
+            self._mtime = mtime
+            table = load_routing_file(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            metrics.inc("routing_reloads_total", result="error")
+            log.error("Could not load routing rules from %s, keeping the current ones: %s", self.path, e)
+            return False
+        # a single reference swap, so routing threads see either the old table or the new one
+        self.table = table
+        metrics.inc("routing_reloads_total", result="ok")
+        log.info("Loaded %d routing rules from %s", len(table.rules), self.path)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.reload()
+
+    def start(self):
+        if self.path and (self._thread is None or not self._thread.is_alive()):
+            self.reload()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="routing-reload", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
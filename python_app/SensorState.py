@@ -0,0 +1,170 @@
+import collections
+import json
+import os
+import threading
+
+from AppLogging import get_logger
+
+log = get_logger("state")
+
+TEMPERATURE_TYPES = ("temperature",)
+# optional sensor types that refine leak / fire severity when a location has them
+FLOW_RATE_TYPE = "water_flow"
+SMOKE_DENSITY_TYPE = "smoke_density"
+
+
+class SensorRecord:
+    __slots__ = ("sensor_type", "last_value", "last_timestamp", "event_count", "active_since")
+
+    def __init__(self, sensor_type):
+        self.sensor_type = sensor_type
+        self.last_value = None
+        self.last_timestamp = None
+        self.event_count = 0
+        # for boolean sensors: timestamp of the first True of the current run of True readings
+        self.active_since = None
+
+
+class LocationRecord:
+    __slots__ = ("temperatures", "flow_rate", "flow_rate_at", "smoke_density", "smoke_density_at", "event_count")
+
+    def __init__(self):
+        # monotonic deque of (timestamp, temperature), decreasing temperature: the front is the window peak
+        self.temperatures = collections.deque()
+        # last reading and its timestamp; reported as 0 once older than the window (None: never seen)
+        self.flow_rate = 0.0
+        self.flow_rate_at = None
+        self.smoke_density = 0.0
+        self.smoke_density_at = None
+        self.event_count = 0
+
+
+class SensorStateEngine:
+    """
+    Rolling per-sensor and per-location aggregates updated in O(1) (amortized) per reading, so the
+    damage analyzer gets real severity indicators without reading history from the databases.
+    The temperature peak, flow rate and smoke density only count readings within temperature_window seconds.
+    """
+
+    def __init__(self, temperature_window=1800.0):
+        self.temperature_window = temperature_window
+        self.sensors = {}
+        self.locations = {}
+        self._lock = threading.Lock()
+
+    def update(self, location, sensor_id, sensor_type, value, timestamp):
+        """
+        Fold one reading into the state and return the severity indicators as of that reading:
+        (leak_duration_minutes, flow_rate, smoke_density, temp_peak).
+        """
+        with self._lock:
+            sensor = self.sensors.get(sensor_id)
+            if sensor is None:
+                sensor = self.sensors[sensor_id] = SensorRecord(sensor_type)
+            place = self.locations.get(location)
+            if place is None:
+                place = self.locations[location] = LocationRecord()
+
+            sensor.sensor_type = sensor_type
+            sensor.last_value = value
+            sensor.last_timestamp = timestamp
+            sensor.event_count += 1
+            place.event_count += 1
+
+            if value is True:
+                if sensor.active_since is None:
+                    sensor.active_since = timestamp
+            elif value is False:
+                sensor.active_since = None
+
+            numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if numeric and sensor_type in TEMPERATURE_TYPES:
+                temperatures = place.temperatures
+                while temperatures and temperatures[-1][1] <= value:
+                    temperatures.pop()
+                temperatures.append((timestamp, value))
+            elif numeric and sensor_type == FLOW_RATE_TYPE:
+                place.flow_rate = float(value)
+                place.flow_rate_at = timestamp
+            elif numeric and sensor_type == SMOKE_DENSITY_TYPE:
+                place.smoke_density = float(value)
+                place.smoke_density_at = timestamp
+
+            horizon = timestamp - self.temperature_window
+            temperatures = place.temperatures
+            while temperatures and temperatures[0][0] < horizon:
+                temperatures.popleft()
+            temp_peak = temperatures[0][1] if temperatures else 0.0
+            flow_rate = place.flow_rate if place.flow_rate_at is not None and place.flow_rate_at >= horizon else 0.0
+            smoke_density = (place.smoke_density
+                             if place.smoke_density_at is not None and place.smoke_density_at >= horizon else 0.0)
+
+            duration_minutes = 0.0
+            if sensor.active_since is not None:
+                duration_minutes = (timestamp - sensor.active_since) / 60.0
+            return duration_minutes, flow_rate, smoke_density, temp_peak
+
+    def snapshot(self, path):
+        """
+        Atomically write the current state to a JSON file. Returns False, after logging the error, if it
+        could not be written, so a full disk never stops the periodic snapshot or the shutdown flush.
+        """
+        with self._lock:
+            state = {
+                "temperature_window": self.temperature_window,
+                "sensors": {
+                    sensor_id: [r.sensor_type, r.last_value, r.last_timestamp, r.event_count, r.active_since]
+                    for sensor_id, r in self.sensors.items()
+                },
+                "locations": {
+                    name: [list(map(list, r.temperatures)), r.flow_rate, r.smoke_density, r.event_count,
+                           r.flow_rate_at, r.smoke_density_at]
+                    for name, r in self.locations.items()
+                },
+            }
+        tmp = path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            log.error("Error snapshotting sensor state to %s: %s", path, e)
+            return False
+        return True
+
+    def restore(self, path):
+        """
+        Load state written by snapshot(). Returns False if there is no snapshot to load.
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("Error restoring sensor state from %s: %s", path, e)
+            return False
+        with self._lock:
+            self.sensors = {}
+            for sensor_id, (sensor_type, last_value, last_timestamp, event_count, active_since) in state["sensors"].items():
+                record = SensorRecord(sensor_type)
+                record.last_value = last_value
+                record.last_timestamp = last_timestamp
+                record.event_count = event_count
+                record.active_since = active_since
+                self.sensors[sensor_id] = record
+            self.locations = {}
+            for name, values in state["locations"].items():
+                temperatures, flow_rate, smoke_density, event_count = values[:4]
+                record = LocationRecord()
+                record.temperatures.extend(tuple(t) for t in temperatures)
+                record.flow_rate = flow_rate
+                record.smoke_density = smoke_density
+                record.event_count = event_count
+                # snapshots written before the timestamps were kept have none: their values count as stale
+                if len(values) > 4:
+                    record.flow_rate_at, record.smoke_density_at = values[4:6]
+                self.locations[name] = record
+        log.info("Restored state for %d sensors from %s.", len(self.sensors), path)
+        return True
@@ -0,0 +1,317 @@
+import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from AppLogging import get_logger
+
+log = get_logger("spool")
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_NEVER = "never"
+
+# record header: payload length, crc32 of payload
+RECORD_HEADER = struct.Struct("<II")
+CURSOR_FILE = "cursor"
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime.datetime):
+        return {"$datetime": obj.isoformat()}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1 and "$datetime" in obj:
+        return datetime.datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+def encode_json(record):
+    return json.dumps(record, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def decode_json(payload):
+    return json.loads(payload, object_hook=_json_object_hook)
+
+
+class Spool:
+    """
+    Append-only on-disk queue made of numbered segment files.
+    Records are length/crc framed; a persisted (segment, offset) cursor marks what has been replayed.
+    Fully replayed segments are deleted, and when max_bytes is exceeded the oldest segments are dropped.
+    Segment sizes are tracked in memory, so appending never lists the directory.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, segment_bytes=64 * 1024 * 1024,
+                 fsync=FSYNC_INTERVAL, fsync_interval=1.0, encode=encode_json, decode=decode_json):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.encode = encode
+        self.decode = decode
+        self.dropped_segments = 0
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"{seq:012d}.seg")
+
+    def _segments(self):
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".seg"))
+
+    def _valid_length(self, path):
+        """
+        Length of the longest prefix of complete, crc-valid records in a segment.
+        """
+        size = os.path.getsize(path)
+        if size == 0:
+            return 0
+        offset = 0
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while offset + RECORD_HEADER.size <= size:
+                length, crc = RECORD_HEADER.unpack_from(mm, offset)
+                end = offset + RECORD_HEADER.size + length
+                if end > size or zlib.crc32(mm[offset + RECORD_HEADER.size:end]) != crc:
+                    break
+                offset = end
+        return offset
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}")
+            if self.fsync != FSYNC_NEVER:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _recover(self):
+        """
+        Reopen the spool after a restart: drop segments already replayed and cut off a torn final record.
+        """
+        segments = self._segments()
+        cursor = self._load_cursor()
+        if cursor is not None:
+            for seq in segments:
+                if seq < cursor[0]:
+                    os.remove(self._segment_path(seq))
+            segments = [seq for seq in segments if seq >= cursor[0]]
+        if segments:
+            last_path = self._segment_path(segments[-1])
+            valid = self._valid_length(last_path)
+            if valid < os.path.getsize(last_path):
+                log.warning("%s: truncating torn record at %s:%s", self.directory, last_path, valid)
+                with open(last_path, "r+b") as f:
+                    f.truncate(valid)
+            self._write_seq = segments[-1]
+        else:
+            self._write_seq = cursor[0] if cursor else 0
+        if cursor is None or not segments or cursor[0] < segments[0]:
+            cursor = (segments[0] if segments else self._write_seq, 0)
+        self._cursor = cursor
+        self._file = open(self._segment_path(self._write_seq), "ab")
+        # segment -> size in bytes, oldest first
+        self._sizes = {seq: os.path.getsize(self._segment_path(seq)) for seq in self._segments()}
+        self._total_bytes = sum(self._sizes.values())
+
+    def _rotate(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._write_seq += 1
+        self._file = open(self._segment_path(self._write_seq), "ab")
+        self._sizes[self._write_seq] = 0
+
+    def _remove_segment(self, seq):
+        self._total_bytes -= self._sizes.pop(seq)
+        os.remove(self._segment_path(seq))
+
+    def _enforce_cap(self):
+        while self._total_bytes > self.max_bytes and len(self._sizes) > 1:
+            oldest = next(iter(self._sizes))
+            self._remove_segment(oldest)
+            self.dropped_segments += 1
+            if self._cursor[0] <= oldest:
+                self._cursor = (next(iter(self._sizes)), 0)
+            log.warning("%s: size cap reached, dropped segment %s", self.directory, oldest)
+
+    def append(self, records):
+        with self._lock:
+            written = 0
+            for record in records:
+                payload = self.encode(record)
+                self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+                self._file.write(payload)
+                written += RECORD_HEADER.size + len(payload)
+            self._sizes[self._write_seq] += written
+            self._total_bytes += written
+            self._file.flush()
+            now = time.monotonic()
+            if self.fsync == FSYNC_ALWAYS or (self.fsync == FSYNC_INTERVAL and now - self._last_sync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_sync = now
+            if self._file.tell() >= self.segment_bytes:
+                self._rotate()
+            self._enforce_cap()
+
+    def has_pending(self):
+        with self._lock:
+            return self._cursor != (self._write_seq, self._file.tell())
+
+    def read_batch(self, max_records):
+        """
+        Return up to max_records records after the cursor and the position to commit once they are written.
+        """
+        with self._lock:
+            seq, offset = self._cursor
+            records = []
+            while len(records) < max_records:
+                path = self._segment_path(seq)
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                if offset >= size:
+                    if seq < self._write_seq:
+                        seq, offset = seq + 1, 0
+                        continue
+                    break
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    while offset + RECORD_HEADER.size <= size and len(records) < max_records:
+                        length, crc = RECORD_HEADER.unpack_from(mm, offset)
+                        end = offset + RECORD_HEADER.size + length
+                        payload = mm[offset + RECORD_HEADER.size:end]
+                        if end > size or zlib.crc32(payload) != crc:
+                            log.warning("%s: skipping corrupt data in segment %s at %s", self.directory, seq, offset)
+                            offset = size
+                            break
+                        records.append(self.decode(payload))
+                        offset = end
+            return records, (seq, offset)
+
+    def commit(self, position):
+        """
+        Advance the replay cursor and delete segments that are fully replayed.
+        """
+        with self._lock:
+            if position > self._cursor:
+                self._cursor = position
+            seq, offset = self._cursor
+            if seq == self._write_seq and offset == self._file.tell() and offset > 0:
+                # fully drained: start a fresh segment so the old one can go
+                self._rotate()
+                self._cursor = (self._write_seq, 0)
+            for old in [seq for seq in self._sizes if seq < self._cursor[0]]:
+                self._remove_segment(old)
+            self._save_cursor()
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class SpoolReplayer:
+    """
+    Background thread that drains a spool in batches through write_batch, which must raise on failure.
+    Failed batches stay in the spool and are retried with exponential backoff. Only errors for which
+    is_permanent(error) is true, a store rejecting the data itself, count as attempts: a batch rejected
+    max_attempts times in a row is split in halves that are retried on their own, so a record the store
+    keeps rejecting ends up alone; it is then moved to the dead_letter spool and replay goes on behind
+    it. Anything else (the store unreachable, a timeout) is retried for as long as it takes, as is every
+    failure without a dead_letter spool.
+    """
+
+    def __init__(self, name, spool, write_batch, batch_size=500, idle_interval=1.0, max_backoff=30.0,
+                 max_attempts=5, dead_letter=None, is_permanent=None):
+        self.name = name
+        self.spool = spool
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.dead_letter = dead_letter
+        self.is_permanent = is_permanent or (lambda error: False)
+        self.replayed = 0
+        self.dead_lettered = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _write(self, records):
+        """
+        Write records, retrying, splitting and dead-lettering as described above. Returns False if
+        stopped before every record was written or set aside.
+        """
+        attempts = 0
+        backoff = self.idle_interval
+        while not self._stop.is_set():
+            try:
+                self.write_batch(records)
+                return True
+            except Exception as e:
+                if self.dead_letter is not None and self.is_permanent(e):
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        if len(records) == 1:
+                            log.error("%s: record rejected %d times, moving it to %s: %s", self.name, attempts,
+                                      self.dead_letter.directory, e)
+                            self.dead_letter.append(records)
+                            self.dead_lettered += 1
+                            return True
+                        log.warning("%s: replay of %d records rejected %d times, retrying them in halves: %s",
+                                    self.name, len(records), attempts, e)
+                        half = len(records) // 2
+                        return self._write(records[:half]) and self._write(records[half:])
+                log.warning("%s: replay of %d records failed, retrying in %.0fs: %s", self.name, len(records), backoff, e)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            records, position = self.spool.read_batch(self.batch_size)
+            if not records:
+                self._stop.wait(self.idle_interval)
+                continue
+            dead_lettered = self.dead_lettered
+            # the batch is only committed once all of it is dealt with; a half written before a restart
+            # is written again
+            if not self._write(records):
+                continue
+            self.spool.commit(position)
+            replayed = len(records) - (self.dead_lettered - dead_lettered)
+            self.replayed += replayed
+            log.info("%s: replayed %d records", self.name, replayed)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-replayer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.max_backoff)
+            self._thread = None
@@ -1,64 +1,204 @@
-import json
+import threading
 
 import paho.mqtt.client as mqtt
-from config import MQTT_BROKER_PORT,MQTT_BROKER_HOST,MQTT_TOPIC_ROOT
-from DamageAnalyzer import analyze_sensor_data_and_trigger_claim
-from db_manager import store_sensor_data, init_dbs, neo4j_manager
+from config import (
+    MQTT_BROKER_PORT, MQTT_BROKER_HOST, MQTT_TOPIC_ROOT,
+    PIPELINE_QUEUE_SIZE, PIPELINE_OVERFLOW_POLICY, PIPELINE_SPILL_DIR,
+    PIPELINE_MYSQL_WORKERS, PIPELINE_MONGO_WORKERS, PIPELINE_NEO4J_WORKERS, PIPELINE_ANALYSIS_WORKERS,
+    PIPELINE_STATS_INTERVAL, PIPELINE_ANALYSIS_BATCH, DEADBAND_STORES, DEADBAND_RULES, DEADBAND_HEARTBEAT,
+    MYSQL_ROLLUPS, ROUTING_RULES, ROUTING_RULES_PATH, ROUTING_RELOAD_INTERVAL,
+    SENSOR_STATE_SNAPSHOT_PATH, SENSOR_STATE_SNAPSHOT_INTERVAL,
+    PAYLOAD_CODEC_DEFAULT, PAYLOAD_CODEC_RULES,
+    METRICS_HOST, METRICS_PORT, METRICS_PROFILER, LIVE_STATE_HOST, LIVE_STATE_PORT, LIVE_STATE_WARM_HOURS,
+    BACKEND_INIT_TIMEOUT,
+    LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL,
+)
+from AppLogging import get_logger, setup_logging, stop_logging
+from Codecs import CodecError, CodecRegistry, parse_topic_rules, validate_reading
+from Deadband import build_deadband_filters
+from DamageAnalyzer import analyze_sensor_batch_and_trigger_claims, claim_worker, rebuild_incidents, sensor_state
+from db_manager import (
+    store_mysql, store_mongo, store_neo4j, init_dbs, flush_dbs, neo4j_manager, readiness, warm_live_state,
+)
+from LiveState import live_state, location_of, start_live_state_server
+from Metrics import metrics, start_metrics_server
+from Pipeline import IngestPipeline, OVERFLOW_BLOCK
+from Routing import Router, RoutingTable, parse_routing_rules
 
 MQTT_SUBCRIBER_TOPIC = f"{MQTT_TOPIC_ROOT}/+/+/sensor"
 
-def on_connect(client, userdata, flags, rc):
+log = get_logger("mqtt")
+
+router = Router(RoutingTable(parse_routing_rules(ROUTING_RULES)), ROUTING_RULES_PATH, ROUTING_RELOAD_INTERVAL)
+pipeline = IngestPipeline(router)
+codecs = CodecRegistry(parse_topic_rules(PAYLOAD_CODEC_RULES), PAYLOAD_CODEC_DEFAULT)
+
+def build_pipeline(analysis_handler=analyze_sensor_batch_and_trigger_claims, analysis_batch=PIPELINE_ANALYSIS_BATCH):
+    common = {"max_size": PIPELINE_QUEUE_SIZE, "overflow": PIPELINE_OVERFLOW_POLICY, "spill_dir": PIPELINE_SPILL_DIR}
+    deadband = build_deadband_filters(DEADBAND_STORES, DEADBAND_RULES, DEADBAND_HEARTBEAT, MYSQL_ROLLUPS)
+
+    def accept(name):
+        return deadband[name].accept if name in deadband else None
+    pipeline.add_stage("mysql", store_mysql, workers=PIPELINE_MYSQL_WORKERS, accept=accept("mysql"), **common)
+    pipeline.add_stage("mongo", store_mongo, workers=PIPELINE_MONGO_WORKERS, accept=accept("mongo"), **common)
+    pipeline.add_stage("neo4j", store_neo4j, workers=PIPELINE_NEO4J_WORKERS, accept=accept("neo4j"), **common)
+    # alerts must never be dropped, so analysis always applies backpressure and is never deadband-filtered
+    pipeline.add_stage("analysis", analysis_handler, workers=PIPELINE_ANALYSIS_WORKERS,
+                       max_size=PIPELINE_QUEUE_SIZE, overflow=OVERFLOW_BLOCK, max_batch=analysis_batch)
+    return pipeline
+
+def collect_pipeline_metrics():
+    for name, stats in pipeline.stats().items():
+        labels = {"stage": name}
+        yield "stage_queue_depth", "gauge", "Readings waiting in a pipeline stage queue.", labels, stats["queue_depth"]
+        for key in ("processed", "dropped", "spilled", "suppressed", "unrouted", "errors"):
+            yield f"stage_{key}_total", "counter", f"Readings {key} by a pipeline stage.", labels, stats[key]
+
+metrics.register_collector(collect_pipeline_metrics)
+
+def after_event(event, handler, timeout):
+    """
+    Wrap handler so that its first call waits, at most timeout seconds, for event to be set.
+    """
+    waited = []
+
+    def handle(*args):
+        if not waited:
+            if not event.wait(timeout):
+                log.warning("Analyzing without the open incidents of a previous run: MySQL not ready after %.0fs",
+                            timeout)
+            waited.append(True)
+        return handler(*args)
+    return handle
+
+def restore_from_stores(rebuilt, owns_sensor=None, live_state_server=None):
+    """
+    Once MySQL is up, rebuild the open incidents (then set rebuilt) and warm the live state cache.
+    """
+    def restore():
+        rebuild_incidents(owns_sensor)
+        rebuilt.set()
+        if live_state_server is not None and LIVE_STATE_WARM_HOURS > 0:
+            warm_live_state(live_state, LIVE_STATE_WARM_HOURS, owns_sensor)
+    readiness.on_ready(("mysql",), restore)
+
+def report_pipeline_stats(stop_event):
+    while not stop_event.wait(PIPELINE_STATS_INTERVAL):
+        get_logger("pipeline").info("%s", pipeline.stats())
+
+def snapshot_sensor_state(stop_event, path):
+    while not stop_event.wait(SENSOR_STATE_SNAPSHOT_INTERVAL):
+        sensor_state.snapshot(path)
+
+def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
-        print(f"Connected to MQTT broker at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT} with result code {str(rc)}")
-        client.subscribe(MQTT_SUBCRIBER_TOPIC)
-        print(f"Subscribed to topic: {MQTT_SUBCRIBER_TOPIC}")
+        topic = (userdata or {}).get("topic", MQTT_SUBCRIBER_TOPIC)
+        log.info("Connected to MQTT broker at %s:%s with result code %s", MQTT_BROKER_HOST, MQTT_BROKER_PORT, rc)
+        client.subscribe(topic)
+        log.info("Subscribed to topic: %s", topic)
     else:
-        print(f"Connection failed with result code: {str(rc)}")
+        log.error("Connection failed with result code: %s", rc)
+
+def _content_type(msg):
+    properties = getattr(msg, "properties", None)
+    return getattr(properties, "ContentType", None) if properties is not None else None
 
 def on_message(client, userdata, msg):
-    print(f"Received message - topic : {msg.topic}")
+    """
+    Decode and validate one message and hand it to userdata["submit"] (the pipeline by default).
+    """
+    accept = (userdata or {}).get("accept")
+    submit = (userdata or {}).get("submit") or pipeline.submit
+    if accept is not None and not accept(msg.topic):
+        return
+    log.debug("Received message - topic : %s", msg.topic)
+    metrics.inc("messages_received_total")
     try:
-        payload_str = msg.payload.decode("utf-8")
-        sensor_data = json.loads(payload_str)
-
-        if not all(k in sensor_data for k in ["sensor_id", "type", "value", "timestamp"]):
-            print(f"Warning: Incomplete sensor data received from {msg.topic}. Skipping processing.")
-            print(f"Payload: {sensor_data}")
-            return
-
-        store_sensor_data(msg.topic, sensor_data)
-#         todo analyse sensor data function
-        analyze_sensor_data_and_trigger_claim(msg.topic,sensor_data)
+        with metrics.timed("decode_seconds"):
+            sensor_data = codecs.decode(msg.topic, msg.payload, _content_type(msg))
+            valid = validate_reading(sensor_data)
+    except CodecError as e:
+        metrics.inc("messages_rejected_total", reason="decode")
+        log.warning("Could not decode payload from topic %s: %s. Payload: %r", msg.topic, e, msg.payload[:200])
+        return
 
+    if not valid:
+        metrics.inc("messages_rejected_total", reason="incomplete")
+        log.warning("Incomplete sensor data received from %s. Skipping processing. Payload: %s", msg.topic, sensor_data)
+        return
 
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON payload from topic {msg.topic}. Payload: {msg.payload.decode('utf-8')}")
-    except UnicodeDecodeError:
-        print(f"Error: Could not decode payload as UTF-8 from topic {msg.topic}.")
+    try:
+        live_state.update(location_of(msg.topic), sensor_data["sensor_id"], sensor_data["type"], sensor_data["value"],
+                          sensor_data["timestamp"])
+        submit(msg.topic, sensor_data)
     except Exception as e:
-        print(f"An unexpected error occurred while processing message from {msg.topic}: {e}")
+        log.error("An unexpected error occurred while processing message from %s: %s", msg.topic, e)
 
-if __name__ == "__main__":
-    init_dbs()
-    client = mqtt.Client(protocol=mqtt.MQTTv311)
+def run(topic=MQTT_SUBCRIBER_TOPIC, protocol=mqtt.MQTTv311, accept=None, client_id="",
+        analysis_handler=analyze_sensor_batch_and_trigger_claims, analysis_batch=PIPELINE_ANALYSIS_BATCH,
+        before_shutdown=None, state_path=SENSOR_STATE_SNAPSHOT_PATH, owns_sensor=None, metrics_port=METRICS_PORT,
+        run_retention=True, live_state_port=LIVE_STATE_PORT):
+    """
+    Initialize the stores, start the pipeline and consume MQTT messages until interrupted.
+    accept optionally filters topics before decoding (used for hash-partitioned workers);
+    analysis_handler takes (topics, readings) lists when analysis_batch > 1, else (topic, sensor_data);
+    before_shutdown runs after the pipeline has drained but before queued claims are written and the stores flushed.
+    Sensor state is restored from and periodically snapshotted to state_path; owns_sensor(location, sensor_id)
+    limits which open incidents are rebuilt when several processes split the sensors.
+    Prometheus metrics, plus backend readiness on /health and /ready, are served on metrics_port (0 disables);
+    run_retention starts the store retention job.
+    The last value of every sensor this process receives is served on live_state_port (0 disables).
+    The stores come up in the background, so MQTT is consumed from the start; analysis waits for
+    open incidents to be rebuilt from MySQL, for at most BACKEND_INIT_TIMEOUT seconds.
+    """
+    setup_logging(LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL)
+    metrics_server = start_metrics_server(METRICS_HOST, metrics_port, METRICS_PROFILER, readiness.report)
+    init_dbs(retention=run_retention)
+    sensor_state.restore(state_path)
+    claim_worker.start()
+    live_state_server = start_live_state_server(LIVE_STATE_HOST, live_state_port)
+    incidents_rebuilt = threading.Event()
+    restore_from_stores(incidents_rebuilt, owns_sensor, live_state_server)
+    build_pipeline(after_event(incidents_rebuilt, analysis_handler, BACKEND_INIT_TIMEOUT), analysis_batch)
+    pipeline.start()
+    router.start()
+    stop_stats = threading.Event()
+    threading.Thread(target=report_pipeline_stats, args=(stop_stats,), daemon=True).start()
+    threading.Thread(target=snapshot_sensor_state, args=(stop_stats, state_path), daemon=True).start()
+
+    client = mqtt.Client(client_id=client_id, protocol=protocol)
+    client.user_data_set({"topic": topic, "accept": accept})
     client.on_connect = on_connect
     client.on_message = on_message
 
     try:
-        print("Attempting to connect to MQTT broker...")
+        log.info("Attempting to connect to MQTT broker...")
         client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
-        print("MQTT client connected. Starting loop...")
+        log.info("MQTT client connected. Starting loop...")
         client.loop_forever()
     except KeyboardInterrupt:
-        print("\nMQTT client stopped by user (KeyboardInterrupt).")
+        log.info("MQTT client stopped by user (KeyboardInterrupt).")
     except Exception as e:
-        print(f"An error occurred in the MQTT client loop: {e}")
+        log.error("An error occurred in the MQTT client loop: %s", e)
     finally:
+        stop_stats.set()
+        router.stop()
+        pipeline.stop()
+        get_logger("pipeline").info("%s", pipeline.stats())
+        if before_shutdown:
+            before_shutdown()
+        claim_worker.stop()
+        get_logger("claims").info("%s", claim_worker.stats())
+        sensor_state.snapshot(state_path)
+        flush_dbs()
         if neo4j_manager:
             neo4j_manager.close()
-        print("Application gracefully shutting down...")
-
-
-
-
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if live_state_server is not None:
+            live_state_server.shutdown()
+        log.info("Application gracefully shutting down...")
+        stop_logging()
 
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,206 @@
+import argparse
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+
+from config import (
+    MQTT_PROTOCOL, MQTT_SHARED_GROUP, MQTT_TOPIC_ROOT, SUBSCRIBER_WORKERS, SUBSCRIBER_REORDER_WINDOW,
+    SENSOR_STATE_SNAPSHOT_PATH, METRICS_PORT, LIVE_STATE_PORT,
+    LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL,
+)
+from AppLogging import get_logger, setup_logging, stop_logging
+
+SENSOR_TOPIC = f"{MQTT_TOPIC_ROOT}/+/+/sensor"
+
+log = get_logger("supervisor")
+
+MODE_SHARED = "shared"
+MODE_HASH = "hash"
+
+
+def sensor_partition(topic, worker_count):
+    """
+    Stable worker index for the location/sensor_id levels of a sensor topic.
+    """
+    parts = topic.split('/')
+    key = "/".join(parts[1:3]) if len(parts) > 2 else topic
+    return zlib.crc32(key.encode("utf-8")) % worker_count
+
+
+class ReorderBuffer:
+    """
+    Holds forwarded readings for `window` seconds and releases them in reading-timestamp order,
+    so readings of one sensor that reached different workers are still analyzed in order.
+    """
+
+    def __init__(self, handler, window):
+        self.handler = handler
+        self.window = window
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def put(self, topic, sensor_data):
+        with self._cond:
+            heapq.heappush(self._heap, (sensor_data.get("timestamp", 0), next(self._seq), time.monotonic(), topic, sensor_data))
+            self._cond.notify()
+
+    def _next(self, stop_event):
+        with self._cond:
+            while True:
+                if not self._heap:
+                    if stop_event.is_set():
+                        return None
+                    self._cond.wait(0.1)
+                    continue
+                _, _, arrived, topic, sensor_data = self._heap[0]
+                delay = arrived + self.window - time.monotonic()
+                if delay > 0 and not stop_event.is_set():
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                return topic, sensor_data
+
+    def run(self, stop_event):
+        while True:
+            item = self._next(stop_event)
+            if item is None:
+                return
+            try:
+                self.handler(*item)
+            except Exception as e:
+                log.error("Reorder buffer: error analyzing message from %s: %s", item[0], e)
+
+
+def _drain_inbox(inbox, reorder, stop_event):
+    while not stop_event.is_set():
+        try:
+            topic, sensor_data = inbox.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        reorder.put(topic, sensor_data)
+
+
+def run_worker(index, worker_count, mode, group, inboxes):
+    """
+    Entry point of one subscriber process. Each process imports db_manager itself and so
+    gets its own database connections.
+    """
+    # keep terminal Ctrl-C away from workers; the supervisor forwards shutdown exactly once
+    os.setpgrp()
+    import paho.mqtt.client as mqtt
+    import Subscriber
+    from DamageAnalyzer import analyze_sensor_data_and_trigger_claim
+
+    client_id = f"{group}-{index}"
+    # sensors are partitioned by worker index, so each worker keeps its own state snapshot
+    state_path = f"{SENSOR_STATE_SNAPSHOT_PATH}.{index}"
+    metrics_port = METRICS_PORT + 1 + index if METRICS_PORT else 0
+    live_state_port = LIVE_STATE_PORT + 1 + index if LIVE_STATE_PORT else 0
+
+    def owns_sensor(location, sensor_id):
+        return sensor_partition(f"{MQTT_TOPIC_ROOT}/{location}/{sensor_id}/sensor", worker_count) == index
+    if mode == MODE_HASH:
+        # MQTT 3.1.1: every worker sees every message and keeps only the sensors it owns
+        Subscriber.run(
+            topic=SENSOR_TOPIC,
+            protocol=mqtt.MQTTv311,
+            client_id=client_id,
+            accept=lambda topic: sensor_partition(topic, worker_count) == index,
+            state_path=state_path,
+            owns_sensor=owns_sensor,
+            metrics_port=metrics_port,
+            run_retention=index == 0,
+            live_state_port=live_state_port
+        )
+        return
+
+    # MQTT v5 shared subscription: the broker spreads messages across workers, so storage happens
+    # wherever a reading lands and analysis is forwarded to the worker owning the sensor.
+    stop_event = threading.Event()
+    reorder = ReorderBuffer(analyze_sensor_data_and_trigger_claim, SUBSCRIBER_REORDER_WINDOW)
+    analyzer = threading.Thread(target=reorder.run, args=(stop_event,), name="reorder", daemon=True)
+    analyzer.start()
+    threading.Thread(target=_drain_inbox, args=(inboxes[index], reorder, stop_event), daemon=True).start()
+
+    def forward(topic, sensor_data):
+        inboxes[sensor_partition(topic, worker_count)].put((topic, sensor_data))
+
+    def drain_analysis():
+        stop_event.set()
+        analyzer.join(timeout=SUBSCRIBER_REORDER_WINDOW + 5)
+
+    Subscriber.run(
+        topic=f"$share/{group}/{SENSOR_TOPIC}",
+        protocol=mqtt.MQTTv5,
+        client_id=client_id,
+        analysis_handler=forward,
+        analysis_batch=1,
+        before_shutdown=drain_analysis,
+        state_path=state_path,
+        owns_sensor=owns_sensor,
+        metrics_port=metrics_port,
+        run_retention=index == 0,
+        live_state_port=live_state_port
+    )
+
+
+def supervise(worker_count, mode, group):
+    """
+    Launch worker_count subscriber processes, restart any that die, and stop them all on SIGINT/SIGTERM.
+    """
+    setup_logging(LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_BURST, LOG_RATE_INTERVAL)
+    ctx = multiprocessing.get_context("spawn")
+    inboxes = [ctx.Queue() for _ in range(worker_count)]
+    workers = {}
+
+    def launch(index):
+        process = ctx.Process(target=run_worker, args=(index, worker_count, mode, group, inboxes),
+                              name=f"subscriber-{index}")
+        process.start()
+        workers[index] = process
+        log.info("Started worker %d (pid %d, mode %s)", index, process.pid, mode)
+
+    def on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    for index in range(worker_count):
+        launch(index)
+
+    try:
+        while True:
+            time.sleep(1)
+            for index, process in list(workers.items()):
+                if not process.is_alive():
+                    log.warning("Worker %d exited with code %s, restarting", index, process.exitcode)
+                    launch(index)
+    except KeyboardInterrupt:
+        log.info("Stopping workers...")
+    finally:
+        for process in workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        for process in workers.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        log.info("All workers stopped.")
+        stop_logging()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several subscriber processes against one broker.")
+    parser.add_argument("--workers", type=int, default=SUBSCRIBER_WORKERS)
+    parser.add_argument("--mode", choices=[MODE_SHARED, MODE_HASH],
+                        default=MODE_SHARED if MQTT_PROTOCOL == "5" else MODE_HASH,
+                        help="shared: MQTT v5 $share group; hash: MQTT 3.1.1 with partitioning by location/sensor_id")
+    parser.add_argument("--group", default=MQTT_SHARED_GROUP)
+    args = parser.parse_args()
+    supervise(args.workers, args.mode, args.group)
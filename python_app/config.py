@@ -1,9 +1,31 @@
 import os
 
 MQTT_BROKER_HOST = os.environ.get("MQTT_BROKER_HOST", "mosquitto_broker")
-MQTT_BROKER_PORT = 1883
+MQTT_BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", 1883))
+# "5" enables MQTT v5 shared subscriptions for the supervisor, anything else uses 3.1.1
+MQTT_PROTOCOL = os.environ.get("MQTT_PROTOCOL", "3.1.1")
+# payload codec: json | msgpack | cbor; rules are "topic/filter=codec;..." and an MQTT v5
+# content-type property overrides both
+PAYLOAD_CODEC_DEFAULT = os.environ.get("PAYLOAD_CODEC_DEFAULT", "json")
+PAYLOAD_CODEC_RULES = os.environ.get("PAYLOAD_CODEC_RULES", "")
+MQTT_SHARED_GROUP = os.environ.get("MQTT_SHARED_GROUP", "subscribers")
+SUBSCRIBER_WORKERS = int(os.environ.get("SUBSCRIBER_WORKERS", 1))
+# how long the owning worker holds forwarded readings to put them back in timestamp order
+SUBSCRIBER_REORDER_WINDOW = float(os.environ.get("SUBSCRIBER_REORDER_WINDOW", 0.5))
 MQTT_TOPIC_ROOT = "home"
 
+# "memory" swaps the three stores for in-process stand-ins (benchmarks, local runs without databases)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "databases")
+MEMORY_STATS_PATH = os.environ.get("MEMORY_STATS_PATH", "memory_store_stats.json")
+# seconds each in-memory stand-in takes to initialize, to see the effect of a slow store on startup
+MEMORY_INIT_DELAY = float(os.environ.get("MEMORY_INIT_DELAY", 0))
+
+# stores are brought up in parallel while MQTT is already consuming; each connect attempt gives up after
+# BACKEND_CONNECT_TIMEOUT seconds and is retried with backoff. Analysis waits at most BACKEND_INIT_TIMEOUT
+# seconds for open incidents to be rebuilt from MySQL, and a store still down by then is logged.
+BACKEND_CONNECT_TIMEOUT = float(os.environ.get("BACKEND_CONNECT_TIMEOUT", 5))
+BACKEND_INIT_TIMEOUT = float(os.environ.get("BACKEND_INIT_TIMEOUT", 30))
+
 MYSQL_USER = os.environ.get("MYSQL_USER")
 MYSQL_PASSWORD = os.environ.get("MYSQL_PASSWORD", "example")
 MYSQL_DB = os.environ.get("MYSQL_DB")
@@ -11,6 +33,12 @@ MYSQL_HOST = os.environ.get("MYSQL_HOST")
 MYSQL_SENSOR_TABLE = "sensor_readings"
 MYSQL_CLAIMS_TABLE = "insurance_claims"
 MYSQL_PORT = 3306
+MYSQL_POOL_SIZE = int(os.environ.get("MYSQL_POOL_SIZE", 5))
+MYSQL_BATCH_SIZE = int(os.environ.get("MYSQL_BATCH_SIZE", 500))
+MYSQL_FLUSH_INTERVAL = float(os.environ.get("MYSQL_FLUSH_INTERVAL", 1.0))
+# maintain 1-minute and 1-hour rollups of sensor_readings on every batch insert (of the rows written, so
+# deadband-filtered when mysql is in DEADBAND_STORES)
+MYSQL_ROLLUPS = os.environ.get("MYSQL_ROLLUPS", "true").lower() == "true"
 
 MONGO_USER = os.environ.get("MONGO_INITDB_ROOT_USERNAME", "root")
 MONGO_PASSWORD = os.environ.get("MONGO_INITDB_ROOT_PASSWORD", "example")
@@ -18,11 +46,167 @@ MONGO_HOST = os.environ.get("MONGO_HOST", "mongo_db")
 MONGO_PORT = int(os.environ.get("MONGO_PORT", 27017))
 MONGO_DATABASE = os.environ.get("MONGO_DATABASE", "home_sensor_data")
 MONGO_SENSOR_COLLECTION = os.environ.get("MONGO_SENSOR_COLLECTION", "raw_sensor_data")
+MONGO_BATCH_SIZE = int(os.environ.get("MONGO_BATCH_SIZE", 500))
+MONGO_MAX_LATENCY = float(os.environ.get("MONGO_MAX_LATENCY", 1.0))
+MONGO_WRITE_CONCERN = int(os.environ.get("MONGO_WRITE_CONCERN", 1))
+MONGO_TIMESERIES = os.environ.get("MONGO_TIMESERIES", "false").lower() == "true"
 
 NEO4J_HOST = os.environ.get("NEO4J_HOST", "neo4j")
 NEO4J_PORT = int(os.environ.get("NEO4J_PORT", 7687))
 NEO4J_URI = f"bolt://{NEO4J_HOST}:{NEO4J_PORT}"
 NEO4J_USER = os.environ.get("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD")
+NEO4J_BATCH_SIZE = int(os.environ.get("NEO4J_BATCH_SIZE", 500))
+NEO4J_FLUSH_INTERVAL = float(os.environ.get("NEO4J_FLUSH_INTERVAL", 1.0))
+# flat | bucketed (events under one node per sensor and NEO4J_EVENT_BUCKET: hour | day) | chain (NEXT-linked)
+NEO4J_EVENT_MODEL = os.environ.get("NEO4J_EVENT_MODEL", "flat")
+NEO4J_EVENT_BUCKET = os.environ.get("NEO4J_EVENT_BUCKET", "day")
+
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 10000))
+# block | drop_oldest | spill
+PIPELINE_OVERFLOW_POLICY = os.environ.get("PIPELINE_OVERFLOW_POLICY", "block")
+PIPELINE_SPILL_DIR = os.environ.get("PIPELINE_SPILL_DIR", "spool/pipeline")
+PIPELINE_MYSQL_WORKERS = int(os.environ.get("PIPELINE_MYSQL_WORKERS", 2))
+PIPELINE_MONGO_WORKERS = int(os.environ.get("PIPELINE_MONGO_WORKERS", 2))
+PIPELINE_NEO4J_WORKERS = int(os.environ.get("PIPELINE_NEO4J_WORKERS", 2))
+# damage analysis keeps a single worker so readings of a sensor are analyzed in order
+PIPELINE_ANALYSIS_WORKERS = 1
+# readings evaluated together by the vectorized damage analyzer
+PIPELINE_ANALYSIS_BATCH = int(os.environ.get("PIPELINE_ANALYSIS_BATCH", 256))
+PIPELINE_STATS_INTERVAL = float(os.environ.get("PIPELINE_STATS_INTERVAL", 60))
+
+# per-backend on-disk spool for writes that fail while a store is unreachable
+SPOOL_DIR = os.environ.get("SPOOL_DIR", "spool")
+SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_BYTES", 1024 * 1024 * 1024))
+SPOOL_SEGMENT_BYTES = int(os.environ.get("SPOOL_SEGMENT_BYTES", 64 * 1024 * 1024))
+# always | interval | never
+SPOOL_FSYNC = os.environ.get("SPOOL_FSYNC", "interval")
+SPOOL_FSYNC_INTERVAL = float(os.environ.get("SPOOL_FSYNC_INTERVAL", 1.0))
+SPOOL_REPLAY_BATCH = int(os.environ.get("SPOOL_REPLAY_BATCH", 500))
+# a replayed batch the store rejects (bad data, a constraint) this many times in a row is retried in halves; a
+# single record still rejected is moved to <SPOOL_DIR>/<store>-dead so it no longer holds up the records behind
+# it. Connection failures and timeouts are retried for as long as the store is down and never dead-letter.
+SPOOL_MAX_ATTEMPTS = int(os.environ.get("SPOOL_MAX_ATTEMPTS", 5))
+
+# asyncio entry point (AsyncSubscriber.py): readings are written in batches of up to ASYNC_BATCH_SIZE, or
+# whatever arrived within ASYNC_BATCH_LATENCY seconds, with at most ASYNC_MAX_IN_FLIGHT batches being written
+# at once; reading from the broker pauses while ASYNC_QUEUE_SIZE readings are waiting
+ASYNC_BATCH_SIZE = int(os.environ.get("ASYNC_BATCH_SIZE", 500))
+ASYNC_BATCH_LATENCY = float(os.environ.get("ASYNC_BATCH_LATENCY", 0.05))
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get("ASYNC_MAX_IN_FLIGHT", 4))
+ASYNC_QUEUE_SIZE = int(os.environ.get("ASYNC_QUEUE_SIZE", 10000))
+
+# deadband filtering of store writes: readings within their type's band of the last one written are
+# skipped for the stores in DEADBAND_STORES (e.g. "mysql,neo4j" keeps MongoDB raw). Bands are absolute,
+# a percentage, or "change"; types not listed are always written. A sensor is written at least every
+# DEADBAND_HEARTBEAT seconds. Damage analysis always sees every reading. MySQL's rollups are folded from the
+# rows it writes, so with mysql in DEADBAND_STORES the count, avg, min and max of sensor_readings_1m/_1h describe
+# the filtered stream, not every reading received; keep MongoDB raw where exact aggregates matter.
+DEADBAND_STORES = [s.strip() for s in os.environ.get("DEADBAND_STORES", "").split(",") if s.strip()]
+DEADBAND_RULES = os.environ.get(
+    "DEADBAND_RULES",
+    "temperature=0.2,humidity=1%,door_contact=change,water_leak=change,smoke_detector=change,structural_stress=change"
+)
+DEADBAND_HEARTBEAT = float(os.environ.get("DEADBAND_HEARTBEAT", 300))
+
+# which stores and pipelines get a reading: "filter[:type,type]=dest,dest;..." with destinations among mysql,
+# mongo, neo4j and analysis, e.g. "home/+/+/sensor:temperature,humidity=mongo,analysis". The first matching rule
+# wins and readings no rule matches go everywhere. Keep analysis for alarm types or no claims are filed for them.
+# ROUTING_RULES_PATH names a JSON rules file used instead, re-read within ROUTING_RELOAD_INTERVAL seconds of a change.
+ROUTING_RULES = os.environ.get("ROUTING_RULES", "")
+ROUTING_RULES_PATH = os.environ.get("ROUTING_RULES_PATH", "")
+ROUTING_RELOAD_INTERVAL = float(os.environ.get("ROUTING_RELOAD_INTERVAL", 5))
+
+# rolling sensor state used for damage severity
+SENSOR_STATE_TEMPERATURE_WINDOW = float(os.environ.get("SENSOR_STATE_TEMPERATURE_WINDOW", 1800))
+SENSOR_STATE_SNAPSHOT_PATH = os.environ.get("SENSOR_STATE_SNAPSHOT_PATH", "state/sensor_state.json")
+SENSOR_STATE_SNAPSHOT_INTERVAL = float(os.environ.get("SENSOR_STATE_SNAPSHOT_INTERVAL", 60))
+
+# anomaly detection on numeric readings alongside damage analysis: "type:z=4,rate=0.15,min=-30,max=70,std=0.5;..."
+# flags readings whose |z-score| against the last ANOMALY_WINDOW readings or the EWMA (weight ANOMALY_EWMA_ALPHA)
+# exceeds z once ANOMALY_MIN_SAMPLES are known (with std as the smallest standard deviation assumed), that move
+# away from the EWMA faster than rate units per second, timed over at least ANOMALY_RATE_SPAN seconds so sensor
+# noise between close readings is not a slope, or that fall outside [min, max]. Empty disables it; at most
+# ANOMALY_MAX_SENSORS sensors are tracked, the least recently updated giving way to new ones.
+ANOMALY_RULES = os.environ.get(
+    "ANOMALY_RULES",
+    "temperature:z=4,rate=0.15,min=-30,max=70,std=0.5;humidity:z=4,rate=1,min=0,max=100,std=1;"
+    "water_flow:z=4,min=0;smoke_density:z=4,min=0,max=1"
+)
+ANOMALY_WINDOW = int(os.environ.get("ANOMALY_WINDOW", 32))
+ANOMALY_EWMA_ALPHA = float(os.environ.get("ANOMALY_EWMA_ALPHA", 0.1))
+ANOMALY_RATE_SPAN = float(os.environ.get("ANOMALY_RATE_SPAN", 60))
+ANOMALY_MIN_SAMPLES = int(os.environ.get("ANOMALY_MIN_SAMPLES", 16))
+ANOMALY_MAX_SENSORS = int(os.environ.get("ANOMALY_MAX_SENSORS", 500000))
+
+# repeat alerts from a sensor fold into its open claim until it has been quiet this long (seconds)
+CLAIM_QUIET_PERIOD = float(os.environ.get("CLAIM_QUIET_PERIOD", 1800))
+CLAIM_MAX_OPEN_INCIDENTS = int(os.environ.get("CLAIM_MAX_OPEN_INCIDENTS", 100000))
+# claims are written off the ingest path, most urgent first, up to CLAIM_BATCH_SIZE per write; a failing
+# batch is retried CLAIM_MAX_ATTEMPTS times with backoff starting at CLAIM_RETRY_BACKOFF seconds, then spooled
+CLAIM_BATCH_SIZE = int(os.environ.get("CLAIM_BATCH_SIZE", 100))
+CLAIM_MAX_ATTEMPTS = int(os.environ.get("CLAIM_MAX_ATTEMPTS", 5))
+CLAIM_RETRY_BACKOFF = float(os.environ.get("CLAIM_RETRY_BACKOFF", 0.5))
+
+# Backfill.py: rebuilds MySQL / Neo4j readings from MongoDB in chunks of BACKFILL_CHUNK_HOURS, BACKFILL_WORKERS
+# chunks at a time, writing BACKFILL_BATCH_SIZE readings per batch; finished chunks are recorded in the checkpoint
+BACKFILL_WORKERS = int(os.environ.get("BACKFILL_WORKERS", 4))
+BACKFILL_CHUNK_HOURS = int(os.environ.get("BACKFILL_CHUNK_HOURS", 6))
+BACKFILL_BATCH_SIZE = int(os.environ.get("BACKFILL_BATCH_SIZE", 5000))
+BACKFILL_CHECKPOINT_PATH = os.environ.get("BACKFILL_CHECKPOINT_PATH", "state/backfill_checkpoint.json")
+
+# Export.py: Parquet exports of readings and claims under EXPORT_DIR, streamed EXPORT_CHUNK_ROWS rows at a time;
+# incremental runs stop EXPORT_SETTLE_SECONDS before now so buffered and spooled writes have landed
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "export")
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 50000))
+EXPORT_SETTLE_SECONDS = float(os.environ.get("EXPORT_SETTLE_SECONDS", 300))
+EXPORT_COMPRESSION = os.environ.get("EXPORT_COMPRESSION", "zstd")
+
+# Prometheus-format /metrics endpoint (0 disables); supervised workers listen on METRICS_PORT + 1 + index
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))
+# also serve /profile?seconds=N, a sampling profile of all threads in collapsed-stack format
+METRICS_PROFILER = os.environ.get("METRICS_PROFILER", "false").lower() == "true"
+
+# last known value per sensor served as JSON on /state (0 disables); supervised workers listen on
+# LIVE_STATE_PORT + 1 + index. Warmed at startup from readings of the last LIVE_STATE_WARM_HOURS (0 skips).
+LIVE_STATE_HOST = os.environ.get("LIVE_STATE_HOST", "127.0.0.1")
+LIVE_STATE_PORT = int(os.environ.get("LIVE_STATE_PORT", 8470))
+LIVE_STATE_WARM_HOURS = float(os.environ.get("LIVE_STATE_WARM_HOURS", 24))
 
+# logging: default level, per-category overrides ("mqtt=DEBUG,mysql=WARNING"), text | json output
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# at most LOG_RATE_BURST records per LOG_RATE_INTERVAL seconds for each repeated message (0 disables)
+LOG_RATE_BURST = int(os.environ.get("LOG_RATE_BURST", 10))
+LOG_RATE_INTERVAL = float(os.environ.get("LOG_RATE_INTERVAL", 60))
 
+# retention: days of raw readings kept per sensor type, in all three stores; claims and DamageEvents are never pruned.
+# RETENTION_DAYS_BY_TYPE="temperature=14,water_leak=730" overrides individual types.
+RETENTION_DEFAULT_DAYS = int(os.environ.get("RETENTION_DEFAULT_DAYS", 90))
+RETENTION_DAYS_BY_TYPE = {
+    "temperature": 30,
+    "humidity": 30,
+    "door_contact": 30,
+    "water_leak": 365,
+    "smoke_detector": 365,
+    "structural_stress": 365,
+}
+RETENTION_DAYS_BY_TYPE.update({
+    sensor_type.strip(): int(days)
+    for sensor_type, days in (item.split("=", 1) for item in os.environ.get("RETENTION_DAYS_BY_TYPE", "").split(",") if "=" in item)
+})
+# MySQL rollup tables outlive the raw readings they summarize
+RETENTION_ROLLUP_DAYS = {
+    "1m": int(os.environ.get("RETENTION_ROLLUP_1M_DAYS", 400)),
+    "1h": int(os.environ.get("RETENTION_ROLLUP_1H_DAYS", 3650)),
+}
+# seconds between retention runs (0 disables); deletes run in batches of RETENTION_BATCH_SIZE rows/nodes
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", 3600))
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 5000))
+# daily partitions of sensor_readings created ahead of time
+MYSQL_PARTITION_DAYS_AHEAD = int(os.environ.get("MYSQL_PARTITION_DAYS_AHEAD", 7))
+# delete | compact (fold expired SensorEvents into one SensorEventSummary per sensor and day)
+NEO4J_PRUNE_MODE = os.environ.get("NEO4J_PRUNE_MODE", "delete")
@@ -2,57 +2,261 @@ from config import (
     MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB, MYSQL_SENSOR_TABLE, MYSQL_CLAIMS_TABLE,
     MONGO_HOST, MONGO_PORT, MONGO_DATABASE, MONGO_SENSOR_COLLECTION,
     NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, MONGO_USER, MONGO_PASSWORD,
+    MYSQL_POOL_SIZE, MYSQL_BATCH_SIZE, MYSQL_FLUSH_INTERVAL, MYSQL_ROLLUPS,
+    MONGO_BATCH_SIZE, MONGO_MAX_LATENCY, MONGO_WRITE_CONCERN, MONGO_TIMESERIES,
+    NEO4J_BATCH_SIZE, NEO4J_FLUSH_INTERVAL, NEO4J_EVENT_MODEL, NEO4J_EVENT_BUCKET,
+    SPOOL_DIR, SPOOL_MAX_BYTES, SPOOL_SEGMENT_BYTES, SPOOL_FSYNC, SPOOL_FSYNC_INTERVAL, SPOOL_REPLAY_BATCH,
+    SPOOL_MAX_ATTEMPTS,
+    STORAGE_BACKEND, MEMORY_STATS_PATH, MEMORY_INIT_DELAY, BACKEND_CONNECT_TIMEOUT, BACKEND_INIT_TIMEOUT,
+    RETENTION_DEFAULT_DAYS, RETENTION_DAYS_BY_TYPE, RETENTION_ROLLUP_DAYS, RETENTION_INTERVAL, RETENTION_BATCH_SIZE,
+    MYSQL_PARTITION_DAYS_AHEAD, NEO4J_PRUNE_MODE,
 )
-from MysqlDatabaseManager import MySQLDatabaseManager
-from MongoDbManager import MongodbDbManager
-from Neo4jManager import Neo4jManager
-
-mysql_db_manager = MySQLDatabaseManager(
-    host=MYSQL_HOST,
-    user=MYSQL_USER,
-    password=MYSQL_PASSWORD,
-    database=MYSQL_DB,
-    sensor_table=MYSQL_SENSOR_TABLE,
-    claims_table=MYSQL_CLAIMS_TABLE
-)
-mongo_manager = MongodbDbManager(
-    host=MONGO_HOST,
-    port=MONGO_PORT,
-    dbName =MONGO_DATABASE,
-    sensor_collection_name=MONGO_SENSOR_COLLECTION,
-    username=MONGO_USER,
-    password=MONGO_PASSWORD,
-    auth_source='admin'
-)
-neo4j_manager = Neo4jManager(
-    uri=NEO4J_URI,
-    user=NEO4J_USER,
-    password=NEO4J_PASSWORD
+import datetime
+import json
+import os
+
+from bson import json_util
+
+from AppLogging import get_logger
+from LiveState import location_of, property_of
+from Metrics import metrics
+from Readiness import Readiness
+from Retention import RetentionJob, RetentionPolicy
+from Spool import Spool, SpoolReplayer
+
+# Constructing a manager does no I/O; connections and schema setup happen in init_dbs. The database
+# drivers are only imported when they are used.
+if STORAGE_BACKEND == "memory":
+    from MemoryManagers import MemoryMySQLManager, MemoryMongoManager, MemoryNeo4jManager, dump_stats
+    mysql_db_manager = MemoryMySQLManager(init_delay=MEMORY_INIT_DELAY)
+    mongo_manager = MemoryMongoManager(init_delay=MEMORY_INIT_DELAY)
+    neo4j_manager = MemoryNeo4jManager(init_delay=MEMORY_INIT_DELAY)
+else:
+    from MysqlDatabaseManager import MySQLDatabaseManager
+    from MongoDbManager import MongodbDbManager
+    from Neo4jManager import Neo4jManager
+    mysql_db_manager = MySQLDatabaseManager(
+        host=MYSQL_HOST,
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        database=MYSQL_DB,
+        sensor_table=MYSQL_SENSOR_TABLE,
+        claims_table=MYSQL_CLAIMS_TABLE,
+        pool_size=MYSQL_POOL_SIZE,
+        batch_size=MYSQL_BATCH_SIZE,
+        flush_interval=MYSQL_FLUSH_INTERVAL,
+        rollups=MYSQL_ROLLUPS,
+        partition_days_ahead=MYSQL_PARTITION_DAYS_AHEAD,
+        connect_timeout=BACKEND_CONNECT_TIMEOUT
+    )
+    mongo_manager = MongodbDbManager(
+        host=MONGO_HOST,
+        port=MONGO_PORT,
+        dbName =MONGO_DATABASE,
+        sensor_collection_name=MONGO_SENSOR_COLLECTION,
+        username=MONGO_USER,
+        password=MONGO_PASSWORD,
+        auth_source='admin',
+        batch_size=MONGO_BATCH_SIZE,
+        max_latency=MONGO_MAX_LATENCY,
+        write_concern_w=MONGO_WRITE_CONCERN,
+        timeseries=MONGO_TIMESERIES,
+        connect_timeout=BACKEND_CONNECT_TIMEOUT
+    )
+    neo4j_manager = Neo4jManager(
+        uri=NEO4J_URI,
+        user=NEO4J_USER,
+        password=NEO4J_PASSWORD,
+        batch_size=NEO4J_BATCH_SIZE,
+        flush_interval=NEO4J_FLUSH_INTERVAL,
+        event_model=NEO4J_EVENT_MODEL,
+        event_bucket=NEO4J_EVENT_BUCKET,
+        connect_timeout=BACKEND_CONNECT_TIMEOUT
+    )
+
+log = get_logger("store")
+
+BACKENDS = ("mysql", "mongo", "neo4j")
+
+replayers = {}
+claims_spool = None
+readiness = Readiness(warn_after=BACKEND_INIT_TIMEOUT)
+retention_job = RetentionJob(
+    RetentionPolicy(RETENTION_DEFAULT_DAYS, RETENTION_DAYS_BY_TYPE, RETENTION_ROLLUP_DAYS),
+    mysql_db_manager,
+    mongo_manager,
+    neo4j_manager,
+    interval=RETENTION_INTERVAL,
+    batch_size=RETENTION_BATCH_SIZE,
+    compact_events=NEO4J_PRUNE_MODE == "compact"
 )
 
-def store_sensor_data(topic,sensor_data):
-    print(f"[STORE] topic={topic}, sensor_data={sensor_data}")
+def _open_spool(name, **codec):
+    return Spool(
+        os.path.join(SPOOL_DIR, name),
+        max_bytes=SPOOL_MAX_BYTES,
+        segment_bytes=SPOOL_SEGMENT_BYTES,
+        fsync=SPOOL_FSYNC,
+        fsync_interval=SPOOL_FSYNC_INTERVAL,
+        **codec
+    )
+
+def start_spools():
+    """
+    Attach a spool to each manager. Replaying whatever a previous run left behind starts once the
+    store it goes to is ready.
+    """
+    global claims_spool
+    # Mongo documents carry ObjectIds once insert_many has run, so use BSON's extended JSON
+    codecs = {"mongo": {"encode": lambda doc: json_util.dumps(doc).encode("utf-8"), "decode": json_util.loads}}
+    mysql_db_manager.spool = _open_spool("mysql")
+    mongo_manager.spool = _open_spool("mongo", **codecs["mongo"])
+    neo4j_manager.spool = _open_spool("neo4j")
+    claims_spool = _open_spool("claims")
+    writers = {
+        "mysql": (mysql_db_manager.spool, mysql_db_manager.write_sensor_rows, mysql_db_manager.is_permanent_error),
+        "mongo": (mongo_manager.spool, mongo_manager.write_documents, mongo_manager.is_permanent_error),
+        "neo4j": (neo4j_manager.spool, neo4j_manager.write_sensor_events, neo4j_manager.is_permanent_error),
+        "claims": (claims_spool, write_claims, is_permanent_claims_error),
+    }
+    for name, (spool, write_batch, is_permanent) in writers.items():
+        # records the store keeps rejecting are set aside in <SPOOL_DIR>/<name>-dead for inspection
+        replayers[name] = SpoolReplayer(name, spool, write_batch, SPOOL_REPLAY_BATCH, max_attempts=SPOOL_MAX_ATTEMPTS,
+                                        dead_letter=_open_spool(f"{name}-dead", **codecs.get(name, {})),
+                                        is_permanent=is_permanent)
+
+def stop_spools():
+    for replayer in replayers.values():
+        replayer.stop()
+        replayer.dead_letter.close()
+    for manager in (mysql_db_manager, mongo_manager, neo4j_manager):
+        if manager.spool is not None:
+            manager.spool.close()
+    if claims_spool is not None:
+        claims_spool.close()
+
+def write_claims(rows):
+    """
+    Write a batch of claim rows to the claims table and as DamageEvents. Both writes are keyed on
+    claim_id, so a batch can be retried as a whole. Raises on failure.
+    """
+    mysql_db_manager.upsert_claims(rows)
+    neo4j_manager.write_damage_events(rows)
+
+def is_permanent_claims_error(error):
+    return mysql_db_manager.is_permanent_error(error) or neo4j_manager.is_permanent_error(error)
+
+def spool_claims(rows):
+    """
+    Keep claim rows that could not be written for replay. Returns False when there is no spool.
+    """
+    if claims_spool is None:
+        return False
+    claims_spool.append(rows)
+    return True
+
+def store_mysql(topic,sensor_data):
+    mysql_db_manager.buffer_sensor_data(topic,sensor_data)
+
+def store_mongo(topic,sensor_data):
+    mongo_manager.buffer_sensor_data(topic,sensor_data)
+
+def store_neo4j(topic,sensor_data):
+    location = location_of(topic)
+    property_id = property_of(location)
+    neo4j_manager.buffer_sensor_event(sensor_data["sensor_id"],sensor_data["type"],location,property_id,
+                                      sensor_data["timestamp"],sensor_data["value"])
+
+def store_sensor_data(topic,sensor_data,destinations=None):
+    """
+    Write a reading to every store, or only to the store names in destinations.
+    """
+    log.debug("topic=%s, sensor_data=%s", topic, sensor_data)
 
     sensor_id = sensor_data.get("sensor_id")
     sensor_type = sensor_data.get("type")
     timestamp = sensor_data.get("timestamp")
     value = sensor_data.get("value")
 
-    topic_parts = topic.split('/')
-    location = topic_parts[1] if len(topic_parts) > 1 else "unknown"
-    property_id = "property_" + location.replace(" ", "_")
     if not all([sensor_id, sensor_type, timestamp is not None, value is not None]):
-        print(f"Skipping database storage due to incomplete data: {sensor_data}")
+        log.warning("Skipping database storage due to incomplete data: %s", sensor_data)
         return
-    mysql_db_manager.insert_sensor_data(topic,sensor_data)
-    mongo_manager.insert_sensor_data(topic,sensor_data)
-    neo4j_manager.create_sensor_node(sensor_id,sensor_type,location,property_id)
-    neo4j_manager.record_sensor_event(sensor_id,timestamp,value)
-
-def init_dbs():
-    print("Initializing databases...")
-    mysql_db_manager.initialize()
-    print("Databases initialized successfully.")
+    for name, store in (("mysql", store_mysql), ("mongo", store_mongo), ("neo4j", store_neo4j)):
+        if destinations is None or name in destinations:
+            store(topic,sensor_data)
+
+def init_dbs(retention=True, wait=False):
+    """
+    Start the stores' background writers and bring the stores up, each on its own thread, so callers
+    can start consuming right away: writes that reach a store before it is ready fail over to its
+    spool, which is replayed once it is. retention starts the periodic retention job once all three
+    stores are ready; with several subscriber processes only one of them should run it.
+    With wait, block until the stores are ready or BACKEND_INIT_TIMEOUT passes.
+    Returns whether all stores are ready.
+    """
+    log.info("Initializing databases...")
+    start_spools()
+    managers = {"mysql": mysql_db_manager, "mongo": mongo_manager, "neo4j": neo4j_manager}
+    for name in BACKENDS:
+        managers[name].start_flusher()
+        readiness.start(name, managers[name].initialize)
+        readiness.on_ready((name,), replayers[name].start)
+    readiness.on_ready(("mysql", "neo4j"), replayers["claims"].start)
+    if retention and RETENTION_INTERVAL > 0 and STORAGE_BACKEND != "memory":
+        readiness.on_ready(BACKENDS, retention_job.start)
+    readiness.on_ready(BACKENDS, lambda: log.info("Databases initialized successfully."))
+    if wait:
+        return readiness.wait(BACKENDS, BACKEND_INIT_TIMEOUT)
+    return readiness.ready()
+
+def collect_backend_metrics():
+    _, backends = readiness.report()
+    for name, state in backends.items():
+        labels = {"backend": name}
+        yield "backend_ready", "gauge", "1 once a store is connected and its schema is in place.", labels, \
+            int(state["state"] == "ready")
+        yield "backend_init_seconds", "gauge", "Seconds a store took to become ready, or has been trying.", labels, \
+            state["seconds"]
+
+metrics.register_collector(collect_backend_metrics)
+
+def warm_live_state(cache, hours, owns_sensor=None):
+    """
+    Load the latest reading per sensor from the last `hours` hours into the live state cache:
+    from MySQL, or from MongoDB when MySQL has none. owns_sensor(location, sensor_id) limits
+    which sensors are loaded. Returns the number of sensors loaded.
+    """
+    since = datetime.datetime.now() - datetime.timedelta(hours=hours)
+    loaded = 0
+    for row in mysql_db_manager.fetch_latest_readings(since):
+        if owns_sensor is not None and not owns_sensor(row["location"], row["sensor_id"]):
+            continue
+        value = row["value"]
+        cache.update(row["location"], row["sensor_id"], row["sensor_type"],
+                     json.loads(value) if isinstance(value, (str, bytes)) else value, row["timestamp"].timestamp())
+        loaded += 1
+    if not loaded:
+        for doc in mongo_manager.fetch_latest_readings(since):
+            location = location_of(doc.get("_mqtt_topic", ""))
+            if owns_sensor is not None and not owns_sensor(location, doc["sensor_id"]):
+                continue
+            timestamp = doc.get("timestamp")
+            cache.update(location, doc["sensor_id"], doc.get("type"), doc.get("value"),
+                         timestamp.timestamp() if isinstance(timestamp, datetime.datetime) else timestamp)
+            loaded += 1
+    log.info("Warmed live state with %d sensors.", loaded)
+    return loaded
+
+def flush_dbs():
+    log.info("Flushing buffered sensor data...")
+    readiness.stop()
+    retention_job.stop()
+    mysql_db_manager.shutdown()
+    mongo_manager.shutdown()
+    neo4j_manager.shutdown()
+    stop_spools()
+    if STORAGE_BACKEND == "memory":
+        dump_stats(MEMORY_STATS_PATH)
 
 
 
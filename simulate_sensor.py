@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
+import os
 import time
 import random
 import datetime
-import json
 
 import paho.mqtt.client as mqtt
 
 from python_app.config import MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_TOPIC_ROOT
+from python_app.Codecs import CODECS
+
+# json | msgpack | cbor; the subscriber must map the topic to the same codec (PAYLOAD_CODEC_RULES)
+codec = CODECS[os.environ.get("SIMULATE_CODEC", "json")]
 
 def publish_sensor_data(sensor_id, sensor_type, value, location):
     client = mqtt.Client(protocol=mqtt.MQTTv311)
@@ -19,8 +23,8 @@ def publish_sensor_data(sensor_id, sensor_type, value, location):
             "value": value,
             "timestamp": datetime.datetime.utcnow().timestamp()
         }
-        client.publish(topic, json.dumps(payload))
-        print(f"[PUBLISH] {topic} → {json.dumps(payload)}")
+        client.publish(topic, codec.encode(payload))
+        print(f"[PUBLISH] {topic} → {payload}")
     except Exception as e:
         print(f"[ERROR] publishing to {topic}: {e}")
     finally:
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the application modules import each other as top-level modules, the way they run from python_app/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python_app"))
+# importing DamageAnalyzer constructs the store managers; the in-memory ones need no databases
+os.environ.setdefault("STORAGE_BACKEND", "memory")
@@ -0,0 +1,89 @@
+import random
+
+import numpy as np
+import pytest
+
+from AnomalyDetector import ANOMALY_RANGE, ANOMALY_RATE, AnomalyDetector, parse_anomaly_rules
+from config import ANOMALY_RULES, ANOMALY_WINDOW, ANOMALY_EWMA_ALPHA, ANOMALY_RATE_SPAN, ANOMALY_MIN_SAMPLES
+
+STATE = ("_ring", "_head", "_fill", "_sum", "_sumsq", "_ewm", "_ewv", "_last_t", "_count")
+
+
+def default_detector(min_samples=ANOMALY_MIN_SAMPLES, **kwargs):
+    return AnomalyDetector(parse_anomaly_rules(ANOMALY_RULES), window=ANOMALY_WINDOW, alpha=ANOMALY_EWMA_ALPHA,
+                           rate_span=ANOMALY_RATE_SPAN, min_samples=min_samples, **kwargs)
+
+
+def random_stream(n, seed):
+    """
+    Readings of a few hundred sensors with noise, drifts, spikes, repeats within a batch, non-numeric values
+    and types without a rule.
+    """
+    rng = random.Random(seed)
+    sensors = [(f"s{i}", rng.choice(["temperature", "humidity", "water_flow", "door_contact"])) for i in range(300)]
+    t = 1718000000.0
+    stream = []
+    for _ in range(n):
+        sensor_id, sensor_type = rng.choice(sensors[:rng.choice([5, 300])])
+        t += rng.expovariate(50.0)
+        if sensor_type == "door_contact":
+            value = rng.random() < 0.1
+        elif rng.random() < 0.02:
+            value = rng.uniform(-50, 150)
+        else:
+            value = rng.gauss(22.0, 2.0) + (t - 1718000000.0) * 0.01
+            if rng.random() < 0.1:
+                value = int(value)
+        stream.append((sensor_id, sensor_type, value, t))
+    return stream
+
+
+@pytest.mark.parametrize("seed, min_samples", [(1, ANOMALY_MIN_SAMPLES), (2, ANOMALY_MIN_SAMPLES), (3, 0), (4, 1),
+                                               (5, 2)])
+def test_batch_matches_scalar(seed, min_samples):
+    stream = random_stream(20000, seed)
+    scalar = default_detector(max_sensors=200, initial_capacity=16, min_samples=min_samples)
+    batched = default_detector(max_sensors=200, initial_capacity=16, min_samples=min_samples)
+    expected = [scalar.observe(*reading) for reading in stream]
+
+    rng = random.Random(seed)
+    flags = []
+    i = 0
+    while i < len(stream):
+        batch = stream[i:i + rng.randint(1, 500)]
+        flags.extend(batched.observe_batch(*zip(*batch)).tolist())
+        i += len(batch)
+
+    assert flags == expected
+    assert any(expected)
+    assert scalar.evicted == batched.evicted > 0
+    assert scalar._slots == batched._slots
+    for name in STATE:
+        np.testing.assert_allclose(getattr(batched, name), getattr(scalar, name), rtol=1e-9, atol=1e-9, err_msg=name)
+
+
+def test_normal_fluctuations_are_not_flagged():
+    # simulate_sensor.py's bedroom fluctuations and the load generator's normal ranges
+    rng = random.Random(7)
+    detector = default_detector()
+    t = 1718000000.0
+    flagged = []
+    for _ in range(2000):
+        t += rng.uniform(0.5, 1.5)
+        reading = rng.choice([
+            (f"temp_bedroom_00{rng.randint(1, 2)}", "temperature", round(rng.uniform(18.0, 26.0), 1)),
+            (f"humidity_bedroom_00{rng.randint(1, 2)}", "humidity", round(rng.uniform(35.0, 70.0), 1)),
+        ])
+        if detector.observe(*reading, t):
+            flagged.append(reading)
+    assert flagged == []
+
+
+def test_simulated_incidents_are_flagged():
+    # the temperature readings of simulate_sensor.py's scenario
+    detector = default_detector()
+    t = 1718000000.0
+    assert detector.observe("temp_kitchen_001", "temperature", 22.5, t) == 0
+    assert detector.observe("temp_kitchen_001", "temperature", 35.0, t + 6) & ANOMALY_RATE
+    assert detector.observe("temp_kitchen_001", "temperature", 45.0, t + 7) & ANOMALY_RATE
+    assert detector.observe("temp_hall_001", "temperature", 105.0, t + 12) & ANOMALY_RANGE
@@ -0,0 +1,71 @@
+import asyncio
+
+import AsyncManagers
+
+
+class FakeManager:
+    host = user = password = database = None
+    rollups = False
+
+    def __init__(self):
+        self.spooled = []
+
+    def _sensor_row(self, topic, sensor_data):
+        return (topic, sensor_data)
+
+    def _sensor_insert_sql(self):
+        return "INSERT"
+
+    def _spool_rows(self, rows):
+        self.spooled.extend(rows)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def executemany(self, sql, rows):
+        # yield so the other writers queue up for a connection meanwhile
+        await asyncio.sleep(0.01)
+        if self.conn.fail:
+            raise RuntimeError("write failed")
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, fail):
+        self.fail = fail
+        self.closed = False
+
+    async def cursor(self):
+        return FakeCursor(self)
+
+    async def commit(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+def test_broken_connections_free_their_slot(monkeypatch):
+    opened = []
+
+    async def connect(**kwargs):
+        # the first connections break, the ones opened to replace them work
+        opened.append(FakeConnection(fail=len(opened) < 4))
+        return opened[-1]
+
+    monkeypatch.setattr(AsyncManagers, "mysql_connect", connect)
+    manager = FakeManager()
+    pool = AsyncManagers.AsyncMySQLManager(manager, pool_size=2)
+
+    async def run():
+        await asyncio.wait_for(asyncio.gather(*(pool.write([(f"t{i}", {})]) for i in range(20))), timeout=5)
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(manager.spooled) == 4
+    assert all(conn.closed for conn in opened)
+    assert len(opened) <= 2 + 4
@@ -0,0 +1,22 @@
+from Codecs import CODECS, CodecRegistry
+
+
+def test_topic_cache_is_bounded():
+    registry = CodecRegistry([("home/+/+/msgpack", "msgpack"), ("home/#", "cbor")], max_cached=100)
+    for i in range(1000):
+        assert registry.select(f"home/loc{i}/sensor{i}/msgpack") is CODECS["msgpack"]
+        assert registry.select(f"home/loc{i}/sensor{i}/sensor") is CODECS["cbor"]
+        assert registry.select(f"other/sensor{i}") is CODECS["json"]
+        assert len(registry._topic_cache) <= 100
+
+
+def test_content_type_wins_over_topic_rules():
+    registry = CodecRegistry([("home/#", "cbor")])
+    assert registry.select("home/kitchen/temp_001/sensor", "application/json; charset=utf-8") is CODECS["json"]
+
+
+def test_rules_naming_a_missing_codec_are_skipped_with_a_warning(caplog):
+    with caplog.at_level("WARNING"):
+        registry = CodecRegistry([("home/+/+/raw", "protobuf"), ("home/#", "json")])
+    assert registry.topic_rules == [("home/#", CODECS["json"])]
+    assert "home/+/+/raw=protobuf" in caplog.text
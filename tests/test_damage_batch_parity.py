@@ -0,0 +1,131 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+import DamageAnalyzer
+from AnomalyDetector import AnomalyDetector
+from IncidentCache import IncidentCache
+from SensorState import SensorStateEngine
+
+
+class RecordingClaimWorker:
+    def __init__(self):
+        self.rows = []
+
+    def submit(self, row):
+        self.rows.append(dict(row))
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    """
+    DamageAnalyzer with fresh state and a claim worker that records the rows queued on it.
+    """
+    def reset():
+        monkeypatch.setattr(DamageAnalyzer, "sensor_state", SensorStateEngine(temperature_window=1800))
+        monkeypatch.setattr(DamageAnalyzer, "incidents", IncidentCache(quiet_period=300, max_entries=20))
+        monkeypatch.setattr(DamageAnalyzer, "anomaly_detector", AnomalyDetector({}))
+        worker = RecordingClaimWorker()
+        monkeypatch.setattr(DamageAnalyzer, "claim_worker", worker)
+        return worker
+    return reset
+
+
+def random_stream(n, seed):
+    """
+    Readings of every analyzed sensor type over a handful of locations, with quiet gaps long enough to
+    close incidents, late readings and incomplete ones.
+    """
+    rng = random.Random(seed)
+    values = {
+        "water_leak": lambda: rng.random() < 0.5,
+        "smoke_detector": lambda: rng.random() < 0.3,
+        "structural_stress": lambda: {"level": rng.choice(["low", "medium", "high", "unknown"]),
+                                      "vibration_hz": round(rng.uniform(0.5, 9.0), 1)},
+        "water_flow": lambda: round(rng.uniform(0.0, 20.0), 1),
+        "smoke_density": lambda: round(rng.uniform(0.0, 1.0), 2),
+        "temperature": lambda: round(rng.uniform(15.0, 120.0), 1),
+        "door_contact": lambda: rng.random() < 0.1,
+    }
+    sensors = [(f"loc{rng.randrange(8)}", f"{sensor_type}_{i:03d}", sensor_type)
+               for i, sensor_type in enumerate(rng.choice(list(values)) for _ in range(60))]
+    t = 1718000000.0
+    topics, readings = [], []
+    for _ in range(n):
+        location, sensor_id, sensor_type = rng.choice(sensors)
+        t += rng.expovariate(1.0) if rng.random() > 0.002 else rng.uniform(300, 3600)
+        reading = {"sensor_id": sensor_id, "type": sensor_type, "value": values[sensor_type](),
+                   "timestamp": t - rng.uniform(0, 600) if rng.random() < 0.02 else t}
+        if rng.random() < 0.01:
+            del reading[rng.choice(["sensor_id", "type", "value", "timestamp"])]
+        topics.append(f"home/{location}/{sensor_id}/sensor")
+        readings.append(reading)
+    return topics, readings
+
+
+def comparable(rows):
+    """
+    Claim rows with claim ids replaced by their order of appearance and the wall-clock filing time of new
+    claims dropped, the only two things that differ between runs.
+    """
+    ids = {}
+    result = []
+    for row in rows:
+        row = dict(row, claim_id=ids.setdefault(row["claim_id"], len(ids)))
+        if row["reading_at"] is not None:
+            del row["timestamp_filed"]
+        result.append(row)
+    return result
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_batch_claims_match_scalar(analyzer, seed):
+    topics, readings = random_stream(6000, seed)
+
+    worker = analyzer()
+    for topic, reading in zip(topics, readings):
+        DamageAnalyzer.analyze_sensor_data_and_trigger_claim(topic, reading)
+    scalar = comparable(worker.rows)
+
+    worker = analyzer()
+    rng = random.Random(seed)
+    i = 0
+    while i < len(readings):
+        size = rng.randint(1, 400)
+        DamageAnalyzer.analyze_sensor_batch_and_trigger_claims(topics[i:i + size], readings[i:i + size])
+        i += size
+    batched = comparable(worker.rows)
+
+    assert batched == scalar
+    statuses = {(row["incident_status"], row["reading_at"] is not None) for row in scalar}
+    # new claims, updates and closes all occur
+    assert statuses == {("open", True), ("open", False), ("closed", False)}
+
+
+def test_cost_batch_matches_scalar_grid():
+    damage_types = ["water_leak", "fire", "structural_stress", "something_else"]
+    durations = [0.0, 59.9, 60.0, 60.1, 120.0]
+    flow_rates = [0.0, 9.9, 10.0, 10.1]
+    smoke_densities = [0.0, 0.79, 0.8, 0.81, 1.0]
+    temp_peaks = [0.0, 99.9, 100.0, 100.1]
+    levels = [None, "low", "medium", "high"]
+    grid = list(itertools.product(damage_types, durations, flow_rates, smoke_densities, temp_peaks, levels))
+
+    damage_codes = np.array([DamageAnalyzer.DAMAGE_TYPE_CODES.get(row[0], DamageAnalyzer.DAMAGE_UNKNOWN)
+                             for row in grid], dtype=np.int8)
+    columns = [np.array([row[k] for row in grid], dtype=np.float64) for k in range(1, 5)]
+    level_codes = np.array([DamageAnalyzer.LEVEL_CODES.get(row[5], DamageAnalyzer.LEVEL_NONE) for row in grid],
+                           dtype=np.int8)
+    costs, outcomes = DamageAnalyzer.estimate_damage_cost_batch(damage_codes, *columns, level_codes)
+
+    for row, cost, outcome in zip(grid, costs.tolist(), outcomes.tolist()):
+        damage_type, duration, flow_rate, smoke_density, temp_peak, level = row
+        if damage_type == "structural_stress":
+            indicators = {"level": level}
+        else:
+            indicators = {"duration_minutes": duration, "flow_rate": flow_rate, "smoke_density": smoke_density,
+                          "temp_peak": temp_peak}
+        expected_cost, expected_details = DamageAnalyzer.estimate_damage_cost(damage_type, indicators)
+        assert (cost, DamageAnalyzer.DAMAGE_OUTCOMES[outcome][1]) == (expected_cost, expected_details), row
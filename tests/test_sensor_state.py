@@ -0,0 +1,40 @@
+import json
+
+from SensorState import SensorStateEngine
+
+
+def test_flow_rate_and_smoke_density_age_out_of_the_window():
+    state = SensorStateEngine(temperature_window=60)
+    state.update("kitchen", "flow-1", "water_flow", 12.5, 1000)
+    state.update("kitchen", "smoke-1", "smoke_density", 0.9, 1000)
+    assert state.update("kitchen", "leak-1", "water_leak", True, 1060)[1:3] == (12.5, 0.9)
+    assert state.update("kitchen", "leak-1", "water_leak", True, 1061)[1:3] == (0.0, 0.0)
+    state.update("kitchen", "flow-1", "water_flow", 3.0, 1100)
+    assert state.update("kitchen", "leak-1", "water_leak", True, 1101)[1:3] == (3.0, 0.0)
+
+
+def test_snapshot_round_trips_and_restores_old_snapshots(tmp_path):
+    state = SensorStateEngine(temperature_window=60)
+    state.update("kitchen", "flow-1", "water_flow", 12.5, 1000)
+    path = str(tmp_path / "state.json")
+    assert state.snapshot(path)
+    restored = SensorStateEngine(temperature_window=60)
+    assert restored.restore(path)
+    assert restored.update("kitchen", "leak-1", "water_leak", True, 1030)[1] == 12.5
+
+    with open(path) as f:
+        snapshot = json.load(f)
+    snapshot["locations"] = {name: values[:4] for name, values in snapshot["locations"].items()}
+    with open(path, "w") as f:
+        json.dump(snapshot, f)
+    old = SensorStateEngine(temperature_window=60)
+    assert old.restore(path)
+    assert old.update("kitchen", "leak-1", "water_leak", True, 1030)[1] == 0.0
+
+
+def test_snapshot_logs_instead_of_raising_when_it_cannot_write(tmp_path):
+    state = SensorStateEngine()
+    state.update("kitchen", "temp-1", "temperature", 21.0, 1000)
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    assert not state.snapshot(str(blocker / "state.json"))
@@ -0,0 +1,136 @@
+import os
+import time
+
+from Pipeline import OVERFLOW_SPILL, Stage
+from Spool import FSYNC_NEVER, Spool, SpoolReplayer
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def on_disk(spool):
+    return {int(name[:-4]): os.path.getsize(os.path.join(spool.directory, name))
+            for name in os.listdir(spool.directory) if name.endswith(".seg")}
+
+
+def test_segment_sizes_follow_appends_commits_and_the_cap(tmp_path):
+    spool = Spool(str(tmp_path / "spool"), max_bytes=4000, segment_bytes=500, fsync=FSYNC_NEVER)
+    for i in range(100):
+        spool.append([{"i": i, "padding": "x" * 20}])
+        assert spool._sizes == on_disk(spool)
+        assert spool._total_bytes == sum(spool._sizes.values()) <= 4000 + 500
+    assert spool.dropped_segments > 0
+    records, position = spool.read_batch(10)
+    spool.commit(position)
+    assert spool._sizes == on_disk(spool)
+    spool.close()
+
+    reopened = Spool(str(tmp_path / "spool"), max_bytes=4000, segment_bytes=500, fsync=FSYNC_NEVER)
+    assert reopened._sizes == on_disk(reopened)
+    assert reopened.read_batch(1)[0][0]["i"] == records[-1]["i"] + 1
+    reopened.close()
+
+
+def test_replayer_sets_aside_a_record_the_store_keeps_rejecting(tmp_path):
+    spool = Spool(str(tmp_path / "spool"), fsync=FSYNC_NEVER)
+    dead = Spool(str(tmp_path / "dead"), fsync=FSYNC_NEVER)
+    spool.append([{"i": i} for i in range(40)])
+    written = []
+
+    def write_batch(records):
+        if any(record["i"] == 13 for record in records):
+            raise ValueError("rejected")
+        written.extend(record["i"] for record in records)
+
+    replayer = SpoolReplayer("test", spool, write_batch, batch_size=16, idle_interval=0.001, max_backoff=0.001,
+                             max_attempts=3, dead_letter=dead, is_permanent=lambda e: isinstance(e, ValueError))
+    replayer.start()
+    try:
+        wait_for(lambda: not spool.has_pending())
+    finally:
+        replayer.stop()
+    assert written == [i for i in range(40) if i != 13]
+    assert replayer.replayed == 39
+    assert replayer.dead_lettered == 1
+    assert dead.read_batch(10)[0] == [{"i": 13}]
+    spool.close()
+    dead.close()
+
+
+def test_replayer_dead_letters_nothing_during_an_outage(tmp_path):
+    spool = Spool(str(tmp_path / "spool"), fsync=FSYNC_NEVER)
+    dead = Spool(str(tmp_path / "dead"), fsync=FSYNC_NEVER)
+    spool.append([{"i": i} for i in range(64)])
+    outage_until = time.monotonic() + 0.5
+    failures = []
+    written = []
+
+    def write_batch(records):
+        if time.monotonic() < outage_until:
+            failures.append(len(records))
+            raise ConnectionError("store down")
+        written.extend(record["i"] for record in records)
+
+    replayer = SpoolReplayer("test", spool, write_batch, batch_size=16, idle_interval=0.001, max_backoff=0.01,
+                             max_attempts=3, dead_letter=dead, is_permanent=lambda e: isinstance(e, ValueError))
+    replayer.start()
+    try:
+        wait_for(lambda: not spool.has_pending())
+    finally:
+        replayer.stop()
+    assert len(failures) > 3 and set(failures) == {16}
+    assert written == list(range(64))
+    assert replayer.dead_lettered == 0
+    assert not dead.has_pending()
+    spool.close()
+    dead.close()
+
+
+def test_replayer_keeps_retrying_without_a_dead_letter_spool(tmp_path):
+    spool = Spool(str(tmp_path / "spool"), fsync=FSYNC_NEVER)
+    spool.append([{"i": 0}])
+    attempts = []
+
+    def write_batch(records):
+        attempts.append(len(records))
+        raise ConnectionError("store down")
+
+    replayer = SpoolReplayer("test", spool, write_batch, idle_interval=0.001, max_backoff=0.001, max_attempts=3)
+    replayer.start()
+    try:
+        wait_for(lambda: len(attempts) >= 10)
+    finally:
+        replayer.stop()
+    assert spool.has_pending()
+    spool.close()
+
+
+def test_reloaded_spill_stays_ahead_of_later_spills(tmp_path):
+    stage = Stage("test", lambda topic, sensor_data: None, max_size=4, overflow=OVERFLOW_SPILL,
+                  spill_dir=str(tmp_path))
+    for i in range(10):
+        stage._spill("t", {"i": i})
+    read_batch = stage._spool.read_batch
+
+    def read_batch_while_producing(max_records):
+        result = read_batch(max_records)
+        # a producer takes most of the room before the reload gets to it, then spills once the queue is full
+        for i in range(100, 103):
+            stage._queue.put_nowait((0.0, "t", {"i": i}))
+        stage._spill("t", {"i": 103})
+        stage._spool.read_batch = read_batch
+        return result
+
+    stage._spool.read_batch = read_batch_while_producing
+    assert stage._reload_spill() == 1
+    seen = []
+    while not stage._queue.empty() or stage._spool.has_pending():
+        while not stage._queue.empty():
+            seen.append(stage._queue.get_nowait()[2]["i"])
+        stage._reload_spill()
+    assert seen == [100, 101, 102] + list(range(10)) + [103]
+    stage._spool.close()